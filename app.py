@@ -3,17 +3,42 @@
 #----------------------------------------------------------------------------#
 
 import json
+try:
+  import orjson
+except ImportError:
+  orjson = None
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort
+from flask import Flask, Blueprint, render_template, stream_template, stream_with_context, request, Response, flash, redirect, url_for, abort, jsonify
 from flask_moment import Moment # Formatting of dates and times in Flask templates 
 from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
-from sqlalchemy.orm import backref
+from sqlalchemy.orm import backref, attributes, joinedload
+from sqlalchemy.dialects.postgresql import TSVECTOR, aggregate_order_by
 from forms import *
 from flask_migrate import Migrate
+import io
 import sys
+import math
+import click
+from search import Search, tokenize
+import geo
+import ical
+from suggest import PrefixIndex
+from cache import ResponseCache, conditional
+from database import configure_database, init_database, read_only, RoutingSQLAlchemy
+from instrument import QueryInstrument
+from metrics import Metrics
+from bulk import read_records, batches, FormValidator, insert_rows, upsert_rows, reserve_ids, ImportReport
+from bulk import WRITERS, JSONLWriter, stream_rows, ExportReport
+from datetime import date, datetime, timedelta, timezone
+from hashlib import sha1
+from itertools import groupby
+from bisect import bisect_left, insort
+from sqlalchemy import func, case, and_, or_, event, select, update, literal_column, literal, union_all, DDL, delete, tuple_, type_coerce
+from sqlalchemy.exc import IntegrityError
+from base64 import urlsafe_b64encode, urlsafe_b64decode
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -21,35 +46,104 @@ import sys
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+configure_database(app)
+db = RoutingSQLAlchemy(app)
+init_database(app, db)
 migrate = Migrate(app, db)
+search = Search(db)
+cache = ResponseCache(app)
+instrument = QueryInstrument(app)
+metrics = Metrics(app)
+metrics.watch_database(db, app)
+metrics.watch_cache(cache)
+instrument.listeners.append(metrics.observe_query)
+suggestions = PrefixIndex(app.config['SUGGEST_CACHE_SIZE'], app.config['SUGGEST_MAX_AGE'])
 
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+class Genre(db.Model):
+    __tablename__ = 'genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    def __repr__(self):
+      return f'<Genre id: {self.id}, name: {self.name}>'
+
+# genres of venues and artists; the (genre_id, ..) index answers the ?genre= filters
+venue_genre = db.Table('venue_genre',
+    db.Column('venue_id', db.Integer, db.ForeignKey('venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'), primary_key=True),
+    db.Index('ix_venue_genre_genre_id_venue_id', 'genre_id', 'venue_id'))
+
+artist_genre = db.Table('artist_genre',
+    db.Column('artist_id', db.Integer, db.ForeignKey('artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'), primary_key=True),
+    db.Index('ix_artist_genre_genre_id_artist_id', 'genre_id', 'artist_id'))
+
+
 class Venue(db.Model):
     __tablename__ = 'venue'
+    __table_args__ = (
+        db.Index('ix_venue_city_state', 'city', 'state'),
+        db.Index('ix_venue_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_venue_search_vector', 'search_vector', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
-    city = db.Column(db.String(120), nullable=False)
-    state = db.Column(db.String(120), nullable=False)
+    # the area a venue moves out of is loaded before it changes, for summarise_flushed_areas()
+    city = db.column_property(db.Column(db.String(120), nullable=False), active_history=True)
+    state = db.column_property(db.Column(db.String(120), nullable=False), active_history=True)
     address = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120), nullable=False)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120), nullable=False)
 
     # database migration
-    genres = db.Column(db.String(120), nullable=False)
     website = db.Column(db.String(252))
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(252))
+
+    # full-text search document, maintained by search.index()
+    search_vector = db.deferred(db.Column(db.Text().with_variant(TSVECTOR(), 'postgresql')))
+
+    # position in degrees, the city centroid unless given, maintained by locate_venue();
+    # the nearby pages scan geohash prefixes, compared bytewise on every database
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12).with_variant(db.String(12, collation='C'), 'postgresql'), index=True)
+
+    # show counters, maintained by refresh_show_counts()
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # last change in UTC, validates conditional requests
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, server_default=func.now(), index=True)
     
     # relate to Show Table with id
     shows = db.relationship('Show', backref='venue', lazy=True)
 
+    # relate to Genre Table through venue_genre, see genres
+    genre_rows = db.relationship('Genre', secondary=venue_genre, order_by=Genre.name, lazy=True)
+
+    @property
+    def genres(self):
+      return [genre.name for genre in self.genre_rows]
+
+    @genres.setter
+    def genres(self, names):
+      # one flush for the whole edit, not one per genre lookup
+      with db.session.no_autoflush:
+        self.genre_rows = genres_named(names)
+      # the row itself may not change, its pages do
+      self.updated_at = datetime.utcnow()
+
     def __repr__(self):
       return f'<Venue id: {self.id}, name: {self.name}, city: {self.city} \
                       state: {self.state}, address: {self.address}, phone: {self.phone},\
@@ -60,13 +154,17 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'artist'
+    __table_args__ = (
+        db.Index('ix_artist_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_artist_search_vector', 'search_vector', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120), nullable=False)
-    genres = db.Column(db.String(120), nullable=False)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120), nullable=False, default=False)
 
@@ -75,25 +173,335 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(252), nullable=True)
 
+    # full-text search document, maintained by search.index()
+    search_vector = db.deferred(db.Column(db.Text().with_variant(TSVECTOR(), 'postgresql')))
+
+    # show counters, maintained by refresh_show_counts()
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # last change in UTC, validates conditional requests
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, server_default=func.now(), index=True)
+
     # relate to Show Table with id
     shows = db.relationship('Show', backref='artist', lazy=True)
 
+    # relate to Genre Table through artist_genre, see genres
+    genre_rows = db.relationship('Genre', secondary=artist_genre, order_by=Genre.name, lazy=True)
+
+    @property
+    def genres(self):
+      return [genre.name for genre in self.genre_rows]
+
+    @genres.setter
+    def genres(self, names):
+      with db.session.no_autoflush:
+        self.genre_rows = genres_named(names)
+      self.updated_at = datetime.utcnow()
+
     def __repr__(self):
       return f'<Artist id: {self.id}, name: {self.name}, city: {self.city} \
                   state: {self.state}, phone: {self.phone},image_link: {self.image_link},\
                   facebook_link: {self.facebook_link},genres: {self.genres}, website: {self.website},\
                   seeking_venue: {self.seeking_venue},seeking_description: {self.seeking_description}>'
 
+def default_end_time(context):
+  return show_end_time(context.get_current_parameters()['start_time'])
+
 class Show(db.Model):
     __tablename__ = 'show'
+    __table_args__ = (
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_show_start_time', 'start_time'),
+        db.CheckConstraint('end_time > start_time', name='ck_show_end_time'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     start_time = db.Column(db.DateTime, nullable=False)
+    # shows of one venue or artist may not overlap, see show_conflicts()
+    end_time = db.Column(db.DateTime, nullable=False, default=default_end_time)
     artist_id = db.Column(db.Integer, db.ForeignKey('artist.id'), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), nullable=False)
 
+    # last change in UTC, validates conditional requests
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, server_default=func.now(), index=True)
+
     def __repr__(self):
       return f'<Show id: {self.id}, start_time: {self.start_time},\
               artist_id: {self.artist_id}, venue_id: {self.venue_id}>'
+
+# PostgreSQL refuses overlapping shows itself, also those of concurrent requests.
+# The id of the venue or artist is matched as a one value range, so that GiST
+# needs no extension (btree_gist) for it
+for key in ('venue', 'artist'):
+  event.listen(Show.__table__, 'after_create', DDL(
+    "ALTER TABLE show ADD CONSTRAINT ex_show_{0}_overlap EXCLUDE USING gist "
+    "(int4range({0}_id, {0}_id, '[]') WITH &&, tsrange(start_time, end_time) WITH &&)".format(key)
+  ).execute_if(dialect='postgresql'))
+
+class VenueAreaSummary(db.Model):
+    __tablename__ = 'venue_area_summary'
+
+    # the /venues directory, one row per city, maintained by refresh_area_summaries();
+    # the primary key is in the order the directory lists the areas
+    state = db.Column(db.String(120), primary_key=True)
+    city = db.Column(db.String(120), primary_key=True)
+    venue_count = db.Column(db.Integer, nullable=False)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False)
+    # id, name and num_upcoming_shows of the VENUE_AREA_TOP venues with the most upcoming shows
+    top_venues = db.Column(db.JSON, nullable=False)
+
+    # last refresh in UTC
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, server_default=func.now())
+
+    def __repr__(self):
+      return f'<VenueAreaSummary city: {self.city}, state: {self.state}, venues: {self.venue_count},\
+              upcoming_shows: {self.upcoming_shows_count}>'
+
+GENRE_LINKS = {Venue: venue_genre, Artist: artist_genre}
+
+#----------------------------------------------------------------------------#
+# Model Events.
+#----------------------------------------------------------------------------#
+
+def venue_position(city, state, latitude=None, longitude=None):
+  """
+    position columns of a venue
+    Parameters:
+        city, state (String) : located from the bundled city centroids
+        latitude, longitude (Float) : optional, known coordinates taking precedence
+    Returns:
+        columns (Dict) : latitude, longitude and geohash, all None for an unknown city
+  """
+  if latitude is None or longitude is None:
+    latitude, longitude = geo.centroids.locate(city, state) or (None, None)
+  return {
+    "latitude": latitude,
+    "longitude": longitude,
+    "geohash": geo.encode(latitude, longitude) if latitude is not None else None
+  }
+
+@event.listens_for(db.session, 'before_flush')
+def locate_venues(session, flush_context, instances):
+  """
+    place new venues and venues moved to another city at the city centroid,
+    unless their coordinates were set too, and keep the geohash in step
+  """
+  changed = lambda venue, *keys: any(attributes.get_history(venue, key).has_changes() for key in keys)
+  for venue in session.new | session.dirty:
+    if not isinstance(venue, Venue) or not changed(venue, 'city', 'state', 'latitude', 'longitude'):
+      continue
+    if changed(venue, 'latitude', 'longitude'):
+      position = venue_position(venue.city, venue.state, venue.latitude, venue.longitude)
+    else:
+      position = venue_position(venue.city, venue.state)
+    for key, value in position.items():
+      if getattr(venue, key) != value:
+        setattr(venue, key, value)
+
+@event.listens_for(db.session, 'after_flush')
+def index_search_documents(session, flush_context):
+  """
+    keep venue and artist search documents in step with every flush
+  """
+  for model in (Venue, Artist):
+    changed = [obj.id for obj in session.new | session.dirty if isinstance(obj, model)]
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, model)]
+    search.index(session, model.__tablename__, changed)
+    search.remove(session, model.__tablename__, deleted)
+
+def refresh_show_counts(session, venue_ids=None, artist_ids=None, now=None):
+  """
+    recount the upcoming and past shows of venues and artists
+    Parameters:
+        session (Object) : session to run the updates in
+        venue_ids (Iterable) : venues to recount, None for every venue
+        artist_ids (Iterable) : artists to recount, None for every artist
+        now (datetime) : the moment separating past and upcoming shows
+  """
+  now = now or datetime.now()
+  for model, ids in ((Venue, venue_ids), (Artist, artist_ids)):
+    if ids is not None and not ids:
+      continue
+    show_key = getattr(Show, model.__tablename__ + '_id')
+    count = lambda condition: select(func.count(Show.id))\
+                                .where(show_key == model.id, condition)\
+                                .scalar_subquery()
+    statement = update(model.__table__).values(
+      upcoming_shows_count=count(upcoming(now)),
+      past_shows_count=count(~upcoming(now)))
+    if ids is not None:
+      statement = statement.where(model.id.in_(list(ids)))
+    session.execute(statement)
+
+@event.listens_for(db.session, 'after_flush')
+def count_flushed_shows(session, flush_context):
+  """
+    recount the venues and artists whose shows were added, moved or deleted
+  """
+  venue_ids, artist_ids = set(), set()
+  for show in session.new | session.dirty | session.deleted:
+    if isinstance(show, Show):
+      for key, ids in (('venue_id', venue_ids), ('artist_id', artist_ids)):
+        history = attributes.get_history(show, key)
+        ids.update(id for id in history.sum() if id is not None)
+  if venue_ids or artist_ids:
+    refresh_show_counts(session, venue_ids, artist_ids)
+
+def refresh_area_summaries(session, areas=None, venue_ids=None):
+  """
+    rebuild the venue_area_summary rows of some areas from their venues
+    Parameters:
+        session (Object) : session to run the statements in
+        areas (Iterable) : (state, city) tuples to refresh, None with no venue_ids for every area
+        venue_ids (Iterable) : venues whose areas to refresh too
+  """
+  every_area = areas is None and not venue_ids
+  areas, venue_ids = set(areas or ()), set(venue_ids or ())
+  area_key = tuple_(Venue.state, Venue.city)
+  query = select(Venue.id, Venue.name, Venue.city, Venue.state, Venue.upcoming_shows_count)
+  if not every_area:
+    if not areas and not venue_ids:
+      return
+    conditions = []
+    if areas:
+      conditions.append(area_key.in_(list(areas)))
+    if venue_ids:
+      conditions.append(area_key.in_(select(Venue.state, Venue.city).where(Venue.id.in_(list(venue_ids)))))
+    query = query.where(or_(*conditions))
+  # the venues of an area adjacent, those with the most upcoming shows first
+  rows = session.execute(query.order_by(Venue.state, Venue.city, Venue.upcoming_shows_count.desc(),
+                                        Venue.name, Venue.id))
+  top = app.config['VENUE_AREA_TOP']
+  now = datetime.utcnow()
+  for summaries in batches(area_summaries(rows, top, now), 1000):
+    upsert_rows(session, VenueAreaSummary.__table__, summaries, ['state', 'city'])
+
+  # areas left without venues, only those given can be
+  if not every_area and not areas:
+    return
+  summary = VenueAreaSummary.__table__.c
+  statement = delete(VenueAreaSummary.__table__).where(~select(Venue.id).where(
+    Venue.state == summary.state, Venue.city == summary.city).exists())
+  if not every_area:
+    statement = statement.where(tuple_(summary.state, summary.city).in_(list(areas)))
+  session.execute(statement)
+
+def area_summaries(rows, top, now):
+  """
+    venue_area_summary rows of venue rows
+    Parameters:
+        rows (Iterable) : venue rows ordered by state, city and most upcoming shows
+        top (Integer) : venues listed per area
+        now (datetime) : the refresh time, naive UTC
+    Returns:
+        summaries (Generator) : dicts of the table columns, an area at a time
+  """
+  for (state, city), venues_group in groupby(rows, key=lambda row: (row.state, row.city)):
+    venues = list(venues_group)
+    yield {
+      "state": state,
+      "city": city,
+      "venue_count": len(venues),
+      "upcoming_shows_count": sum(venue.upcoming_shows_count for venue in venues),
+      "top_venues": [{
+        "id": venue.id,
+        "name": venue.name,
+        "num_upcoming_shows": venue.upcoming_shows_count
+      } for venue in venues[:top]],
+      "updated_at": now
+    }
+
+@event.listens_for(db.session, 'after_flush')
+def summarise_flushed_areas(session, flush_context):
+  """
+    refresh the area summaries of the venues added, moved, renamed or deleted,
+    and of those whose shows changed, once count_flushed_shows has recounted them
+  """
+  areas, venue_ids = set(), set()
+  for obj in session.new | session.dirty | session.deleted:
+    if isinstance(obj, Venue):
+      state, city = attributes.get_history(obj, 'state'), attributes.get_history(obj, 'city')
+      if obj in session.dirty and not (state.has_changes() or city.has_changes() or
+                                       attributes.get_history(obj, 'name').has_changes()):
+        continue
+      # the area the venue is in now, and the one it was in
+      areas.add((obj.state, obj.city))
+      areas.add(((state.deleted or [obj.state])[0], (city.deleted or [obj.city])[0]))
+    elif isinstance(obj, Show):
+      venue_ids.update(id for id in attributes.get_history(obj, 'venue_id').sum() if id is not None)
+  if areas or venue_ids:
+    refresh_area_summaries(session, areas, venue_ids)
+
+@event.listens_for(db.session, 'after_flush')
+def collect_cache_invalidations(session, flush_context):
+  """
+    work out which cached pages this transaction makes stale
+  """
+  namespaces = session.info.setdefault('cache_invalidations', set())
+  venue_ids, artist_ids = set(), set()
+  for obj in session.new | session.dirty | session.deleted:
+    if isinstance(obj, Venue):
+      venue_ids.add(obj.id)
+    elif isinstance(obj, Artist):
+      artist_ids.add(obj.id)
+    elif isinstance(obj, Show):
+      namespaces.update(['shows', 'venues'])
+      for key, prefix in (('venue_id', 'venue:'), ('artist_id', 'artist:')):
+        namespaces.update(prefix + str(id) for id in attributes.get_history(obj, key).sum() if id is not None)
+
+  if venue_ids:
+    namespaces.update(['venues', 'shows'])
+    namespaces.update('venue:' + str(id) for id in venue_ids)
+    # artist pages list the venues they play at
+    namespaces.update('artist:' + str(row.artist_id) for row in
+                      session.query(Show.artist_id).filter(Show.venue_id.in_(venue_ids)).distinct())
+  if artist_ids:
+    namespaces.update(['artists', 'shows'])
+    namespaces.update('artist:' + str(id) for id in artist_ids)
+    # venue pages list the artists playing there
+    namespaces.update('venue:' + str(row.venue_id) for row in
+                      session.query(Show.venue_id).filter(Show.artist_id.in_(artist_ids)).distinct())
+
+@event.listens_for(db.session, 'after_commit')
+def apply_cache_invalidations(session):
+  cache.invalidate(*session.info.pop('cache_invalidations', ()))
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_cache_invalidations(session):
+  session.info.pop('cache_invalidations', None)
+
+@event.listens_for(db.session, 'after_flush')
+def collect_suggestion_changes(session, flush_context):
+  """
+    remember venue and artist names written by this transaction
+  """
+  changes = session.info.setdefault('suggestion_changes', [])
+  for obj in session.new | session.dirty:
+    if isinstance(obj, (Venue, Artist)):
+      changes.append((obj.__tablename__, obj.id, obj.name))
+  for obj in session.deleted:
+    if isinstance(obj, (Venue, Artist)):
+      changes.append((obj.__tablename__, obj.id, None))
+
+@event.listens_for(db.session, 'after_commit')
+def apply_suggestion_changes(session):
+  """
+    update the suggestion index once the names are committed
+  """
+  for kind, id, name in session.info.pop('suggestion_changes', []):
+    if name is None:
+      suggestions.remove(kind, id)
+    else:
+      suggestions.update(kind, id, name)
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_suggestion_changes(session):
+  session.info.pop('suggestion_changes', None)
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
@@ -106,7 +514,833 @@ def format_datetime(value, format='medium'):
       format="EE MM, dd, y h:mma"
   return babel.dates.format_datetime(date, format)
 
-app.jinja_env.filters['datetime'] = format_datetime
+app.jinja_env.filters['datetime'] = format_datetime
+
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+def genres_named(names):
+  """
+    Genre rows of genre names, new Genre objects for the names not seen before
+    Parameters:
+        names (List) : genre names, e.g. from request.form.getlist('genres')
+    Returns:
+        genres (List) : Genre objects in the order of the names, without duplicates
+  """
+  names = list(dict.fromkeys(name.strip() for name in names or () if name and name.strip()))
+  if not names:
+    return []
+  # genres added earlier in this session are not in the database yet
+  found = {genre.name: genre for genre in db.session.new if isinstance(genre, Genre)}
+  found.update((genre.name, genre) for genre in Genre.query.filter(Genre.name.in_(names)))
+  for name in names:
+    if name not in found:
+      found[name] = Genre(name=name)
+      db.session.add(found[name])
+  return [found[name] for name in names]
+
+def genre_ids(session, names):
+  """
+    ids of genre names, inserting the names not seen before, for bulk writes
+    Returns:
+        ids (Dict) : name -> genre id
+  """
+  names = set(names)
+  if not names:
+    return {}
+  lookup = lambda names: dict(session.execute(select(Genre.name, Genre.id).where(Genre.name.in_(names))).all())
+  ids = lookup(names)
+  missing = names - set(ids)
+  if missing:
+    session.execute(Genre.__table__.insert(), [{"name": name} for name in sorted(missing)])
+    ids.update(lookup(missing))
+  return ids
+
+def insert_with_genres(session, model, rows):
+  """
+    insert a batch of venue or artist rows in bulk, with their genres
+    Parameters:
+        session (Object) : session whose connection is used
+        model (Object) : Venue or Artist
+        rows (List) : dicts of column values plus "genres", a list of genre names
+    Returns:
+        ids (List) : ids given to the rows, in order
+  """
+  if not rows:
+    return []
+  ids = reserve_ids(session, model.__table__, len(rows))
+  genres = [row.pop('genres') for row in rows]
+  for row, id in zip(rows, ids):
+    row['id'] = id
+  insert_rows(session, model.__table__, rows)
+
+  link = GENRE_LINKS[model]
+  key = model.__tablename__ + '_id'
+  by_name = genre_ids(session, [name for names in genres for name in names])
+  insert_rows(session, link, [{key: id, "genre_id": genre_id}
+                              for id, names in zip(ids, genres)
+                              for genre_id in dict.fromkeys(by_name[name] for name in names)])
+  return ids
+
+def genre_names(model, ids):
+  """
+    statement selecting the (id, genre name) pairs of venues or artists, by name
+  """
+  link = GENRE_LINKS[model]
+  key = link.c[model.__tablename__ + '_id']
+  return select(key, Genre.name)\
+           .select_from(link)\
+           .join(Genre, Genre.id == link.c.genre_id)\
+           .where(key.in_(list(ids)))\
+           .order_by(key, Genre.name)
+
+def genres_by_id(rows):
+  """
+    group genre_names rows
+    Returns:
+        genres (Dict) : venue or artist id -> list of genre names
+  """
+  return {id: [row[1] for row in group] for id, group in groupby(rows, key=lambda row: row[0])}
+
+def genre_filter(model, genre):
+  """
+    condition keeping the venues or artists of a genre, answered from the genre
+    name index and the (genre_id, ..) index of the association table
+  """
+  link = GENRE_LINKS[model]
+  return model.id.in_(select(link.c[model.__tablename__ + '_id'])
+                        .join(Genre, Genre.id == link.c.genre_id)
+                        .where(Genre.name == genre))
+
+def genre_text(model, separator=';'):
+  """
+    correlated subquery joining the genre names of each venue or artist in
+    alphabetical order, as stored before genres had their own table
+  """
+  link = GENRE_LINKS[model]
+  names = select(Genre.name)\
+            .select_from(link)\
+            .join(Genre, Genre.id == link.c.genre_id)\
+            .where(link.c[model.__tablename__ + '_id'] == model.id)
+  if db.engine.dialect.name == 'postgresql':
+    joined = names.with_only_columns(func.string_agg(Genre.name, aggregate_order_by(literal(separator), Genre.name)))
+  else:
+    # group_concat takes no ORDER BY before SQLite 3.44, it joins the rows in
+    # the order of the subquery
+    ordered = names.order_by(Genre.name).correlate(model).subquery()
+    joined = select(func.group_concat(ordered.c.name, separator))
+  return type_coerce(joined.scalar_subquery(), db.String)
+
+def split_shows(rows, now):
+  """
+    split show rows ordered by start_time into past and upcoming
+    Parameters:
+        rows (List) : show rows ordered by start_time
+        now (datetime) : the moment separating past and upcoming shows
+    Returns:
+        past_shows, upcoming_shows (Tuple) : the two slices of rows
+  """
+  pivot = next((i for i, row in enumerate(rows) if row.start_time > now), len(rows))
+  return rows[:pivot], rows[pivot:]
+
+def upcoming(now=None):
+  """
+    condition on the shows still to come, the SQL side of split_shows
+    Parameters:
+        now (datetime) : the moment separating past and upcoming shows, the current time by default
+  """
+  return Show.start_time > (now or datetime.now())
+
+def show_end_time(start_time, end_time=None):
+  """
+    end time of a show
+    Parameters:
+        start_time (datetime) : start of the show
+        end_time (datetime) : optional, SHOW_DEFAULT_MINUTES after the start when not given
+    Returns:
+        end_time (datetime) : raises ValueError when it is not after the start or
+                              more than SHOW_MAX_MINUTES after it
+  """
+  if end_time is None:
+    return start_time + timedelta(minutes=app.config['SHOW_DEFAULT_MINUTES'])
+  if end_time <= start_time:
+    raise ValueError('the end time must be after the start time')
+  if end_time - start_time > timedelta(minutes=app.config['SHOW_MAX_MINUTES']):
+    raise ValueError('a show may last {} minutes at most'.format(app.config['SHOW_MAX_MINUTES']))
+  return end_time
+
+def show_conflicts(rows):
+  """
+    find the new shows overlapping another show of their venue or artist, stored
+    or listed before them, with one query whatever the number of rows
+    Parameters:
+        rows (List) : dicts of venue_id, artist_id, start_time and end_time, in insertion order
+    Returns:
+        conflicts (Dict) : index in rows -> message, rows in conflict are not
+                           checked against the rows after them
+  """
+  if not rows:
+    return {}
+  # No show lasts longer than SHOW_MAX_MINUTES, so the shows overlapping
+  # [start, end) start within (start - SHOW_MAX_MINUTES, end). Each venue and
+  # artist gets the range spanning its own rows, a bounded range of the
+  # (venue_id, start_time) and (artist_id, start_time) indexes, so rows of
+  # other owners far apart in time do not widen it
+  longest = timedelta(minutes=app.config['SHOW_MAX_MINUTES'])
+  stored = []
+  for key in ('venue', 'artist'):
+    spans = {}
+    for row in rows:
+      earliest, latest = spans.get(row[key + '_id'], (row['start_time'], row['end_time']))
+      spans[row[key + '_id']] = (min(earliest, row['start_time']), max(latest, row['end_time']))
+    owner = getattr(Show, key + '_id')
+    stored.append(select(literal(key).label('key'), owner.label('owner'), Show.id, Show.start_time, Show.end_time)
+                  .where(or_(*[and_(owner == owner_id, Show.start_time > earliest - longest, Show.start_time < latest)
+                               for owner_id, (earliest, latest) in spans.items()])))
+  booked = {}
+  for show in db.session.execute(union_all(*stored)):
+    booked.setdefault((show.key, show.owner), []).append((show.start_time, show.end_time, 'show {}'.format(show.id)))
+  for intervals in booked.values():
+    intervals.sort()
+
+  conflicts = {}
+  for index, row in enumerate(rows):
+    start, end = row['start_time'], row['end_time']
+    for key in ('venue', 'artist'):
+      found = first_overlap(booked.get((key, row[key + '_id']), []), start, end, longest)
+      if found:
+        conflicts[index] = '{} {} already has {} from {} to {}'.format(key, row[key + '_id'], found[2], found[0], found[1])
+        break
+    else:
+      for key in ('venue', 'artist'):
+        insort(booked.setdefault((key, row[key + '_id']), []), (start, end, 'another new show'))
+  return conflicts
+
+def first_overlap(intervals, start, end, longest):
+  """
+    Parameters:
+        intervals (List) : (start, end, label) tuples sorted by start, none longer than longest
+    Returns:
+        interval (Tuple) : one overlapping [start, end), None for none
+  """
+  for index in range(bisect_left(intervals, (end,)) - 1, -1, -1):
+    other = intervals[index]
+    if other[0] <= start - longest:
+      break
+    if other[1] > start:
+      return other
+  return None
+
+def venue_areas(rows):
+  """
+    group venue rows ordered by state and city into areas, lazily
+    Parameters:
+        rows (Iterable) : rows with id, name, city, state and num_upcoming_shows
+    Returns:
+        areas (Generator) : dicts of city, state, venue and upcoming show counts and
+                            venues for pages/venues.html
+  """
+  for (city, state), venues_group in groupby(rows, key=lambda row: (row.city, row.state)):
+    venues = [{
+      "id": venue.id,
+      "name": venue.name,
+      "num_upcoming_shows": venue.num_upcoming_shows
+    } for venue in venues_group]
+    yield {
+      'city': city,
+      'state': state,
+      'venue_count': len(venues),
+      'upcoming_shows_count': sum(venue['num_upcoming_shows'] for venue in venues),
+      'venues': venues
+    }
+
+def summary_areas(rows):
+  """
+    areas of venue_area_summary rows, for pages/venues.html
+    Parameters:
+        rows (Iterable) : rows ordered by state and city
+    Returns:
+        areas (Generator) : dicts as venue_areas() makes, listing the top venues only
+  """
+  for row in rows:
+    yield {
+      'city': row.city,
+      'state': row.state,
+      'venue_count': row.venue_count,
+      'upcoming_shows_count': row.upcoming_shows_count,
+      'venues': row.top_venues
+    }
+
+def venue_shows(venue_id):
+  """
+    statement selecting the shows of a venue with their artists, by start time
+  """
+  return select(Show.start_time, Artist.id.label('artist_id'),
+                Artist.name.label('artist_name'),
+                Artist.image_link.label('artist_image_link'))\
+           .join(Artist, Artist.id == Show.artist_id)\
+           .where(Show.venue_id == venue_id)\
+           .order_by(Show.start_time, Show.id)
+
+def artist_shows(artist_id):
+  """
+    statement selecting the shows of an artist with their venues, by start time
+  """
+  return select(Show.start_time, Venue.id.label('venue_id'),
+                Venue.name.label('venue_name'),
+                Venue.image_link.label('venue_image_link'))\
+           .join(Venue, Venue.id == Show.venue_id)\
+           .where(Show.artist_id == artist_id)\
+           .order_by(Show.start_time, Show.id)
+
+def venue_page(venue, genres, past_rows, upcoming_rows):
+  """
+    template data of a venue page
+    Parameters:
+        venue (Object) : Venue, or a row with the same columns
+        genres (List) : genre names of the venue
+        past_rows, upcoming_rows (List) : show rows with start_time and artist_id, artist_name,
+                                          artist_image_link
+    Returns:
+        data (Dict) : the venue for pages/show_venue.html
+  """
+  shows = lambda rows: [{
+      "artist_id": show.artist_id,
+      "artist_name": show.artist_name,
+      "artist_image_link": show.artist_image_link,
+      "start_time": str(show.start_time)
+  } for show in rows]
+  past_shows = shows(past_rows)
+  upcoming_shows = shows(upcoming_rows)
+
+  # Package
+  return {
+      "id": venue.id,
+      "name": venue.name,
+      "genres": genres,
+      "address": venue.address,
+      "city": venue.city,
+      "state": venue.state,
+      "phone": venue.phone,
+      "website": venue.website,
+      "facebook_link": venue.facebook_link,
+      "seeking_talent": venue.seeking_talent, 
+      "seeking_description": venue.seeking_description,
+      "image_link": venue.image_link if venue.image_link else "",
+      "past_shows_count": len(past_shows),
+      "upcoming_shows_count": len(upcoming_shows),
+      "past_shows": past_shows,
+      "upcoming_shows": upcoming_shows
+  }
+
+def artist_page(artist, genres, past_rows, upcoming_rows):
+  """
+    template data of an artist page
+    Parameters:
+        artist (Object) : Artist, or a row with the same columns
+        genres (List) : genre names of the artist
+        past_rows, upcoming_rows (List) : show rows with start_time and venue_id, venue_name,
+                                          venue_image_link
+    Returns:
+        data (Dict) : the artist for pages/show_artist.html
+  """
+  shows = lambda rows: [{
+      "venue_id": show.venue_id,
+      "venue_name": show.venue_name,
+      "venue_image_link": show.venue_image_link,
+      "start_time": str(show.start_time)
+  } for show in rows]
+  past_shows = shows(past_rows)
+  upcoming_shows = shows(upcoming_rows)
+
+  return {
+      "id": artist.id,
+      "name": artist.name,
+      "genres": genres,
+      "city": artist.city,
+      "state": artist.state,
+      "phone": artist.phone,
+      "seeking_venue": artist.seeking_venue,
+      "seeking_description": artist.seeking_description,
+      "image_link": artist.image_link, 
+      "facebook_link": artist.facebook_link,
+      "website_link": artist.website,
+      "past_shows": past_shows,
+      "upcoming_shows": upcoming_shows,
+      "past_shows_count": len(past_shows),
+      "upcoming_shows_count": len(upcoming_shows)
+  }
+
+def search_results(model, search_term):
+  """
+    run a full-text search and load the matches with their upcoming show counters
+    Parameters:
+        model (Object) : Venue or Artist
+        search_term (String) : search term, an empty term lists everything
+    Returns:
+        data (List) : matches, best first, as dicts of id, name and num_upcoming_shows
+  """
+  limit = app.config['SEARCH_RESULT_LIMIT']
+  query = db.session.query(model.id, model.name,
+                           model.upcoming_shows_count.label('num_upcoming_shows'))
+
+  if tokenize(search_term):
+    ids = search.search(model.__tablename__, search_term, limit)
+    rows = {row.id: row for row in query.filter(model.id.in_(ids))}
+    rows = [rows[id] for id in ids if id in rows]
+  else:
+    rows = query.order_by(model.name).limit(limit).all()
+
+  return [{
+    "id": row.id,
+    "name": row.name,
+    "num_upcoming_shows": row.num_upcoming_shows
+  } for row in rows]
+
+def page_validators(*parts, updated=(), started=None):
+  """
+    build the ETag and Last-Modified of a page
+    Parameters:
+        parts : anything else the page depends on, e.g. row counts
+        updated (Tuple) : updated_at values (naive UTC) of the rows shown on the page
+        started (datetime) : start time (naive local) of the latest show already started,
+                             the page changes when a show moves from upcoming to past
+    Returns:
+        etag, last_modified (Tuple) : validators for cache.conditional
+  """
+  moments = [moment.replace(tzinfo=timezone.utc) for moment in updated if moment]
+  if started:
+    moments.append(started.astimezone(timezone.utc))
+  last_modified = max(moments) if moments else datetime.fromtimestamp(0, timezone.utc)
+  etag = sha1(repr((updated, started, parts)).encode()).hexdigest()
+  return etag, last_modified
+
+def venue_changes(venue_id):
+  """
+    one aggregate over a venue, its shows and their artists, for venue_validators
+  """
+  return select(Venue.updated_at, func.max(Show.updated_at), func.max(Artist.updated_at),
+                func.max(case((Show.start_time <= datetime.now(), Show.start_time))),
+                func.count(Show.id))\
+           .select_from(Venue)\
+           .outerjoin(Show, Show.venue_id == Venue.id)\
+           .outerjoin(Artist, Artist.id == Show.artist_id)\
+           .where(Venue.id == venue_id)\
+           .group_by(Venue.id, Venue.updated_at)
+
+def artist_changes(artist_id):
+  """
+    one aggregate over an artist, its shows and their venues, for artist_validators
+  """
+  return select(Artist.updated_at, func.max(Show.updated_at), func.max(Venue.updated_at),
+                func.max(case((Show.start_time <= datetime.now(), Show.start_time))),
+                func.count(Show.id))\
+           .select_from(Artist)\
+           .outerjoin(Show, Show.artist_id == Artist.id)\
+           .outerjoin(Venue, Venue.id == Show.venue_id)\
+           .where(Artist.id == artist_id)\
+           .group_by(Artist.id, Artist.updated_at)
+
+def changes_validators(row):
+  """
+    validators of a page from a venue_changes / artist_changes row, None when the row is
+  """
+  if row is None:
+    return None
+  return page_validators(row[4], updated=tuple(row[:3]), started=row[3])
+
+def venue_validators(venue_id):
+  """
+    validators of a venue page
+  """
+  return changes_validators(db.session.execute(venue_changes(venue_id)).first())
+
+def artist_validators(artist_id):
+  """
+    validators of an artist page
+  """
+  return changes_validators(db.session.execute(artist_changes(artist_id)).first())
+
+def shows_validators():
+  """
+    validators of the shows list, from the latest change of any show, venue or artist
+  """
+  latest = lambda column: select(func.max(column)).scalar_subquery()
+  row = db.session.query(latest(Show.updated_at), latest(Venue.updated_at), latest(Artist.updated_at),
+                         select(func.max(Show.start_time))
+                           .where(Show.start_time <= datetime.now()).scalar_subquery())\
+                  .one()
+  return page_validators(request.full_path, updated=tuple(row[:3]), started=row[3])
+
+def export_query(kind, joined=False):
+  """
+    query of the rows exported for venues, artists or shows
+    Parameters:
+        kind (String) : 'venues', 'artists' or 'shows'
+        joined (Boolean) : for shows, add the venue and artist names and location
+    Returns:
+        query, columns (Tuple) : query ordered by id and the names of its columns
+  """
+  if kind == 'shows' and joined:
+    columns = [Show.id, Show.start_time, Show.end_time, Show.venue_id, Venue.name.label('venue_name'),
+               Venue.city.label('venue_city'), Venue.state.label('venue_state'),
+               Show.artist_id, Artist.name.label('artist_name')]
+    query = db.session.query(*columns)\
+                      .join(Venue, Venue.id == Show.venue_id)\
+                      .join(Artist, Artist.id == Show.artist_id)\
+                      .order_by(Show.id)
+    return query, [column.key for column in columns]
+
+  model = {'venues': Venue, 'artists': Artist, 'shows': Show}[kind]
+  columns = [column for column in model.__table__.columns if column.name not in ('search_vector', 'geohash')]
+  if model in GENRE_LINKS:
+    # as 'Jazz;Blues', the form the importer reads back
+    columns.append(genre_text(model).label('genres'))
+  return db.session.query(*columns).order_by(model.id), [column.name for column in columns]
+
+def render_list_page(template, **context):
+  """
+    render a list page, streaming it as it renders when STREAM_LIST_PAGES is set
+    Parameters:
+        template (String) : template name
+        context : template context, may hold generators over query rows
+    Returns:
+        response (Object) : rendered html or a streamed response
+  """
+  if app.config['STREAM_LIST_PAGES']:
+    return Response(stream_template(template, **context))
+  return render_template(template, **context)
+
+def encode_cursor(start_time, show_id):
+  """
+    encode a show position into an opaque pagination cursor
+    Parameters:
+        start_time (datetime) : start time of the show
+        show_id (Integer) : show id, breaking ties on start_time
+    Returns:
+        cursor (String) : url safe cursor
+  """
+  raw = '{}|{}'.format(start_time.isoformat(), show_id)
+  return urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+  """
+    decode a pagination cursor made by encode_cursor
+    Parameters:
+        cursor (String) : url safe cursor
+    Returns:
+        start_time, show_id (Tuple) : the show position, aborts with 400 if invalid
+  """
+  try:
+    start_time, show_id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(start_time), int(show_id)
+  except (ValueError, UnicodeDecodeError):
+    abort(400)
+
+SHOW_FILTERS = ('from', 'to', 'venue', 'artist', 'city')
+CALENDAR_BUCKETS = ('day', 'week', 'month')
+
+def request_moment(name, end=False):
+  """
+    a date, or a date and time, from the query string
+    Parameters:
+        name (String) : query string argument
+        end (Boolean) : a date alone stands for the end of that day rather than its start
+    Returns:
+        moment (datetime) : naive local time, None when the argument is missing;
+                            raises ValueError when it is not a date
+  """
+  value = request.args.get(name, '').strip()
+  if not value:
+    return None
+  try:
+    if len(value) == 10:
+      moment = datetime.combine(date.fromisoformat(value), datetime.min.time())
+      return moment + timedelta(days=1) if end else moment
+    moment = datetime.fromisoformat(value)
+  except ValueError:
+    raise ValueError('{} must be a date or a date and time, e.g. 2026-10-18 or 2026-10-18T20:00'.format(name))
+  # start times are stored in local time
+  return moment.astimezone().replace(tzinfo=None) if moment.tzinfo else moment
+
+def show_filters(include_past=False, now=None, paged=False):
+  """
+    conditions on shows from the from, to, venue, artist and city arguments
+    Parameters:
+        include_past (Boolean) : without from, keep the past shows rather than the upcoming ones only
+        now (datetime) : the moment separating past and upcoming shows
+        paged (Boolean) : the query reads a page of shows by start time, see city_condition
+    Returns:
+        conditions (List) : from is inclusive and to exclusive, a date alone for to meaning
+                            the whole day; city, as 'Austin' or 'Austin, TX', is a condition
+                            on Venue, which the query must join. Raises ValueError on invalid
+                            arguments
+  """
+  start, end = request_moment('from'), request_moment('to', end=True)
+  conditions = []
+  if start is not None:
+    conditions.append(Show.start_time >= start)
+  elif not include_past:
+    conditions.append(upcoming(now))
+  if end is not None:
+    conditions.append(Show.start_time < end)
+  for name, column in (('venue', Show.venue_id), ('artist', Show.artist_id)):
+    if request.args.get(name):
+      id = request.args.get(name, type=int)
+      if id is None:
+        raise ValueError('{} must be an id'.format(name))
+      conditions.append(column == id)
+  city, _, state = request.args.get('city', '').partition(',')
+  if city.strip():
+    walk = paged and not request.args.get('venue') and not request.args.get('artist')
+    conditions.append(city_condition(city.strip(), state.strip().upper(), walk))
+  return conditions
+
+def city_condition(city, state, paged=False, max_venues=1000):
+  """
+    condition on the venues of a city
+    Parameters:
+        city, state (String) : state may be empty for a city of any state
+        paged (Boolean) : the query reads a page of shows by start time
+        max_venues (Integer) : on SQLite, up to this many venues in the city have
+                               their shows read venue by venue
+    Returns:
+        condition (Object) : on Venue
+  """
+  venues = and_(Venue.city == city, *([Venue.state == state] if state else []))
+  if not paged or db.engine.dialect.name == 'postgresql':
+    return venues
+  # SQLite reads the venues of the city from their index, then sorts all their
+  # shows; for a big city, walking the start_time index finds a page sooner.
+  # Count the venues, from the index alone, and when there are many compare
+  # expressions of the columns, which the city index cannot serve.
+  found = db.session.execute(select(func.count())
+                               .select_from(select(Venue.id).where(venues).limit(max_venues + 1).subquery()))\
+                    .scalar()
+  if found <= max_venues:
+    return venues
+  return and_(Venue.city.concat('') == city, *([Venue.state.concat('') == state] if state else []))
+
+def bucket_start(bucket):
+  """
+    SQL expression of the first day of the day, week (from Monday) or month of a show
+    Parameters:
+        bucket (String) : one of CALENDAR_BUCKETS
+    Returns:
+        expression (Object) : a timestamp on PostgreSQL, a 'YYYY-MM-DD' string on SQLite
+  """
+  if db.engine.dialect.name == 'postgresql':
+    # a literal rather than a parameter, for GROUP BY to match the selected expression
+    return func.date_trunc(literal_column("'{}'".format(bucket)), Show.start_time)
+  return {
+    'day': func.date(Show.start_time),
+    # 'weekday 0' moves on to the Sunday ending the week, unless already on it
+    'week': func.date(Show.start_time, 'weekday 0', '-6 days'),
+    'month': func.strftime('%Y-%m-01', Show.start_time),
+  }[bucket]
+
+def feed_window():
+  """
+    start and end of the shows of a calendar feed: the from and to arguments,
+    or from ICAL_PAST_DAYS before today with no end
+    Returns:
+        start, end (Tuple) : naive local times, end None for no bound; aborts with 400 if invalid
+  """
+  try:
+    start, end = request_moment('from'), request_moment('to', end=True)
+  except ValueError:
+    abort(400)
+  if start is None:
+    start = datetime.combine(date.today(), datetime.min.time()) - timedelta(days=app.config['ICAL_PAST_DAYS'])
+  return start, end
+
+def feed_validators(validators):
+  """
+    validators of a calendar feed, from those of the page of its venue or artist
+    Parameters:
+        validators (Function) : venue_validators or artist_validators
+    Returns:
+        validators (Function) : for cache.conditional, also changing when the default
+                                window of the feed moves on at midnight
+  """
+  def feed(**kwargs):
+    found = validators(**kwargs)
+    if found is None:
+      return None
+    etag, last_modified = found
+    start, end = feed_window()
+    moved = datetime.combine(date.today(), datetime.min.time()).astimezone(timezone.utc)
+    return sha1('{}|{}|{}'.format(etag, start, end).encode()).hexdigest(), max(last_modified, moved)
+  return feed
+
+def calendar_feed(name, condition):
+  """
+    iCalendar response of the shows matching a condition, within feed_window()
+    Parameters:
+        name (String) : calendar name
+        condition (Object) : e.g. Show.venue_id == 3, served by its (..., start_time) index
+    Returns:
+        response (Object) : text/calendar response
+  """
+  start, end = feed_window()
+  statement = select(Show.id, Show.start_time, Show.end_time, Show.updated_at, Show.venue_id,
+                     Venue.name.label('venue_name'), Venue.address, Venue.city, Venue.state,
+                     Artist.name.label('artist_name'))\
+                .join(Venue, Venue.id == Show.venue_id)\
+                .join(Artist, Artist.id == Show.artist_id)\
+                .where(condition, Show.start_time >= start)\
+                .order_by(Show.start_time, Show.id)
+  if end is not None:
+    statement = statement.where(Show.start_time < end)
+
+  events = ({
+    "uid": 'show-{}@{}'.format(show.id, request.host),
+    "start": show.start_time,
+    "end": show.end_time,
+    "updated": show.updated_at,
+    "summary": '{} at {}'.format(show.artist_name, show.venue_name),
+    "location": ', '.join(part for part in (show.venue_name, show.address, show.city, show.state) if part),
+    "url": url_for('show_venue', venue_id=show.venue_id, _external=True),
+  } for show in db.session.execute(statement))
+  return Response(ical.calendar(name, events, app.config['ICAL_REFRESH_MINUTES']),
+                  mimetype='text/calendar')
+
+def nearby_point():
+  """
+    the point and radius of a nearby page, from the query string
+    Parameters:
+        lat, lng (Float) : the point, in degrees
+        radius (Float) : optional, km up to GEO_MAX_RADIUS_KM, GEO_DEFAULT_RADIUS_KM by default
+    Returns:
+        latitude, longitude, radius_km (Tuple) : None when lat and lng are missing,
+                                                 aborts with 400 if invalid
+  """
+  if 'lat' not in request.args and 'lng' not in request.args:
+    return None
+  latitude = request.args.get('lat', type=float)
+  longitude = request.args.get('lng', type=float)
+  radius_km = min(request.args.get('radius', app.config['GEO_DEFAULT_RADIUS_KM'], type=float),
+                  app.config['GEO_MAX_RADIUS_KM'])
+  if latitude is None or longitude is None or not -90 <= latitude <= 90 or \
+     not -180 <= longitude <= 180 or not radius_km > 0:
+    abort(400)
+  return latitude, longitude, radius_km
+
+def geohash_cells(latitude, longitude, radius_km):
+  """
+    condition keeping the venues in the geohash cells covering a circle, one
+    range scan of ix_venue_geohash per run of adjacent cells
+  """
+  # table columns, the ORM attributes take longer to build the expression
+  geohash = Venue.__table__.c.geohash
+  cells = geo.covering_cells(latitude, longitude, radius_km, app.config['GEO_MAX_CELLS'])
+  return or_(*[and_(geohash >= low, geohash < high) if high else geohash >= low
+               for low, high in geo.prefix_ranges(cells)])
+
+def within(latitude, longitude, radius_km):
+  """
+    condition keeping the venues within a radius of a point, tested row by row,
+    and the squared distance to sort them by; with geohash_cells for an index
+    to find the rows
+    Returns:
+        condition, distance (Tuple) : SQL expressions
+  """
+  columns = Venue.__table__.c
+  # the circle on a flat map around the point, plain arithmetic that every
+  # database evaluates and sorts by
+  north = (columns.latitude - latitude) * geo.KM_PER_DEGREE
+  east = (columns.longitude - longitude) * (geo.KM_PER_DEGREE * math.cos(math.radians(latitude)))
+  distance = north * north + east * east
+  return distance <= radius_km * radius_km, distance
+
+def nearby_venues(latitude, longitude, radius_km, limit):
+  """
+    venues within a radius of a point, nearest first
+    Parameters:
+        latitude, longitude (Float) : the point, in degrees
+        radius_km (Float) : search radius
+        limit (Integer) : most venues returned
+    Returns:
+        venues (List) : dicts of id, name, city, state, num_upcoming_shows and distance in km
+  """
+  query = select(Venue.id, Venue.name, Venue.city, Venue.state, Venue.latitude, Venue.longitude,
+                 Venue.upcoming_shows_count.label('num_upcoming_shows'))
+  # Start small and widen the circle until it holds a full page: in a city
+  # the first circle is often enough, where venues are few the next one is
+  # sized from how many the last one held.
+  step = min(radius_km, geo.FIRST_RADIUS_KM)
+  while True:
+    condition, distance = within(latitude, longitude, step)
+    rows = db.session.execute(query.where(geohash_cells(latitude, longitude, step), condition)
+                                   .order_by(distance, Venue.id).limit(limit)).all()
+    if len(rows) == limit or step >= radius_km:
+      break
+    step = geo.wider_radius(step, len(rows), limit)
+    # no circle just short of the whole one
+    step = radius_km if step * 1.5 > radius_km else step
+
+  venues = [{
+    "id": row.id,
+    "name": row.name,
+    "city": row.city,
+    "state": row.state,
+    "num_upcoming_shows": row.num_upcoming_shows,
+    "distance": geo.distance_km(latitude, longitude, row.latitude, row.longitude)
+  } for row in rows]
+  # the flat map is a close approximation, order the page by the exact distance
+  venues.sort(key=lambda venue: (venue['distance'], venue['id']))
+  return venues
+
+def nearby_shows(latitude, longitude, radius_km, limit, now, max_venues=1000):
+  """
+    upcoming shows at the venues within a radius of a point, soonest first
+    Parameters:
+        latitude, longitude (Float) : the point, in degrees
+        radius_km (Float) : search radius
+        limit (Integer) : most shows returned
+        now (datetime) : the moment separating past and upcoming shows
+        max_venues (Integer) : on SQLite, up to this many venues around the point
+                               have their shows read venue by venue
+    Returns:
+        shows (List) : dicts for pages/shows_nearby.html, with the distance in km
+  """
+  condition = within(latitude, longitude, radius_km)[0]
+  cells = geohash_cells(latitude, longitude, radius_km)
+  statement = select(Show.start_time, Show.venue_id, Venue.name.label('venue_name'),
+                     Venue.latitude, Venue.longitude, Show.artist_id,
+                     Artist.name.label('artist_name'), Artist.image_link)\
+                .join(Venue, Venue.id == Show.venue_id)\
+                .join(Artist, Artist.id == Show.artist_id)\
+                .where(upcoming(now), condition)\
+                .order_by(Show.start_time, Show.id)\
+                .limit(limit)
+
+  # A few venues around the point: read their shows from the (venue_id,
+  # start_time) index. Many: walk the upcoming shows by start time, nearby
+  # ones come soon. PostgreSQL chooses from its statistics; for SQLite count
+  # the venues of the covering cells, from the geohash index alone, and leave
+  # it no other way than the chosen one.
+  if db.engine.dialect.name == 'postgresql':
+    statement = statement.where(cells)
+  else:
+    venues = select(Venue.id).where(cells)
+    found = db.session.execute(select(func.count()).select_from(venues.limit(max_venues + 1).subquery())).scalar()
+    if not found:
+      return []
+    if found <= max_venues:
+      statement = statement.where(Show.venue_id.in_(db.session.execute(venues).scalars().all()))
+  rows = db.session.execute(statement).all()
+
+  return [{
+    "venue_id": show.venue_id,
+    "venue_name": show.venue_name,
+    "artist_id": show.artist_id,
+    "artist_name": show.artist_name,
+    "artist_image_link": show.image_link,
+    "start_time": str(show.start_time),
+    "distance": geo.distance_km(latitude, longitude, show.latitude, show.longitude)
+  } for show in rows]
 
 #----------------------------------------------------------------------------#
 # Controllers.
@@ -117,46 +1351,102 @@ def index():
   return render_template('pages/home.html')
 
 
+@app.route('/api/search/suggest')
+def search_suggest():
+  """
+    suggest venue and artist names starting with the typed text
+    Parameters:
+        q (String) : typed text, from the query string
+        limit (Integer) : optional, suggestions per kind up to SUGGEST_LIMIT
+    Returns:
+        json (Object) : {"venues": [{"id", "name"}], "artists": [{"id", "name"}]}
+  """
+  prefix = request.args.get('q', '').strip()
+  limit = min(request.args.get('limit', app.config['SUGGEST_LIMIT'], type=int),
+              app.config['SUGGEST_LIMIT'])
+  if not prefix or limit < 1:
+    return jsonify(venues=[], artists=[])
+
+  suggestions.refresh(lambda: db.session.query(db.literal('venue'), Venue.id, Venue.name)
+                                  .union_all(db.session.query(db.literal('artist'), Artist.id, Artist.name)))
+
+  found = suggestions.lookup(prefix, limit)
+  return jsonify(venues=found.get('venue', []), artists=found.get('artist', []))
+
+
+@app.route('/api/export/shows.jsonl')
+def export_shows():
+  """
+    stream every show as JSON lines
+    Parameters:
+        joined (Integer) : optional, 1 to add venue and artist names and location
+    Returns:
+        response (Object) : streamed application/x-ndjson
+  """
+  query, columns = export_query('shows', joined=request.args.get('joined') == '1')
+
+  def generate():
+    buffer = io.StringIO()
+    writer = JSONLWriter(buffer, columns)
+    for chunk in stream_rows(query, app.config['EXPORT_CHUNK_SIZE']):
+      writer.write(chunk)
+      yield buffer.getvalue()
+      buffer.seek(0)
+      buffer.truncate()
+
+  return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 #  Venues
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@cache.cached('venues')
 def venues():
   """
     view venues list and group by city
     Parameters:
-        Null
+        genre (String) : optional, only the venues of this genre
+        city (String) : optional, every venue of this city, as 'Austin' or 'Austin, TX'
     Returns:
         render_template (Object) : html template for flask 
   """
-  data = []
-  city_state_groups = Venue.query.with_entities(Venue.city, Venue.state).distinct().all() 
-  # check all city and state union
-  for city_state in city_state_groups:
-    venues_group = []
-    city = city_state[0]
-    state = city_state[1]
-    # Filter by city and state 
-    venues = Venue.query.filter_by(city=city, state=state).all() 
-    for venue in venues:
-      upcoming_shows = [show for show in venue.shows if show.start_time > datetime.now()]
-      # Group data 
-      venues_group.append({
-        "id": venue.id,
-        "name": venue.name,
-        "num_upcoming_shows": len(upcoming_shows)
-      })
-
-    data.append({
-      'city': city,
-      'state': state,
-      'venues': venues_group
-      })
-    print('data',data)
-
-  return render_template('pages/venues.html', areas=data);
+  genre = request.args.get('genre')
+  city, _, state = request.args.get('city', '').partition(',')
+  if not genre and not city.strip():
+    # the directory: the area summaries, read in primary key order
+    rows = db.session.query(VenueAreaSummary).order_by(VenueAreaSummary.state, VenueAreaSummary.city)
+    return render_list_page('pages/venues.html', areas=summary_areas(rows), genre=genre)
+
+  # One round trip: the venues with their upcoming show counter, ordered so
+  # that venues of the same area are adjacent and can be grouped in Python.
+  query = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state,
+                           Venue.upcoming_shows_count.label('num_upcoming_shows'))
+  if genre:
+    query = query.filter(genre_filter(Venue, genre))
+  if city.strip():
+    query = query.filter(city_condition(city.strip(), state.strip().upper()))
+  rows = query.order_by(Venue.state, Venue.city, Venue.name)\
+              .yield_per(app.config['STREAM_CHUNK_SIZE'])
+
+  return render_list_page('pages/venues.html', areas=venue_areas(rows), genre=genre)
+
+@app.route('/venues/nearby')
+def venues_nearby():
+  """
+    venues near a point, nearest first
+    Parameters:
+        lat, lng (Float) : the point, the page asks for the visitor's location without them
+        radius (Float) : optional, search radius in km
+    Returns:
+        render_template (Object) : html template for flask 
+  """
+  point = nearby_point()
+  venues = nearby_venues(*point, app.config['GEO_NEARBY_LIMIT']) if point else []
+  return render_template('pages/venues_nearby.html', venues=venues, point=point)
 
 @app.route('/venues/search', methods=['POST'])
+@read_only
 def search_venues():
   """
     Search a venue from the database
@@ -165,16 +1455,8 @@ def search_venues():
     Returns:
         render_template (Object) : html template for flask 
   """
-  data = []
   search_term = request.form.get('search_term', '')
-  venues = Venue.query.filter(Venue.name.ilike('%' + search_term + '%'))
-  for venue in venues:
-    upcoming_shows = [show for show in venue.shows if show.start_time > datetime.now()]
-    data.append({
-      "id": venue.id,
-      "name": venue.name,
-      "num_upcoming_shows": upcoming_shows
-    })
+  data = search_results(Venue, search_term)
 
   response = {
     "count" : len(data),
@@ -184,6 +1466,8 @@ def search_venues():
   return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 @app.route('/venues/<int:venue_id>')
+@conditional(venue_validators)
+@cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
   """
     view a venue
@@ -192,59 +1476,35 @@ def show_venue(venue_id):
     Returns:
         render_template (Object) : html template for flask 
   """
-  venue = Venue.query.get(venue_id)
+  venue = Venue.query.options(joinedload(Venue.genre_rows)).get(venue_id)
   if not venue:
     flash('Venue Missing')   
     return redirect('/venues')
   
-  past_shows_group = [show for show in venue.shows if show.start_time <= datetime.now()]
-  upcoming_shows_group = [show for show in venue.shows if show.start_time > datetime.now()]
-
-  num_past_shows = len(past_shows_group)
-  num_upcoming_shows = len(upcoming_shows_group)
-
-  # Get past shows 
-  past_shows = []
-  for show in past_shows_group:
-      artist = Artist.query.get(show.artist_id)
-      past_shows.append({
-        "artist_id": artist.id,
-        "artist_name": artist.name,
-        "artist_image_link": artist.image_link,
-        "start_time": str(show.start_time)
-      })
-  # Get upcoming shows
-  upcoming_shows = []
-  for show in upcoming_shows_group:
-    artist = Artist.query.get(show.artist_id)
-    upcoming_shows.append({
-        "artist_id": artist.id,
-        "artist_name": artist.name,
-        "artist_image_link": artist.image_link,
-        "start_time": str(show.start_time)
-    })
-  # Package  
-  data = {
-      "id": venue.id,
-      "name": venue.name,
-      "genres": venue.genres,
-      "address": venue.address,
-      "city": venue.city,
-      "state": venue.state,
-      "phone": venue.phone,
-      "website": venue.website,
-      "facebook_link": venue.facebook_link,
-      "seeking_talent": venue.seeking_talent, 
-      "seeking_description": venue.seeking_description,
-      "image_link": venue.image_link if venue.image_link else "",
-      "past_shows_count": num_past_shows,
-      "upcoming_shows_count": num_upcoming_shows,
-      "past_shows": past_shows,
-      "upcoming_shows": upcoming_shows
-  }
+  # Shows and their artists in one joined query, already ordered by start time
+  rows = db.session.execute(venue_shows(venue_id)).all()
+  past_shows, upcoming_shows = split_shows(rows, datetime.now())
+  data = venue_page(venue, venue.genres, past_shows, upcoming_shows)
 
   return render_template('pages/show_venue.html', venue=data)
 
+@app.route('/venues/<int:venue_id>/calendar.ics')
+@conditional(feed_validators(venue_validators))
+@cache.cached('venue:{venue_id}')
+def venue_calendar(venue_id):
+  """
+    iCalendar feed of the shows of a venue, for calendar apps to subscribe to
+    Parameters:
+        venue_id (Integer) : venue id
+        from, to (String) : optional, date range, by default from ICAL_PAST_DAYS ago on
+    Returns:
+        response (Object) : text/calendar
+  """
+  name = db.session.query(Venue.name).filter(Venue.id == venue_id).scalar()
+  if name is None:
+    abort(404)
+  return calendar_feed('Shows at {}'.format(name), Show.venue_id == venue_id)
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
@@ -301,17 +1561,21 @@ def create_venue_submission():
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
     return render_template('pages/home.html')
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   """
     Delete a venue from database
     Parameters:
         venue_id (Integer) : venue id
     Returns:
-        None
+        response (Object) : JSON success flag, for the page that sent the request
   """
   error = False
   venue = Venue.query.get(venue_id)
+  if not venue:
+    abort(404)
+  # read before the commit expires it
+  name = venue.name
 
   try:
     db.session.delete(venue)
@@ -322,33 +1586,39 @@ def delete_venue(venue_id):
     error = True
     print(sys.exc_info())
     # on unsuccessful db insert, flash error 
-    flash('An error occurred. Venue ' + venue.name + ' could not be deleted!')
+    flash('An error occurred. Venue ' + name + ' could not be deleted!')
 
   finally:
     db.session.close()
   
   if error:
-        abort(500)
+    abort(500)
   else:
-     # on successful db delete, flash success
-    flash('Venue ' + venue.name + ' was successfully deleted!')
-    return None
+    # on successful db delete, flash success
+    flash('Venue ' + name + ' was successfully deleted!')
+    return jsonify({"success": True})
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@cache.cached('artists')
 def artists():
   """
     view venues list and group by city
     Parameters:
-        None
+        genre (String) : optional, only the artists of this genre
     Returns:
         render_template (Object) : html template for flask 
   """
-  artists = Artist.query.with_entities(Artist.id, Artist.name).all()
-  return render_template('pages/artists.html', artists=artists)
+  genre = request.args.get('genre')
+  artists = Artist.query.with_entities(Artist.id, Artist.name)
+  if genre:
+    artists = artists.filter(genre_filter(Artist, genre))
+  artists = artists.yield_per(app.config['STREAM_CHUNK_SIZE'])
+  return render_list_page('pages/artists.html', artists=artists, genre=genre)
 
 @app.route('/artists/search', methods=['POST'])
+@read_only
 def search_artists():
   """
     search a artist by search term
@@ -357,25 +1627,18 @@ def search_artists():
     Returns:
         render_template (Object) : html template for flask 
   """
-  data = []
   search_term = request.form.get('search_term', '')
-  artists = Artist.query.filter(Artist.name.ilike('%'+search_term+'%')).all()
-
-  for artist in artists:
-    upcoming_shows = [show for show in artist.shows if show.start_time > datetime.now()]
-    data.append({
-      "id": artist.id,
-      "name": artist.name,
-      "num_upcoming_shows": len(upcoming_shows)
-    })
+  data = search_results(Artist, search_term)
 
   response={
-    "count": len(artists),
+    "count": len(data),
     "data": data
   }
   return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 @app.route('/artists/<int:artist_id>')
+@conditional(artist_validators)
+@cache.cached('artist:{artist_id}')
 def show_artist(artist_id):
   """
     show a artist by artist id
@@ -385,58 +1648,35 @@ def show_artist(artist_id):
         render_template (Object) : html template for flask 
   """
   # Select a artist by id
-  artist = Artist.query.get(artist_id)
- 
+  artist = Artist.query.options(joinedload(Artist.genre_rows)).get(artist_id)
+  if not artist:
+    flash('Artist Missing')
+    return redirect('/artists')
 
-  past_shows_group = [show for show in artist.shows if show.start_time <= datetime.now()]
-  upcoming_shows_group = [show for show in artist.shows if show.start_time > datetime.now()]
-
-  num_past_shows = len(past_shows_group)
-  num_upcoming_shows = len(upcoming_shows_group)
-
-
-  # Get upcoming shows
-  upcoming_shows = []
-  for show in upcoming_shows_group:
-    venue = Venue.query.get(show.venue_id)
-    upcoming_shows.append({
-        "venue_id": venue.id,
-        "venue_name": venue.name,
-        "venue_image_link": venue.image_link,
-        "start_time": str(show.start_time)
-  })
-
-  # Get past shows
-  past_shows = []
-  for show in past_shows_group:    
-    venue = Venue.query.get(show.venue_id)
-    past_shows.append({
-      "venue_id": venue.id,
-      "venue_name": venue.name,
-      "venue_image_link": venue.image_link,
-      "start_time": str(show.start_time)
-  })
-
-  data = {
-      "id": artist.id,
-      "name": artist.name,
-      "genres": artist.genres,
-      "city": artist.city,
-      "state": artist.state,
-      "phone": artist.phone,
-      "seeking_venue": artist.seeking_venue,
-      "seeking_description": artist.seeking_description,
-      "image_link": artist.image_link, 
-      "facebook_link": artist.facebook_link,
-      "website_link": artist.website,
-      "past_shows": past_shows,
-      "upcoming_shows": upcoming_shows,
-      "past_shows_count": num_past_shows,
-      "upcoming_shows_count": num_upcoming_shows
-  }
+  # Shows and their venues in one joined query, already ordered by start time
+  rows = db.session.execute(artist_shows(artist_id)).all()
+  past_shows, upcoming_shows = split_shows(rows, datetime.now())
+  data = artist_page(artist, artist.genres, past_shows, upcoming_shows)
 
   return render_template('pages/show_artist.html', artist=data)
 
+@app.route('/artists/<int:artist_id>/calendar.ics')
+@conditional(feed_validators(artist_validators))
+@cache.cached('artist:{artist_id}')
+def artist_calendar(artist_id):
+  """
+    iCalendar feed of the shows of an artist, for calendar apps to subscribe to
+    Parameters:
+        artist_id (Integer) : artist id
+        from, to (String) : optional, date range, by default from ICAL_PAST_DAYS ago on
+    Returns:
+        response (Object) : text/calendar
+  """
+  name = db.session.query(Artist.name).filter(Artist.id == artist_id).scalar()
+  if name is None:
+    abort(404)
+  return calendar_feed('Shows of {}'.format(name), Show.artist_id == artist_id)
+
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
@@ -453,7 +1693,7 @@ def edit_artist(artist_id):
   data = {
     "id": artist.id,
     "name": artist.name,
-    "genres": artist.genres.split(';'),
+    "genres": artist.genres,
     "city": artist.city,
     "state": artist.state,
     "phone": artist.phone,
@@ -512,40 +1752,80 @@ def edit_artist_submission(artist_id):
 
 
 
-@app.route('/venues/<int:artist_id>/edit', methods=['GET'])
-def edit_venue(artist_id):
-  form = ArtistForm()
-  return render_template('forms/new_artist.html', form=form)
+@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+def edit_venue(venue_id):
+  """
+    Set data for editing
+    Parameters:
+        venue_id (Integer)
+    Returns:
+        render_template (Object) : html template for flask 
+  """
+  venue = Venue.query.get(venue_id)
+  if not venue:
+    flash('Venue Missing')
+    return redirect('/venues')
+  form = VenueForm(obj=venue)
+  data = {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": venue.genres,
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website": venue.website,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link
+  }
+
+  return render_template('forms/edit_venue.html', form=form, venue=data)
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
-def edit_venue_submission(artist_id):
-  artist = Artist.query.get(artist_id)
+def edit_venue_submission(venue_id):
+  """
+    edit a venue by venue id
+    Parameters:
+        venue_id (Integer)
+    Returns:
+        redirect (Object) : to the venue page
+  """
+  error = False
+  venue = Venue.query.get(venue_id)
+  if not venue:
+    abort(404)
+
+  venue.name = request.form.get('name')
+  venue.city = request.form.get('city')
+  venue.state = request.form.get('state')
+  venue.address = request.form.get('address')
+  venue.phone = request.form.get('phone')
+  venue.genres = request.form.getlist('genres')
+  venue.image_link = request.form.get('image_link')
+  venue.facebook_link = request.form.get('facebook_link')
+  venue.website = request.form.get('website')
+  venue.seeking_talent = True if request.form.get('seeking_talent') == 'y' else False
+  venue.seeking_description = request.form.get('seeking_description', '')
 
   try:
-    artist = Artist(
-      name = request.form.get('name'),  
-      city = request.form.get('city'),
-      state = request.form.get('state'),
-      phone = request.form.get('phone'),  
-      genres = request.form.getlist('genres'),
-      facebook_link = request.form.get('facebook_link'),
-      website = request.form.get('website'),
-      image_link = request.form.get('image_link'),
-      seeking_venue = True if request.form.get('seeking_venue') == 'y' else False , 
-      seeking_description = request.form.get('seeking_description','')
-    )
-    db.session.add(artist)
     db.session.commit()
-    flash('Artist ' + request.form['name'] + ' was successfully listed!')
-      
+    flash('Venue ' + request.form['name'] + ' was successfully updated!')
+
   except:
-    flash('An error occurred. Artist ' + artist.name + ' could not be listed.')
+    error = True
+    print(sys.exc_info())
+    flash('An error occurred. Venue ' + request.form.get('name', '') + ' could not be updated.')
     db.session.rollback()
-    db.session.close()
-  
+
   finally:
     db.session.close()
-    return redirect(url_for('show_venue', artist_id=artist_id))
+
+  if error:
+    abort(500)
+  else:
+    return redirect(url_for('show_venue', venue_id=venue_id))
   
 
 #  Create Artist
@@ -607,35 +1887,97 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@conditional(shows_validators)
+@cache.cached('shows')
 def shows():
   """
     Shows list
     Parameters:
-        Null
+        from, to (String) : optional, date range of the shows, e.g. from=2026-10-01&to=2026-10-31
+        venue, artist (Integer) : optional, shows of one venue or artist
+        city (String) : optional, shows in a city, e.g. city=Austin or city=Austin, TX
+        all (String) : '1' for past shows too when from is not given
     Returns:
         render_template (Object) : html template for flask 
   """
-  data=[]
+  page_size = min(request.args.get('per_page', app.config['SHOWS_PAGE_SIZE'], type=int),
+                  app.config['SHOWS_MAX_PAGE_SIZE'])
+  if page_size < 1:
+    abort(400)
+  include_past = request.args.get('all') == '1'
+  after = request.args.get('after')
+  before = request.args.get('before')
+  try:
+    conditions = show_filters(include_past, paged=True)
+  except ValueError:
+    abort(400)
+  filters = {name: request.args[name] for name in SHOW_FILTERS if request.args.get(name)}
+
   # join table by id and set Venue.name as venue_name, Artist.name as artist_name 
   shows_query = Show.query.join(Venue, (Venue.id == Show.venue_id))\
                     .join(Artist, (Artist.id == Show.artist_id))\
-                    .with_entities(Show.artist_id, Artist.name.label('artist_name'),\
+                    .with_entities(Show.id, Show.artist_id, Artist.name.label('artist_name'),\
                                    Show.venue_id, Venue.name.label('venue_name'),\
                                    Artist.image_link,\
                                    Show.start_time)
-  
-  for show in shows_query:
-    data.append({
+  # a date range is read from the start_time index, one venue or artist from theirs
+  shows_query = shows_query.filter(*conditions)
+
+  # Keyset pagination on (start_time, id): walk backwards from `before`,
+  # otherwise forwards from `after` or from the beginning
+  if before:
+    start_time, show_id = decode_cursor(before)
+    shows_query = shows_query.filter(or_(Show.start_time < start_time,
+                                         and_(Show.start_time == start_time, Show.id < show_id)))\
+                             .order_by(Show.start_time.desc(), Show.id.desc())
+  else:
+    if after:
+      start_time, show_id = decode_cursor(after)
+      shows_query = shows_query.filter(or_(Show.start_time > start_time,
+                                           and_(Show.start_time == start_time, Show.id > show_id)))
+    shows_query = shows_query.order_by(Show.start_time, Show.id)
+
+  rows = shows_query.limit(page_size + 1).all()
+  has_more = len(rows) > page_size
+  rows = rows[:page_size]
+  if before:
+    rows.reverse()
+
+  data = [{
       "venue_id": show.venue_id,
       "venue_name": show.venue_name,
       "artist_id": show.artist_id,
       "artist_name": show.artist_name,
       "artist_image_link": show.image_link,
       "start_time": str(show.start_time)
-    })
-  return render_template('pages/shows.html', shows=data)
+  } for show in rows]
+
+  next_cursor = prev_cursor = None
+  if rows:
+    if has_more or before:
+      next_cursor = encode_cursor(rows[-1].start_time, rows[-1].id)
+    if after or (before and has_more):
+      prev_cursor = encode_cursor(rows[0].start_time, rows[0].id)
+
+  return render_list_page('pages/shows.html', shows=data, next_cursor=next_cursor,
+                          prev_cursor=prev_cursor, include_past=include_past, per_page=page_size,
+                          filters=filters)
  
 
+@app.route('/shows/nearby')
+def shows_nearby():
+  """
+    upcoming shows near a point, soonest first
+    Parameters:
+        lat, lng (Float) : the point, the page asks for the visitor's location without them
+        radius (Float) : optional, search radius in km
+    Returns:
+        render_template (Object) : html template for flask 
+  """
+  point = nearby_point()
+  shows = nearby_shows(*point, app.config['GEO_NEARBY_LIMIT'], datetime.now()) if point else []
+  return render_template('pages/shows_nearby.html', shows=shows, point=point)
+
 @app.route('/shows/create')
 def create_shows():
   """
@@ -655,27 +1997,48 @@ def create_show_submission():
         render_template (Object) : html template for flask 
   """
   error = False
+  conflict = None
   # check id is exeist
-  venue_id = request.form.get('venue_id'),
-  artist_id = request.form.get('artist_id')
+  venue_id = request.form.get('venue_id', type=int)
+  artist_id = request.form.get('artist_id', type=int)
 
-  artist = Artist.query.filter_by(id = artist_id).first()
-  venue = Venue.query.filter_by(id = venue_id).first()
+  artist = Artist.query.filter_by(id = artist_id).first() if artist_id else None
+  venue = Venue.query.filter_by(id = venue_id).first() if venue_id else None
 
-  if not artist and venue:
+  if not artist or not venue:
     flash('Wrong id')
     return redirect('/shows/create')
 
+  # the times are read like the import reads them, naive local times in one
+  # of DATETIME_FORMATS; the page sends no CSRF token
+  form = ShowForm(meta={'csrf': False})
+  if not form.validate():
+    flash('Wrong time: {}'.format('; '.join('{}: {}'.format(name, ', '.join(errors))
+                                            for name, errors in form.errors.items())))
+    return redirect('/shows/create')
   try:
-    show = Show(
-      start_time = request.form.get('start_time'),
-      venue_id = venue_id,
-      artist_id = artist_id
-    )
-    print(show)
+    start_time = form.start_time.data
+    end_time = show_end_time(start_time, form.end_time.data)
+  except ValueError as time_error:
+    flash('Wrong time: {}'.format(time_error))
+    return redirect('/shows/create')
+
+  row = {"venue_id": venue_id, "artist_id": artist_id, "start_time": start_time, "end_time": end_time}
+  conflict = show_conflicts([row]).get(0)
+  if conflict:
+    flash('Show could not be listed: ' + conflict)
+    return redirect('/shows/create')
+
+  try:
+    show = Show(**row)
     db.session.add(show)
     db.session.commit()
-  
+
+  except IntegrityError:
+    # booked by a concurrent request since the check, caught by the exclusion constraints
+    db.session.rollback()
+    conflict = 'the venue or the artist was just booked at that time'
+
   except:
     db.session.rollback()
     error = True
@@ -688,11 +2051,530 @@ def create_show_submission():
   
   if error:
     abort(500)
+  elif conflict:
+    flash('Show could not be listed: ' + conflict)
+    return redirect('/shows/create')
   else:
     # on successful db insert, flash success
     flash('Show was successfully listed!')
     return render_template('pages/home.html')
 
+#  API
+#  ----------------------------------------------------------------
+
+api = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+API_FIELDS = {
+  Venue: ('id', 'name', 'city', 'state', 'address', 'phone', 'genres', 'image_link',
+          'facebook_link', 'website', 'seeking_talent', 'seeking_description', 'latitude',
+          'longitude', 'upcoming_shows_count', 'past_shows_count', 'updated_at'),
+  Artist: ('id', 'name', 'city', 'state', 'phone', 'genres', 'image_link',
+           'facebook_link', 'website', 'seeking_venue', 'seeking_description',
+           'upcoming_shows_count', 'past_shows_count', 'updated_at'),
+  Show: ('id', 'start_time', 'end_time', 'venue_id', 'artist_id', 'updated_at'),
+}
+
+def api_json(payload, status=200):
+  """
+    serialise an API payload, with orjson when it is installed
+  """
+  if orjson is not None:
+    body = orjson.dumps(payload)
+  else:
+    body = json.dumps(payload, default=lambda value: value.isoformat())
+  return Response(body, status=status, mimetype='application/json')
+
+def api_error(status, message):
+  return api_json({"error": message}, status)
+
+def api_fields(model, includes=()):
+  """
+    columns selected by ?fields=, all of them by default; the id is always included,
+    and so is the foreign key of each include (venue_id for venue), which its loader reads
+  """
+  allowed = API_FIELDS[model]
+  requested = request.args.get('fields')
+  if not requested:
+    return list(allowed)
+  names = [name.strip() for name in requested.split(',') if name.strip()]
+  unknown = [name for name in names if name not in allowed]
+  if unknown:
+    abort(api_error(400, 'unknown fields: ' + ', '.join(unknown)))
+  keys = [name + '_id' for name in includes if name + '_id' in allowed]
+  return list(dict.fromkeys(['id'] + names + keys))
+
+def api_includes(allowed):
+  includes = [name.strip() for name in request.args.get('include', '').split(',') if name.strip()]
+  unknown = [name for name in includes if name not in allowed]
+  if unknown:
+    abort(api_error(400, 'unknown includes: ' + ', '.join(unknown)))
+  return includes
+
+def api_query(model, fields):
+  """
+    query of the column fields, genres are added by api_records
+  """
+  return db.session.query(*[getattr(model, name) for name in fields if name != 'genres'])
+
+def api_records(model, rows, fields):
+  """
+    records of api_query rows, with the genres of all of them in one query when asked for
+  """
+  columns = [name for name in fields if name != 'genres']
+  records = [dict(zip(columns, row)) for row in rows]
+  if 'genres' in fields and records:
+    genres = genres_by_id(db.session.execute(genre_names(model, [record['id'] for record in records])))
+    for record in records:
+      record['genres'] = genres.get(record['id'], [])
+  return records
+
+def api_list(model, include_loaders):
+  """
+    one keyset page of a model, ordered by id
+    Parameters:
+        model (Object) : Venue, Artist or Show
+        include_loaders (Dict) : include name -> function(records) adding the related rows
+  """
+  includes = api_includes(include_loaders)
+  fields = api_fields(model, includes)
+  limit = min(request.args.get('limit', app.config['API_PAGE_SIZE'], type=int), app.config['API_MAX_PAGE_SIZE'])
+  if limit < 1:
+    return api_error(400, 'limit must be positive')
+
+  query = api_query(model, fields).order_by(model.id)
+  if model in GENRE_LINKS and request.args.get('genre'):
+    query = query.filter(genre_filter(model, request.args['genre']))
+  after = request.args.get('after', type=int)
+  if after is not None:
+    query = query.filter(model.id > after)
+  rows = query.limit(limit + 1).all()
+
+  records = api_records(model, rows[:limit], fields)
+  for name in includes:
+    include_loaders[name](records)
+
+  next_url = None
+  if len(rows) > limit:
+    args = request.args.to_dict()
+    args['after'] = records[-1]['id']
+    next_url = url_for(request.endpoint, **args)
+  return api_json({"data": records, "next": next_url})
+
+def api_detail(model, id, include_loaders):
+  includes = api_includes(include_loaders)
+  fields = api_fields(model, includes)
+  row = api_query(model, fields).filter(model.id == id).first()
+  if row is None:
+    return api_error(404, '{} {} not found'.format(model.__tablename__, id))
+  records = api_records(model, [row], fields)
+  for name in includes:
+    include_loaders[name](records)
+  return api_json({"data": records[0]})
+
+def include_shows(key):
+  """
+    include loader adding the shows of venues or artists, one query for the whole page
+    Parameters:
+        key (String) : 'venue' or 'artist', the show column pointing at the records
+  """
+  def load(records):
+    by_id = {}
+    for record in records:
+      record['shows'] = []
+      by_id[record['id']] = record
+    if not by_id:
+      return
+    show_key = getattr(Show, key + '_id')
+    for row in db.session.query(Show.id, Show.start_time, Show.venue_id, Show.artist_id)\
+                         .filter(show_key.in_(list(by_id)))\
+                         .order_by(Show.start_time, Show.id):
+      by_id[getattr(row, key + '_id')]['shows'].append(row._asdict())
+  return load
+
+def include_related(model, key):
+  """
+    include loader adding the venue or artist of shows, one query for the whole page
+  """
+  def load(records):
+    ids = set(record[key + '_id'] for record in records if record.get(key + '_id') is not None)
+    related = {}
+    if ids:
+      fields = ['id', 'name', 'city', 'state', 'image_link']
+      for row in db.session.query(*[getattr(model, name) for name in fields]).filter(model.id.in_(ids)):
+        related[row.id] = dict(zip(fields, row))
+    for record in records:
+      record[key] = related.get(record.get(key + '_id'))
+  return load
+
+def upcoming_summaries(key, ids):
+  """
+    upcoming show count and next show time of many venues or artists, in one grouped query
+    Parameters:
+        key (String) : 'venue' or 'artist'
+        ids (List) : venue or artist ids
+    Returns:
+        summaries (Dict) : id -> {"count", "next_start_time"}
+  """
+  show_key = getattr(Show, key + '_id')
+  rows = db.session.query(show_key, func.count(Show.id), func.min(Show.start_time))\
+                   .filter(show_key.in_(ids), upcoming())\
+                   .group_by(show_key)
+  return {id: {"count": count, "next_start_time": next_start_time} for id, count, next_start_time in rows}
+
+def api_batch_get(model, key, include_loaders):
+  """
+    many records by id, one IN query per table whatever the number of ids
+    Parameters:
+        model (Object) : Venue or Artist
+        key (String) : 'venue' or 'artist', the show column pointing at the records
+        include_loaders (Dict) : include name -> function(records) adding the related rows
+  """
+  try:
+    ids = list(dict.fromkeys(int(id) for value in request.args.getlist('ids')
+                             for id in value.split(',') if id.strip()))
+  except ValueError:
+    return api_error(400, 'ids must be integers')
+  if not ids:
+    return api_error(400, 'ids is required')
+  if len(ids) > app.config['API_BATCH_MAX_IDS']:
+    return api_error(400, 'at most {} ids per request'.format(app.config['API_BATCH_MAX_IDS']))
+  includes = api_includes(include_loaders)
+  fields = api_fields(model, includes)
+
+  found = {record['id']: record
+           for record in api_records(model, api_query(model, fields).filter(model.id.in_(ids)).all(), fields)}
+  records = [found[id] for id in ids if id in found]
+  summaries = upcoming_summaries(key, list(found)) if found else {}
+  for record in records:
+    record['upcoming_shows'] = summaries.get(record['id'], {"count": 0, "next_start_time": None})
+  for name in includes:
+    include_loaders[name](records)
+  return api_json({"data": records, "missing": [id for id in ids if id not in found]})
+
+VENUE_INCLUDES = {'shows': include_shows('venue')}
+ARTIST_INCLUDES = {'shows': include_shows('artist')}
+SHOW_INCLUDES = {'venue': include_related(Venue, 'venue'), 'artist': include_related(Artist, 'artist')}
+
+@api.route('/venues')
+def api_venues():
+  """
+    venues, a page at a time
+    Parameters:
+        fields (String) : optional, comma separated fields to return
+        include (String) : optional, 'shows' to add each venue's shows
+        after (Integer) : optional, return venues with an id after this one
+        limit (Integer) : optional, page size up to API_MAX_PAGE_SIZE
+    Returns:
+        json (Object) : {"data": [...], "next": url of the next page or null}
+  """
+  return api_list(Venue, VENUE_INCLUDES)
+
+@api.route('/venues:batchGet')
+def api_venues_batch_get():
+  """
+    many venues at once, in the order asked for
+    Parameters:
+        ids (String) : comma separated venue ids, up to API_BATCH_MAX_IDS
+        fields (String) : optional, comma separated fields to return
+        include (String) : optional, 'shows' to add each venue's shows
+    Returns:
+        json (Object) : {"data": [... with an "upcoming_shows" summary], "missing": [ids not found]}
+  """
+  return api_batch_get(Venue, 'venue', VENUE_INCLUDES)
+
+@api.route('/venues/<int:venue_id>')
+def api_venue(venue_id):
+  return api_detail(Venue, venue_id, VENUE_INCLUDES)
+
+@api.route('/artists')
+def api_artists():
+  """
+    artists, a page at a time, with the same parameters as /api/v1/venues
+  """
+  return api_list(Artist, ARTIST_INCLUDES)
+
+@api.route('/artists:batchGet')
+def api_artists_batch_get():
+  """
+    many artists at once, with the same parameters as /api/v1/venues:batchGet
+  """
+  return api_batch_get(Artist, 'artist', ARTIST_INCLUDES)
+
+@api.route('/artists/<int:artist_id>')
+def api_artist(artist_id):
+  return api_detail(Artist, artist_id, ARTIST_INCLUDES)
+
+@api.route('/shows')
+def api_shows():
+  """
+    shows, a page at a time, with the same parameters as /api/v1/venues
+    except that include takes 'venue' and/or 'artist'
+  """
+  return api_list(Show, SHOW_INCLUDES)
+
+@api.route('/shows:calendar')
+def api_shows_calendar():
+  """
+    number of shows per day, week or month, counted by the database
+    Parameters:
+        bucket (String) : 'day', 'week' (from Monday) or 'month', 'day' by default
+        from, to, venue, artist, city : the filters of /shows, upcoming shows without from
+    Returns:
+        data (List) : {"start": first day of the bucket, "shows": count}, buckets without
+                      shows left out; the first and last buckets only count the shows
+                      within from and to
+  """
+  bucket = request.args.get('bucket', 'day')
+  if bucket not in CALENDAR_BUCKETS:
+    return api_error(400, 'bucket must be one of ' + ', '.join(CALENDAR_BUCKETS))
+  try:
+    conditions = show_filters()
+  except ValueError as error:
+    return api_error(400, str(error))
+
+  start = bucket_start(bucket).label('start')
+  query = db.session.query(start, func.count(Show.id)).select_from(Show)
+  if request.args.get('city'):
+    query = query.join(Venue, Venue.id == Show.venue_id)
+  rows = query.filter(*conditions).group_by(start).order_by(start)
+  return api_json({"bucket": bucket, "data": [{
+    "start": start.date().isoformat() if isinstance(start, datetime) else start,
+    "shows": count
+  } for start, count in rows]})
+
+@api.route('/shows/<int:show_id>')
+def api_show(show_id):
+  return api_detail(Show, show_id, SHOW_INCLUDES)
+
+app.register_blueprint(api)
+
+#  Commands
+#  ----------------------------------------------------------------
+
+@app.cli.command('refresh-show-counts')
+@click.option('--since', default=60, show_default=True,
+              help='Only recount venues and artists with shows that started in the last SINCE minutes.')
+@click.option('--all', 'recount_all', is_flag=True, help='Recount every venue and artist.')
+def refresh_show_counts_command(since, recount_all):
+  """
+    move shows that have started from the upcoming to the past counters, and
+    the area summaries of their venues along, run it periodically with a SINCE
+    at least as long as the interval
+  """
+  now = datetime.now()
+  if recount_all:
+    refresh_show_counts(db.session, now=now)
+    refresh_area_summaries(db.session)
+  else:
+    started = db.session.query(Show.venue_id, Show.artist_id)\
+                        .filter(Show.start_time > now - timedelta(minutes=since),
+                                Show.start_time <= now)\
+                        .all()
+    venue_ids = set(row.venue_id for row in started)
+    refresh_show_counts(db.session, venue_ids, set(row.artist_id for row in started), now=now)
+    refresh_area_summaries(db.session, venue_ids=venue_ids)
+  db.session.commit()
+  cache.invalidate('venues')
+  click.echo('Show counts refreshed.')
+
+@app.cli.command('refresh-rollups')
+def refresh_rollups_command():
+  """
+    rebuild the venue_area_summary table behind the /venues directory from the
+    venues, e.g. after writing to the database outside of the app
+  """
+  refresh_area_summaries(db.session)
+  db.session.commit()
+  cache.invalidate('venues')
+  areas = db.session.query(func.count()).select_from(VenueAreaSummary).scalar()
+  click.echo('{} venue areas summarised.'.format(areas))
+
+def venue_row(data):
+  return {
+    "name": data['name'],
+    "city": data['city'],
+    "state": data['state'],
+    "address": data['address'],
+    "phone": data['phone'],
+    "genres": data['genres'],
+    "facebook_link": data['facebook_link'],
+    "website": data['website'],
+    "image_link": data['image_link'],
+    "seeking_talent": bool(data['seeking_talent']),
+    "seeking_description": data['seeking_description'] or '',
+    # rows written in bulk bypass locate_venues
+    **venue_position(data['city'], data['state'], data['latitude'], data['longitude'])
+  }
+
+def artist_row(data):
+  return {
+    "name": data['name'],
+    "city": data['city'],
+    "state": data['state'],
+    "phone": data['phone'],
+    "genres": data['genres'],
+    "facebook_link": data['facebook_link'],
+    "website": data['website'],
+    "image_link": data['image_link'],
+    "seeking_venue": bool(data['seeking_venue']),
+    "seeking_description": data['seeking_description'] or ''
+  }
+
+def show_row(data):
+  return {
+    "start_time": data['start_time'],
+    "end_time": show_end_time(data['start_time'], data.get('end_time')),
+    "venue_id": int(data['venue_id']),
+    "artist_id": int(data['artist_id'])
+  }
+
+def resolve_references(records, model, key):
+  """
+    fill in <key>_id of show records that reference a venue or artist by name,
+    and check that every referenced id exists, with one query per batch
+    Parameters:
+        records (List) : (line number, record) tuples of one batch
+        model (Object) : Venue or Artist
+        key (String) : 'venue' or 'artist'
+    Returns:
+        errors (Dict) : line number -> error message for unresolved references
+  """
+  id_key, name_key = key + '_id', key + '_name'
+  ids = set()
+  names = set()
+  for number, record in records:
+    if record.get(id_key) not in (None, ''):
+      try:
+        ids.add(int(record[id_key]))
+      except (TypeError, ValueError):
+        pass
+    elif record.get(name_key):
+      names.add(record[name_key])
+
+  found = set()
+  by_name = {}
+  if ids or names:
+    for row in db.session.query(model.id, model.name)\
+                         .filter(or_(model.id.in_(ids), model.name.in_(names))):
+      found.add(row.id)
+      if row.name in names:
+        # a name shared by several rows is ambiguous
+        by_name[row.name] = None if row.name in by_name else row.id
+
+  errors = {}
+  for number, record in records:
+    if record.get(id_key) in (None, '') and record.get(name_key):
+      record[id_key] = by_name.get(record[name_key])
+      if record[id_key] is None:
+        errors[number] = 'unknown or ambiguous {} "{}"'.format(key, record[name_key])
+    else:
+      try:
+        if int(record.get(id_key)) not in found:
+          errors[number] = 'unknown {} id {}'.format(key, record.get(id_key))
+      except (TypeError, ValueError):
+        errors[number] = 'invalid {} id {}'.format(key, record.get(id_key))
+  return errors
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=5000, show_default=True, help='Records validated and inserted per batch.')
+def import_command(kind, path, batch_size):
+  """
+    load venues, artists or shows from a .csv or .jsonl file, validated like
+    the web forms; shows may reference venue_id/artist_id or venue_name/artist_name
+  """
+  model, form_class, build_row = {
+    'venues': (Venue, VenueForm, venue_row),
+    'artists': (Artist, ArtistForm, artist_row),
+    'shows': (Show, ShowForm, show_row),
+  }[kind]
+  validator = FormValidator(form_class)
+  report = ImportReport()
+
+  for batch in batches(read_records(path), batch_size):
+    report.read += len(batch)
+    errors = {}
+    if model is Show:
+      errors.update(resolve_references(batch, Venue, 'venue'))
+      errors.update(resolve_references(batch, Artist, 'artist'))
+
+    rows = []
+    numbers = []
+    for number, record in batch:
+      if number in errors:
+        report.reject(number, errors[number])
+        continue
+      data, form_errors = validator.validate(record)
+      if form_errors:
+        report.reject(number, form_errors)
+        continue
+      try:
+        rows.append(build_row(data))
+        numbers.append(number)
+      except ValueError as row_error:
+        report.reject(number, str(row_error))
+
+    if model is Show:
+      # double bookings, against the stored shows and within the batch, in one query
+      conflicts = show_conflicts(rows)
+      for index in sorted(conflicts):
+        report.reject(numbers[index], conflicts[index])
+      rows = [row for index, row in enumerate(rows) if index not in conflicts]
+      insert_rows(db.session, model.__table__, rows)
+      venue_ids = set(row['venue_id'] for row in rows)
+      refresh_show_counts(db.session, venue_ids, set(row['artist_id'] for row in rows))
+      refresh_area_summaries(db.session, venue_ids=venue_ids)
+      cache.invalidate(*['venue:' + str(row['venue_id']) for row in rows] +
+                        ['artist:' + str(row['artist_id']) for row in rows])
+    else:
+      insert_with_genres(db.session, model, rows)
+      if model is Venue:
+        refresh_area_summaries(db.session, set((row['state'], row['city']) for row in rows))
+    db.session.commit()
+    report.inserted += len(rows)
+
+  # rows written in bulk bypass the session hooks
+  if model is Show:
+    cache.invalidate('shows', 'venues')
+  else:
+    search.reindex(db.session, model.__tablename__)
+    db.session.commit()
+    suggestions.expire()
+    cache.invalidate(kind, 'shows')
+  click.echo(report.summary())
+
+@app.cli.command('export')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.option('--format', 'output_format', type=click.Choice(sorted(WRITERS)), default='jsonl', show_default=True)
+@click.option('--output', '-o', default='-', help='File to write, standard output by default.')
+@click.option('--joined', is_flag=True, help='For shows, add the venue and artist names and location.')
+@click.option('--chunk-size', default=None, type=int, help='Rows fetched per round trip, EXPORT_CHUNK_SIZE by default.')
+def export_command(kind, output_format, output, joined, chunk_size):
+  """
+    stream venues, artists or shows to a CSV, JSONL or Parquet file
+  """
+  query, columns = export_query(kind, joined)
+  writer_class = WRITERS[output_format]
+  if output == '-':
+    stream = sys.stdout.buffer if writer_class.binary else sys.stdout
+  else:
+    stream = open(output, 'wb') if writer_class.binary else open(output, 'w', newline='', encoding='utf-8')
+
+  report = ExportReport()
+  try:
+    writer = writer_class(stream, columns, [column['type'] for column in query.column_descriptions])
+    for chunk in stream_rows(query, chunk_size or app.config['EXPORT_CHUNK_SIZE']):
+      writer.write(chunk)
+      report.rows += len(chunk)
+    writer.close()
+  except RuntimeError as error:
+    raise click.ClickException(str(error))
+  finally:
+    if output != '-':
+      stream.close()
+  click.echo(report.summary(), err=True)
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -0,0 +1,293 @@
+#----------------------------------------------------------------------------#
+# ASGI entry point, e.g. "uvicorn asgi:application --workers 4".
+#
+# The read pages of venues and artists are served by coroutines on
+# SQLAlchemy's asyncio engine (asyncpg / aiosqlite), so one worker keeps
+# many requests in flight while they wait on the database, and the
+# independent queries of a page (the venue or artist, its genres, its past
+# and its upcoming shows) run concurrently. They share templates, page cache and
+# cache keys with the Flask views. Every other request is handed to the
+# Flask app in a thread, as a WSGI server would.
+#----------------------------------------------------------------------------#
+
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import render_template, request, session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import Map, Rule
+
+from app import app, cache, Venue, Artist, VenueAreaSummary, venue_areas, summary_areas
+from app import venue_shows, artist_shows, venue_page, artist_page
+from app import upcoming, venue_changes, artist_changes, changes_validators, genre_filter, genre_names, city_condition
+from cache import not_modified, set_validators
+from database import async_engine_options
+
+_engine = None
+executor = ThreadPoolExecutor(app.config['ASGI_WSGI_THREADS'], thread_name_prefix='wsgi')
+
+
+def get_engine():
+  """
+    the asyncio engine of this process, created in the running event loop
+  """
+  global _engine
+  if _engine is None:
+    url, options = async_engine_options(app.config)
+    _engine = create_async_engine(url, **options)
+    timeout = app.config['DB_STATEMENT_TIMEOUT']
+    if app.config['DB_PGBOUNCER'] and timeout:
+      event.listen(_engine.sync_engine, 'begin', lambda connection: connection.exec_driver_sql(
+        'SET LOCAL statement_timeout = {:d}'.format(timeout)))
+  return _engine
+
+
+async def fetch_all(statement):
+  # one connection per statement, so that the statements of a page run side by side
+  async with get_engine().connect() as connection:
+    return (await connection.execute(statement)).all()
+
+
+async def fetch_one(statement):
+  async with get_engine().connect() as connection:
+    return (await connection.execute(statement)).first()
+
+
+#----------------------------------------------------------------------------#
+# Async views.
+#----------------------------------------------------------------------------#
+
+async def venues():
+  genre = request.args.get('genre')
+  city, _, state = request.args.get('city', '').partition(',')
+  if not genre and not city.strip():
+    rows = await fetch_all(select(VenueAreaSummary.__table__)
+                           .order_by(VenueAreaSummary.state, VenueAreaSummary.city))
+    return render_template('pages/venues.html', areas=summary_areas(rows), genre=genre)
+  statement = select(Venue.id, Venue.name, Venue.city, Venue.state,
+                     Venue.upcoming_shows_count.label('num_upcoming_shows'))
+  if genre:
+    statement = statement.where(genre_filter(Venue, genre))
+  if city.strip():
+    statement = statement.where(city_condition(city.strip(), state.strip().upper()))
+  rows = await fetch_all(statement.order_by(Venue.state, Venue.city, Venue.name))
+  return render_template('pages/venues.html', areas=venue_areas(rows), genre=genre)
+
+
+async def show_venue(venue_id):
+  now = datetime.now()
+  venue, genres, past_shows, upcoming_shows = await asyncio.gather(
+    fetch_one(select(Venue.__table__).where(Venue.id == venue_id)),
+    fetch_all(genre_names(Venue, [venue_id])),
+    fetch_all(venue_shows(venue_id).where(~upcoming(now))),
+    fetch_all(venue_shows(venue_id).where(upcoming(now))))
+  if venue is None:
+    # the Flask view flashes and redirects
+    return None
+  return render_template('pages/show_venue.html',
+                         venue=venue_page(venue, [row.name for row in genres], past_shows, upcoming_shows))
+
+
+async def artists():
+  genre = request.args.get('genre')
+  statement = select(Artist.id, Artist.name)
+  if genre:
+    statement = statement.where(genre_filter(Artist, genre))
+  rows = await fetch_all(statement)
+  return render_template('pages/artists.html', artists=rows, genre=genre)
+
+
+async def show_artist(artist_id):
+  now = datetime.now()
+  artist, genres, past_shows, upcoming_shows = await asyncio.gather(
+    fetch_one(select(Artist.__table__).where(Artist.id == artist_id)),
+    fetch_all(genre_names(Artist, [artist_id])),
+    fetch_all(artist_shows(artist_id).where(~upcoming(now))),
+    fetch_all(artist_shows(artist_id).where(upcoming(now))))
+  if artist is None:
+    return None
+  return render_template('pages/show_artist.html',
+                         artist=artist_page(artist, [row.name for row in genres], past_shows, upcoming_shows))
+
+
+# endpoint -> view, page cache namespace and conditional request validators of the matching Flask view
+VIEWS = {
+  'venues': (venues, 'venues', None),
+  'show_venue': (show_venue, 'venue:{venue_id}', venue_changes),
+  'artists': (artists, 'artists', None),
+  'show_artist': (show_artist, 'artist:{artist_id}', artist_changes),
+}
+ROUTES = Map([
+  Rule('/venues', endpoint='venues', methods=['GET']),
+  Rule('/venues/<int:venue_id>', endpoint='show_venue', methods=['GET']),
+  Rule('/artists', endpoint='artists', methods=['GET']),
+  Rule('/artists/<int:artist_id>', endpoint='show_artist', methods=['GET']),
+])
+
+
+#----------------------------------------------------------------------------#
+# ASGI plumbing.
+#----------------------------------------------------------------------------#
+
+def wsgi_environ(scope, body):
+  """
+    WSGI environ of an ASGI http scope
+    Parameters:
+        scope (Dict) : ASGI connection scope
+        body (Bytes) : the whole request body
+  """
+  server = scope.get('server') or ('localhost', 80)
+  environ = {
+    'REQUEST_METHOD': scope['method'],
+    'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+    'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+    'QUERY_STRING': scope['query_string'].decode('latin-1'),
+    'SERVER_NAME': server[0],
+    'SERVER_PORT': str(server[1]),
+    'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+    'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+    'wsgi.version': (1, 0),
+    'wsgi.url_scheme': scope.get('scheme', 'http'),
+    'wsgi.input': io.BytesIO(body),
+    'wsgi.errors': sys.stderr,
+    'wsgi.multithread': True,
+    'wsgi.multiprocess': True,
+    'wsgi.run_once': False,
+  }
+  for name, value in scope['headers']:
+    name = name.decode('latin-1').upper().replace('-', '_')
+    value = value.decode('latin-1')
+    if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+      name = 'HTTP_' + name
+    environ[name] = environ[name] + ',' + value if name in environ else value
+  return environ
+
+
+async def read_body(receive):
+  body = b''
+  while True:
+    message = await receive()
+    body += message.get('body', b'')
+    if not message.get('more_body'):
+      return body
+
+
+def response_start(status, headers):
+  return {
+    'type': 'http.response.start',
+    'status': int(str(status).split()[0]),
+    'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+  }
+
+
+async def call_flask(environ, send):
+  """
+    run the Flask app on a thread, sending its response chunks as they come
+    so that streamed pages and exports stay streamed
+  """
+  loop = asyncio.get_running_loop()
+
+  def send_from_thread(message):
+    asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+  def run():
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+      if exc_info and started:
+        raise exc_info[1].with_traceback(exc_info[2])
+      started[:] = [status, headers]
+
+    result = app(environ, start_response)
+    try:
+      head_sent = False
+      for chunk in result:
+        if not head_sent:
+          send_from_thread(response_start(*started))
+          head_sent = True
+        if chunk:
+          send_from_thread({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+      if not head_sent:
+        send_from_thread(response_start(*started))
+      send_from_thread({'type': 'http.response.body', 'body': b''})
+    finally:
+      if hasattr(result, 'close'):
+        result.close()
+
+  await loop.run_in_executor(executor, run)
+
+
+async def call_view(environ, rule, arguments, send):
+  """
+    answer a request with an async view, through conditional request
+    handling and the page cache as the Flask view would
+    Returns:
+        answered (Boolean) : False when the Flask app has to answer instead
+  """
+  view, namespace, changes = VIEWS[rule.endpoint]
+  with app.request_context(environ) as context:
+    context.request.url_rule, context.request.view_args = rule, arguments
+    # pages with pending flash messages are rendered by Flask, which saves the session
+    if '_flashes' in session:
+      return False
+    response = app.preprocess_request()
+    if response is None:
+      found = changes_validators(await fetch_one(changes(**arguments))) if changes else None
+      if found is not None and not_modified(*found):
+        response = app.response_class(status=304)
+      else:
+        key, hit = cache.lookup([namespace.format(**arguments)]) if cache.enabled else (None, None)
+        if hit is not None:
+          response = app.response_class(*hit)
+        else:
+          rendered = await view(**arguments)
+          if rendered is None:
+            return False
+          response = app.make_response(rendered)
+          if key is not None:
+            cache.store(key, response)
+      if found is not None:
+        set_validators(response, *found)
+    response = app.process_response(app.make_response(response))
+    body = b'' if environ['REQUEST_METHOD'] == 'HEAD' else response.get_data()
+    status, headers = response.status, list(response.headers.items())
+
+  await send(response_start(status, headers))
+  await send({'type': 'http.response.body', 'body': body})
+  return True
+
+
+async def lifespan(receive, send):
+  while True:
+    message = await receive()
+    if message['type'] == 'lifespan.startup':
+      await send({'type': 'lifespan.startup.complete'})
+    elif message['type'] == 'lifespan.shutdown':
+      if _engine is not None:
+        await _engine.dispose()
+      executor.shutdown(wait=False)
+      await send({'type': 'lifespan.shutdown.complete'})
+      return
+
+
+async def application(scope, receive, send):
+  """
+    the ASGI application
+  """
+  if scope['type'] == 'lifespan':
+    return await lifespan(receive, send)
+  if scope['type'] != 'http':
+    return
+
+  environ = wsgi_environ(scope, await read_body(receive))
+  try:
+    rule, arguments = ROUTES.bind_to_environ(environ).match(return_rule=True)
+  except HTTPException:
+    rule = None
+  if rule is None or not await call_view(environ, rule, arguments, send):
+    environ['wsgi.input'].seek(0)
+    await call_flask(environ, send)
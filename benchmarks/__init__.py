@@ -0,0 +1,3 @@
+#----------------------------------------------------------------------------#
+# Route benchmarks, run with "python -m benchmarks.run", see README.md.
+#----------------------------------------------------------------------------#
@@ -0,0 +1,140 @@
+#----------------------------------------------------------------------------#
+# Deterministic synthetic data for the benchmarks.
+#
+# The same seed and counts always give the same venues, artists and shows;
+# show times are spread around an anchor day so that the split between past
+# and upcoming shows does not change with the time of day the suite runs.
+#----------------------------------------------------------------------------#
+
+import math
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import text
+
+CITIES = (
+  ('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('New York', 'NY'), ('Brooklyn', 'NY'),
+  ('Austin', 'TX'), ('Houston', 'TX'), ('Chicago', 'IL'), ('Seattle', 'WA'),
+  ('Portland', 'OR'), ('Nashville', 'TN'), ('New Orleans', 'LA'), ('Denver', 'CO'),
+)
+WORDS = ('Blue', 'Red', 'Golden', 'Silver', 'Velvet', 'Electric', 'Midnight', 'Sunset',
+         'Royal', 'Wild', 'Lucky', 'Little', 'Grand', 'Hidden', 'Neon', 'Old')
+VENUE_NOUNS = ('Room', 'Hall', 'Lounge', 'Club', 'Theatre', 'Tavern', 'Garden', 'Warehouse')
+ARTIST_NOUNS = ('Horses', 'Kings', 'Echoes', 'Rivers', 'Ghosts', 'Lights', 'Wolves', 'Saints')
+
+
+def create_schema(db):
+  """
+    create the tables, without the trigram indexes when pg_trgm cannot be installed
+    (e.g. on a bare PostgreSQL build without the contrib extensions)
+  """
+  engine = db.engine
+  if engine.dialect.name == 'postgresql':
+    try:
+      with engine.begin() as connection:
+        connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    except Exception:
+      for table in db.metadata.tables.values():
+        for index in [index for index in table.indexes if index.name.endswith('_trgm')]:
+          table.indexes.discard(index)
+  db.drop_all()
+  db.create_all()
+
+
+def generate(fyyur, venues=200, artists=400, shows=5000, seed=1, past_days=365, future_days=365, anchor=None):
+  """
+    fill an empty database with venues, artists and shows
+    Parameters:
+        fyyur (Object) : the app module
+        venues, artists, shows (Integer) : number of rows of each
+        seed (Integer) : random seed, the same seed gives the same rows
+        past_days, future_days (Integer) : range of show times around the anchor
+        anchor (datetime) : optional, defaults to midnight today
+    Returns:
+        counts (Dict) : rows inserted per table
+  """
+  import geo
+  from bulk import insert_rows, batches
+  from forms import VenueForm
+
+  rnd = random.Random(seed)
+  anchor = anchor or datetime.combine(datetime.now().date(), datetime.min.time())
+  genres = [value for value, label in VenueForm.genres.kwargs['choices']]
+  session = fyyur.db.session
+
+  def name(nouns, number):
+    return '{} {} {}'.format(rnd.choice(WORDS), rnd.choice(nouns), number)
+
+  def common(number, nouns):
+    city, state = rnd.choice(CITIES)
+    return {
+      "name": name(nouns, number),
+      "city": city,
+      "state": state,
+      "phone": '{:03d}-{:03d}-{:04d}'.format(rnd.randint(200, 999), rnd.randint(200, 999), rnd.randint(0, 9999)),
+      "genres": rnd.sample(genres, rnd.randint(1, 3)),
+      "image_link": 'https://images.example.com/{}.jpg'.format(rnd.getrandbits(32)),
+      "facebook_link": 'https://www.facebook.com/{}'.format(rnd.getrandbits(32)),
+      "website": 'https://example.com/{}'.format(number),
+      "seeking_description": rnd.choice(('', 'Looking for new acts')),
+    }
+
+  # venues spread over a disc of 20 km around their city centroid, from a
+  # generator of their own so the other rows stay the same
+  spread = random.Random(seed + 1)
+
+  def position(city, state):
+    latitude, longitude = geo.centroids.locate(city, state)
+    distance, bearing = 20 * math.sqrt(spread.random()), spread.uniform(0, 2 * math.pi)
+    latitude += distance * math.cos(bearing) / geo.KM_PER_DEGREE
+    longitude += distance * math.sin(bearing) / (geo.KM_PER_DEGREE * math.cos(math.radians(latitude)))
+    return fyyur.venue_position(city, state, latitude, longitude)
+
+  venue_rows = []
+  for number in range(1, venues + 1):
+    row = common(number, VENUE_NOUNS)
+    row.update(address='{} Main Street'.format(rnd.randint(1, 9999)), seeking_talent=rnd.random() < 0.3)
+    row.update(position(row['city'], row['state']))
+    venue_rows.append(row)
+  artist_rows = []
+  for number in range(1, artists + 1):
+    row = common(number, ARTIST_NOUNS)
+    row.update(seeking_venue=rnd.random() < 0.3)
+    artist_rows.append(row)
+
+  for model, rows in ((fyyur.Venue, venue_rows), (fyyur.Artist, artist_rows)):
+    for batch in batches(rows, 5000):
+      fyyur.insert_with_genres(session, model, batch)
+  session.commit()
+  venue_ids = [id for id, in session.query(fyyur.Venue.id).order_by(fyyur.Venue.id)]
+  artist_ids = [id for id, in session.query(fyyur.Artist.id).order_by(fyyur.Artist.id)]
+
+  span = (past_days + future_days) * 24 * 60
+  # shows of a venue or an artist may not overlap: draw again when the venue or
+  # the artist already plays within a show's length of the drawn half hour
+  length = math.ceil(fyyur.app.config['SHOW_DEFAULT_MINUTES'] / 30)
+  taken = set()
+
+  def show_row():
+    while True:
+      venue_id, artist_id, minutes = rnd.choice(venue_ids), rnd.choice(artist_ids), rnd.randrange(0, span, 30)
+      slots = [(key, minutes // 30 + offset) for key in (('venue', venue_id), ('artist', artist_id))
+               for offset in range(1 - length, length)]
+      if not taken.intersection(slots):
+        taken.update((key, minutes // 30) for key in (('venue', venue_id), ('artist', artist_id)))
+        # evening shows on the half hour, of the default length
+        start = anchor - timedelta(days=past_days) + timedelta(minutes=minutes)
+        return {"venue_id": venue_id, "artist_id": artist_id,
+                "start_time": start, "end_time": fyyur.show_end_time(start)}
+
+  show_rows = (show_row() for number in range(shows))
+  for batch in batches(show_rows, 5000):
+    insert_rows(session, fyyur.Show.__table__, batch)
+
+  # rows written in bulk bypass the session hooks
+  fyyur.refresh_show_counts(session)
+  fyyur.refresh_area_summaries(session)
+  for table in ('venue', 'artist'):
+    fyyur.search.reindex(session, table)
+  session.commit()
+  fyyur.suggestions.expire()
+  return {"venues": venues, "artists": artists, "shows": shows}
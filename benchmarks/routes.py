@@ -0,0 +1,159 @@
+#----------------------------------------------------------------------------#
+# One scenario per route: the request the benchmark sends to it.
+#
+# Scenarios are named after the view they exercise (a few views have more
+# than one), the runner warns about any view of the app without a scenario
+# so that new routes are not left out.
+#----------------------------------------------------------------------------#
+
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from urllib.parse import quote
+
+import geo
+from benchmarks.data import CITIES
+
+GENRES = ('Jazz', 'Rock n Roll', 'Hip-Hop', 'Folk', 'Classical')
+
+# endpoint: the view exercised, request: function(context) -> (method, url, form data or None)
+Scenario = namedtuple('Scenario', 'name endpoint request')
+
+
+class Context(object):
+  """
+    ids of the generated rows and a counter for unique names, passed to every scenario
+  """
+
+  def __init__(self, rnd, venue_ids, artist_ids, show_ids, disposable_venue_ids):
+    self.rnd = rnd
+    self.venue_ids = venue_ids
+    self.artist_ids = artist_ids
+    self.show_ids = show_ids
+    self.disposable_venue_ids = disposable_venue_ids
+    self.counter = 0
+
+  def venue(self):
+    return self.rnd.choice(self.venue_ids)
+
+  def artist(self):
+    return self.rnd.choice(self.artist_ids)
+
+  def show(self):
+    return self.rnd.choice(self.show_ids)
+
+  def genre(self):
+    return quote(self.rnd.choice(GENRES))
+
+  def point(self):
+    # a query string placing the visitor somewhere in one of the generated cities
+    latitude, longitude = geo.centroids.locate(*self.rnd.choice(CITIES))
+    return 'lat={:.4f}&lng={:.4f}'.format(latitude + self.rnd.uniform(-0.1, 0.1),
+                                          longitude + self.rnd.uniform(-0.1, 0.1))
+
+  def city(self):
+    return quote('{}, {}'.format(*self.rnd.choice(CITIES)))
+
+  def dates(self, days):
+    # a range of days among the upcoming shows of the generated data
+    start = date.today() + timedelta(days=self.rnd.randint(0, 300))
+    return 'from={}&to={}'.format(start, start + timedelta(days=days - 1))
+
+  def unique(self, prefix):
+    self.counter += 1
+    return '{} {}'.format(prefix, self.counter)
+
+  def ids(self, ids, count):
+    return ','.join(str(id) for id in self.rnd.sample(ids, min(count, len(ids))))
+
+
+def venue_form(context):
+  return {
+    "name": context.unique('Benchmark Venue'), "city": 'Austin', "state": 'TX',
+    "address": '1 Main Street', "phone": '512-555-0100', "genres": ['Jazz', 'Blues'],
+    "image_link": 'https://images.example.com/venue.jpg', "facebook_link": 'https://www.facebook.com/venue',
+    "website": 'https://example.com', "seeking_talent": 'y', "seeking_description": 'Open mic',
+  }
+
+
+def artist_form(context):
+  return {
+    "name": context.unique('Benchmark Artist'), "city": 'Austin', "state": 'TX',
+    "phone": '512-555-0101', "genres": ['Rock'],
+    "image_link": 'https://images.example.com/artist.jpg', "facebook_link": 'https://www.facebook.com/artist',
+    "website": 'https://example.com', "seeking_venue": 'y', "seeking_description": 'Touring',
+  }
+
+
+def show_form(context):
+  # three hours after the previous one, past the generated shows, so that it never
+  # overlaps another show of its venue or artist
+  context.counter += 1
+  return {
+    "venue_id": str(context.venue()), "artist_id": str(context.artist()),
+    "start_time": str(datetime(2030, 1, 1, 20) + timedelta(hours=3 * context.counter)),
+  }
+
+
+SCENARIOS = (
+  Scenario('home', 'index', lambda c: ('GET', '/', None)),
+
+  Scenario('venues', 'venues', lambda c: ('GET', '/venues', None)),
+  Scenario('venues_genre', 'venues', lambda c: ('GET', '/venues?genre={}'.format(c.genre()), None)),
+  Scenario('venues_city', 'venues', lambda c: ('GET', '/venues?city=' + c.city(), None)),
+  Scenario('venues_nearby', 'venues_nearby', lambda c: ('GET', '/venues/nearby?' + c.point(), None)),
+  Scenario('venue', 'show_venue', lambda c: ('GET', '/venues/{}'.format(c.venue()), None)),
+  Scenario('venue_calendar', 'venue_calendar', lambda c: ('GET', '/venues/{}/calendar.ics'.format(c.venue()), None)),
+  Scenario('venue_search', 'search_venues',
+           lambda c: ('POST', '/venues/search', {"search_term": c.rnd.choice(('blue', 'hall', 'grand ro'))})),
+  Scenario('venue_create_form', 'create_venue_form', lambda c: ('GET', '/venues/create', None)),
+  Scenario('venue_create', 'create_venue_submission', lambda c: ('POST', '/venues/create', venue_form(c))),
+  Scenario('venue_edit_form', 'edit_venue', lambda c: ('GET', '/venues/{}/edit'.format(c.venue()), None)),
+  Scenario('venue_edit', 'edit_venue_submission',
+           lambda c: ('POST', '/venues/{}/edit'.format(c.venue()), venue_form(c))),
+  Scenario('venue_delete', 'delete_venue',
+           lambda c: ('DELETE', '/venues/{}'.format(c.disposable_venue_ids.pop()), None)),
+
+  Scenario('artists', 'artists', lambda c: ('GET', '/artists', None)),
+  Scenario('artists_genre', 'artists', lambda c: ('GET', '/artists?genre={}'.format(c.genre()), None)),
+  Scenario('artist', 'show_artist', lambda c: ('GET', '/artists/{}'.format(c.artist()), None)),
+  Scenario('artist_calendar', 'artist_calendar', lambda c: ('GET', '/artists/{}/calendar.ics'.format(c.artist()), None)),
+  Scenario('artist_search', 'search_artists',
+           lambda c: ('POST', '/artists/search', {"search_term": c.rnd.choice(('wolves', 'kings', 'neon li'))})),
+  Scenario('artist_create_form', 'create_artist_form', lambda c: ('GET', '/artists/create', None)),
+  Scenario('artist_create', 'create_artist_submission', lambda c: ('POST', '/artists/create', artist_form(c))),
+  Scenario('artist_edit_form', 'edit_artist', lambda c: ('GET', '/artists/{}/edit'.format(c.artist()), None)),
+  Scenario('artist_edit', 'edit_artist_submission',
+           lambda c: ('POST', '/artists/{}/edit'.format(c.artist()), artist_form(c))),
+
+  Scenario('shows', 'shows', lambda c: ('GET', '/shows', None)),
+  Scenario('shows_all', 'shows', lambda c: ('GET', '/shows?all=1&per_page=100', None)),
+  Scenario('shows_range', 'shows', lambda c: ('GET', '/shows?' + c.dates(7), None)),
+  Scenario('shows_city', 'shows', lambda c: ('GET', '/shows?city=' + c.city(), None)),
+  Scenario('shows_nearby', 'shows_nearby', lambda c: ('GET', '/shows/nearby?' + c.point(), None)),
+  Scenario('show_create_form', 'create_shows', lambda c: ('GET', '/shows/create', None)),
+  Scenario('show_create', 'create_show_submission', lambda c: ('POST', '/shows/create', show_form(c))),
+
+  Scenario('suggest', 'search_suggest',
+           lambda c: ('GET', '/api/search/suggest?q={}'.format(c.rnd.choice(('bl', 'gra', 'neon', 'w'))), None)),
+  Scenario('export_shows', 'export_shows', lambda c: ('GET', '/api/export/shows.jsonl?joined=1', None)),
+
+  Scenario('api_venues', 'api_v1.api_venues', lambda c: ('GET', '/api/v1/venues?limit=100', None)),
+  Scenario('api_venues_genre', 'api_v1.api_venues',
+           lambda c: ('GET', '/api/v1/venues?limit=100&genre={}'.format(c.genre()), None)),
+  Scenario('api_venues_shows', 'api_v1.api_venues',
+           lambda c: ('GET', '/api/v1/venues?limit=100&fields=name,city&include=shows', None)),
+  Scenario('api_venue', 'api_v1.api_venue', lambda c: ('GET', '/api/v1/venues/{}'.format(c.venue()), None)),
+  Scenario('api_venues_batch_get', 'api_v1.api_venues_batch_get',
+           lambda c: ('GET', '/api/v1/venues:batchGet?ids={}'.format(c.ids(c.venue_ids, 200)), None)),
+  Scenario('api_artists', 'api_v1.api_artists', lambda c: ('GET', '/api/v1/artists?limit=100', None)),
+  Scenario('api_artist', 'api_v1.api_artist', lambda c: ('GET', '/api/v1/artists/{}'.format(c.artist()), None)),
+  Scenario('api_artists_batch_get', 'api_v1.api_artists_batch_get',
+           lambda c: ('GET', '/api/v1/artists:batchGet?ids={}&include=shows'.format(c.ids(c.artist_ids, 200)), None)),
+  Scenario('api_shows', 'api_v1.api_shows',
+           lambda c: ('GET', '/api/v1/shows?limit=100&include=venue,artist', None)),
+  Scenario('api_shows_calendar', 'api_v1.api_shows_calendar',
+           lambda c: ('GET', '/api/v1/shows:calendar?bucket=week&' + c.dates(90), None)),
+  Scenario('api_show', 'api_v1.api_show', lambda c: ('GET', '/api/v1/shows/{}'.format(c.show()), None)),
+
+  Scenario('metrics', 'metrics', lambda c: ('GET', '/metrics', None)),
+)
@@ -0,0 +1,378 @@
+#----------------------------------------------------------------------------#
+# Drive every route of the app through Flask's test client against freshly
+# generated data, and compare latency, queries and allocations per request
+# with the stored baseline.
+#
+#   python -m benchmarks.run                      # SQLite, compared with baseline.json
+#   python -m benchmarks.run --target postgres    # needs BENCH_POSTGRES_URL or pgserver
+#   python -m benchmarks.run --update-baseline    # accept the current numbers
+#
+# Each target runs in its own process, since the app binds its database when
+# it is imported. Scenarios are timed over several rounds and the median of the
+# fastest round is compared, so that a busy moment of the machine does not
+# count; timing regressions are measured a second time before being reported.
+# The exit status is 1 when a regression is found or a route answers 5xx.
+#----------------------------------------------------------------------------#
+
+import argparse
+import gc
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+TARGETS = ('sqlite', 'postgres')
+
+
+def percentile(values, rank):
+  ordered = sorted(values)
+  return ordered[max(int(math.ceil(rank / 100.0 * len(ordered))) - 1, 0)]
+
+
+def calibrate(repeat=5):
+  """
+    time a fixed workload of the kind the views do (an in-memory SQLite query,
+    rows to dicts, JSON), to tell a slower machine from a slower app
+    Returns:
+        ms (Float) : the fastest of repeat runs
+  """
+  import sqlite3
+  connection = sqlite3.connect(':memory:')
+  connection.execute('CREATE TABLE venue (id INTEGER PRIMARY KEY, name TEXT, city TEXT)')
+  connection.executemany('INSERT INTO venue (name, city) VALUES (?, ?)',
+                         [('Venue {}'.format(number), 'City {}'.format(number % 50)) for number in range(2000)])
+  timings = []
+  for _ in range(repeat):
+    started = time.perf_counter()
+    for _ in range(10):
+      rows = connection.execute('SELECT id, name, city FROM venue ORDER BY city, name').fetchall()
+      json.loads(json.dumps([{"id": id, "name": name, "city": city} for id, name, city in rows]))
+    timings.append((time.perf_counter() - started) * 1000)
+  connection.close()
+  return min(timings)
+
+
+def postgres_url(workdir):
+  """
+    the database to benchmark on PostgreSQL: BENCH_POSTGRES_URL (which is emptied),
+    or a throwaway server started with the pgserver package
+  """
+  if os.environ.get('BENCH_POSTGRES_URL'):
+    return os.environ['BENCH_POSTGRES_URL']
+  try:
+    import pgserver
+  except ImportError:
+    return None
+  server = pgserver.get_server(os.path.join(workdir, 'pgdata'), cleanup_mode='stop')
+  return server.get_uri()
+
+
+def load_app(database_url, cache_enabled):
+  """
+    import the app bound to the benchmark database, with debug and CSRF off
+  """
+  sys.path.insert(0, ROOT)
+  import config
+  config.SQLALCHEMY_DATABASE_URI = database_url
+  config.DEBUG = False
+  config.WTF_CSRF_ENABLED = False
+  config.CACHE_ENABLED = cache_enabled
+  config.INSTRUMENT_DEBUG_PANEL = False
+  config.METRICS_DIR = None
+  import app as fyyur
+  return fyyur
+
+
+def measure(options):
+  """
+    run every scenario on one target, in this process
+    Returns:
+        results (Dict) : {"dataset": {...}, "scenarios": {name: {...}}, "not_benchmarked": [...]}
+  """
+  from sqlalchemy import event
+  from sqlalchemy.engine import Engine
+
+  workdir = tempfile.mkdtemp(prefix='fyyur-bench-')
+  # the app logs to error.log in the working directory
+  os.chdir(workdir)
+  if options.worker == 'postgres':
+    url = postgres_url(workdir)
+    if url is None:
+      return {"skipped": 'set BENCH_POSTGRES_URL or pip install pgserver'}
+  else:
+    url = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+
+  fyyur = load_app(url, options.cache)
+  from benchmarks.data import create_schema, generate
+  from benchmarks.routes import SCENARIOS, Context
+
+  queries = [0]
+  event.listen(Engine, 'before_cursor_execute', lambda *args: queries.__setitem__(0, queries[0] + 1))
+
+  per_scenario = (options.warmup + options.requests) * options.rounds + options.allocation_requests
+  with fyyur.app.app_context():
+    create_schema(fyyur.db)
+    dataset = generate(fyyur, options.venues, options.artists, options.shows, options.seed)
+    session = fyyur.db.session
+    venue_ids = [id for id, in session.query(fyyur.Venue.id).order_by(fyyur.Venue.id)]
+    artist_ids = [id for id, in session.query(fyyur.Artist.id).order_by(fyyur.Artist.id)]
+    show_ids = [id for id, in session.query(fyyur.Show.id).order_by(fyyur.Show.id)]
+    # venues without shows, for the delete scenario
+    disposable = [fyyur.Venue(name='Disposable {}'.format(number), city='Austin', state='TX', address='1 Main Street',
+                              phone='512-555-0100', facebook_link='https://www.facebook.com/x', genres=['Jazz'])
+                  for number in range(per_scenario)]
+    session.add_all(disposable)
+    session.commit()
+    disposable_ids = [venue.id for venue in disposable]
+    session.remove()
+
+  context = Context(random.Random(options.seed), venue_ids, artist_ids, show_ids, disposable_ids)
+  client = fyyur.app.test_client()
+
+  def send(scenario):
+    method, url, data = scenario.request(context)
+    response = client.open(url, method=method, data=data)
+    response.get_data()
+    response.close()
+    return response.status_code
+
+  scenarios = [scenario for scenario in SCENARIOS if not options.only or scenario.name in options.only]
+  latencies = dict((scenario.name, []) for scenario in scenarios)
+  medians = dict((scenario.name, []) for scenario in scenarios)
+  counts = dict((scenario.name, []) for scenario in scenarios)
+  statuses = dict((scenario.name, Counter()) for scenario in scenarios)
+  # every scenario once per round, so that a slow spell of the machine hits
+  # one round of each rather than every request of one scenario
+  calibrations = []
+  for _ in range(options.rounds):
+    calibrations.append(calibrate())
+    for scenario in scenarios:
+      for _ in range(options.warmup):
+        send(scenario)
+
+      timings = []
+      # as timeit does, keep collector pauses out of the timings
+      gc.collect()
+      gc.disable()
+      try:
+        for _ in range(options.requests):
+          queries[0] = 0
+          started = time.perf_counter()
+          statuses[scenario.name][send(scenario)] += 1
+          timings.append((time.perf_counter() - started) * 1000)
+          counts[scenario.name].append(queries[0])
+      finally:
+        gc.enable()
+      latencies[scenario.name].extend(timings)
+      medians[scenario.name].append(statistics.median(timings))
+
+  results = {}
+  for scenario in scenarios:
+    allocations = []
+    tracemalloc.start()
+    for _ in range(options.allocation_requests):
+      tracemalloc.reset_peak()
+      before = tracemalloc.get_traced_memory()[0]
+      send(scenario)
+      allocations.append((tracemalloc.get_traced_memory()[1] - before) / 1024.0)
+    tracemalloc.stop()
+
+    results[scenario.name] = {
+      "status": statuses[scenario.name].most_common(1)[0][0],
+      "server_errors": sum(count for status, count in statuses[scenario.name].items() if status >= 500),
+      # the median of the fastest round
+      "p50": round(min(medians[scenario.name]), 3),
+      "p95": round(percentile(latencies[scenario.name], 95), 3),
+      "p99": round(percentile(latencies[scenario.name], 99), 3),
+      "queries": int(statistics.median(counts[scenario.name])),
+      "alloc_kib": round(statistics.median(allocations), 1) if allocations else None,
+    }
+
+  endpoints = set(rule.endpoint for rule in fyyur.app.url_map.iter_rules()) - {'static'}
+  return {
+    "dataset": dataset,
+    "calibration_ms": round(min(calibrations), 3),
+    "scenarios": results,
+    "not_benchmarked": sorted(endpoints - set(scenario.endpoint for scenario in SCENARIOS)),
+  }
+
+
+def compare(target, current, baseline, options):
+  """
+    Returns:
+        regressions (List) : (scenario, message, timing) tuples, one per regressed measure,
+                             timing telling the latency ones apart
+  """
+  regressions = []
+  # the baseline timings as this machine would measure them now
+  speed = machine_speed(current, baseline)
+  for name, now in current['scenarios'].items():
+    before = baseline['scenarios'].get(name)
+    if before is None or now['server_errors']:
+      continue
+    if now['status'] != before['status']:
+      regressions.append((name, '{} {}: status {} -> {}'.format(target, name, before['status'], now['status']), False))
+    if now['queries'] > before['queries']:
+      regressions.append((name, '{} {}: {} -> {} queries per request'.format(
+        target, name, before['queries'], now['queries']), False))
+    # the median is steady enough for a tight bound, the tail only catches blowups
+    for measure, tolerance, slack in (('p50', options.tolerance, options.slack_ms),
+                                      ('p95', options.tail_tolerance, options.tail_slack_ms)):
+      expected = before[measure] * speed
+      if now[measure] > expected * (1 + tolerance) and now[measure] - expected > slack:
+        regressions.append((name, '{} {}: {} {:.1f} -> {:.1f} ms'.format(
+          target, name, measure, expected, now[measure]), True))
+    if now['alloc_kib'] is not None and before.get('alloc_kib') is not None \
+        and now['alloc_kib'] > before['alloc_kib'] * (1 + options.tolerance) \
+        and now['alloc_kib'] - before['alloc_kib'] > options.slack_kib:
+      regressions.append((name, '{} {}: {:.0f} -> {:.0f} KiB allocated'.format(
+        target, name, before['alloc_kib'], now['alloc_kib']), False))
+  return regressions
+
+
+def machine_speed(current, baseline):
+  """
+    how much slower this run's machine is than the baseline's, from the calibration workload
+    Returns:
+        ratio (Float) : 1 when either run has no calibration
+  """
+  if not current.get('calibration_ms') or not baseline.get('calibration_ms'):
+    return 1.0
+  return current['calibration_ms'] / baseline['calibration_ms']
+
+
+def run_worker(target, args):
+  """
+    measure one target in a child process
+    Returns:
+        results (Dict) : as measure() returns them, None when the run failed
+  """
+  child = subprocess.run([sys.executable, '-m', 'benchmarks.run', '--worker', target] + args,
+                         cwd=ROOT, stdout=subprocess.PIPE)
+  if child.returncode:
+    return None
+  return json.loads(child.stdout.decode())
+
+
+def report(target, current, baseline):
+  print('\n{} ({venues} venues, {artists} artists, {shows} shows), calibration {:.1f} ms'.format(
+    target, current.get('calibration_ms', 0), **current['dataset']))
+  print('{:<24} {:>6} {:>9} {:>9} {:>9} {:>8} {:>10} {:>9}'.format(
+    'scenario', 'status', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'alloc KiB', 'vs p50'))
+  speed = machine_speed(current, baseline) if baseline else 1.0
+  for name, row in current['scenarios'].items():
+    before = (baseline or {}).get('scenarios', {}).get(name)
+    change = '{:+.0f}%'.format((row['p50'] / (before['p50'] * speed) - 1) * 100) if before and before['p50'] else ''
+    print('{:<24} {:>6} {:>9.2f} {:>9.2f} {:>9.2f} {:>8} {:>10} {:>9}'.format(
+      name, row['status'], row['p50'], row['p95'], row['p99'], row['queries'],
+      '' if row['alloc_kib'] is None else '{:.1f}'.format(row['alloc_kib']), change))
+  if current['not_benchmarked']:
+    print('WARNING: routes without a scenario in benchmarks/routes.py: ' + ', '.join(current['not_benchmarked']))
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='benchmark every route of the app')
+  parser.add_argument('--target', action='append', choices=TARGETS,
+                      help='database to run against, may be repeated (default: sqlite)')
+  parser.add_argument('--venues', type=int, default=200)
+  parser.add_argument('--artists', type=int, default=400)
+  parser.add_argument('--shows', type=int, default=5000)
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--requests', type=int, default=30, help='timed requests per scenario and round')
+  parser.add_argument('--rounds', type=int, default=3, help='rounds over all the scenarios, the fastest counts')
+  parser.add_argument('--no-recheck', dest='recheck', action='store_false',
+                      help='report timing regressions without measuring them a second time')
+  parser.add_argument('--warmup', type=int, default=3)
+  parser.add_argument('--allocation-requests', type=int, default=3,
+                      help='extra requests per scenario run under tracemalloc')
+  parser.add_argument('--only', action='append', help='scenario to run, may be repeated')
+  parser.add_argument('--cache', action='store_true', help='keep the page cache on')
+  parser.add_argument('--baseline', default=BASELINE)
+  parser.add_argument('--update-baseline', action='store_true')
+  parser.add_argument('--tolerance', type=float, default=0.3, help='allowed p50 and allocation growth')
+  parser.add_argument('--tail-tolerance', type=float, default=1.0, help='allowed p95 growth')
+  parser.add_argument('--slack-ms', type=float, default=2.0, help='p50 growth always allowed')
+  parser.add_argument('--tail-slack-ms', type=float, default=10.0, help='p95 growth always allowed')
+  parser.add_argument('--slack-kib', type=float, default=64.0, help='allocation growth always allowed')
+  parser.add_argument('--worker', choices=TARGETS, help=argparse.SUPPRESS)
+  options = parser.parse_args(argv)
+
+  if options.worker:
+    # views print their errors, keep stdout for the results
+    results, sys.stdout = sys.stdout, sys.stderr
+    json.dump(measure(options), results)
+    return 0
+
+  baselines = {}
+  if os.path.exists(options.baseline):
+    with open(options.baseline) as source:
+      baselines = json.load(source)
+
+  regressions, failures = [], []
+  args = [arg for arg in (argv if argv is not None else sys.argv[1:]) if arg != '--update-baseline']
+  for target in options.target or ['sqlite']:
+    current = run_worker(target, args)
+    if current is None:
+      print('{}: benchmark run failed'.format(target))
+      return 1
+    if 'skipped' in current:
+      print('\n{}: skipped, {}'.format(target, current['skipped']))
+      continue
+
+    baseline = baselines.get(target)
+    if baseline and baseline['dataset'] != current['dataset']:
+      print('\n{}: baseline was measured on another dataset, not compared'.format(target))
+      baseline = None
+    # a route that fails is broken, not slow or fast
+    failures.extend('{} {}: {} of the requests answered 5xx'.format(target, name, row['server_errors'])
+                    for name, row in current['scenarios'].items() if row['server_errors'])
+    if baseline and not options.only:
+      found = compare(target, current, baseline, options)
+      slow = sorted(set(name for name, message, timing in found if timing))
+      if slow and options.recheck:
+        # a regression is real when a second run shows it too, keep the faster timings
+        again = run_worker(target, args + [arg for name in slow for arg in ('--only', name)])
+        for name in slow:
+          row, other = current['scenarios'][name], (again or {}).get('scenarios', {}).get(name)
+          if other:
+            # on the machine speed of the first run
+            speed = machine_speed(current, again)
+            for column in ('p50', 'p95', 'p99'):
+              row[column] = round(min(row[column], other[column] * speed), 3)
+        found = compare(target, current, baseline, options)
+      regressions.extend(message for name, message, timing in found)
+    report(target, current, baseline)
+    if options.update_baseline:
+      baselines[target] = {"dataset": current['dataset'], "calibration_ms": current['calibration_ms'],
+                           "scenarios": current['scenarios']}
+
+  if failures:
+    print('\nFAILED, server errors')
+    for failure in failures:
+      print('  ' + failure)
+    return 1
+  if options.update_baseline:
+    with open(options.baseline, 'w') as target:
+      json.dump(baselines, target, indent=2, sort_keys=True)
+      target.write('\n')
+    print('\nbaseline written to ' + options.baseline)
+    return 0
+  if regressions:
+    print('\nREGRESSIONS against ' + options.baseline)
+    for regression in regressions:
+      print('  ' + regression)
+    return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
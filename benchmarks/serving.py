@@ -0,0 +1,188 @@
+#----------------------------------------------------------------------------#
+# Compare the WSGI server of app.run() with the ASGI entry point (asgi.py
+# under uvicorn) on the same generated data: requests/sec, latency and
+# requests per second of server CPU time, i.e. per core.
+#
+#   python -m benchmarks.serving
+#   python -m benchmarks.serving --path '/artists/{artist}' --concurrency 64 --seconds 20
+#
+# Both servers run as one process with the page cache off. A small asyncio
+# client keeps --concurrency requests in flight for --seconds on each.
+#----------------------------------------------------------------------------#
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.run import ROOT, load_app, percentile, postgres_url
+
+SERVERS = ('wsgi', 'asgi')
+
+
+def serve(kind, database_url, port):
+  """
+    run one server in this process until it is killed
+  """
+  os.chdir(tempfile.mkdtemp(prefix='fyyur-serve-'))
+  fyyur = load_app(database_url, cache_enabled=False)
+  if kind == 'wsgi':
+    fyyur.app.run(port=port, threaded=True, use_reloader=False)
+  else:
+    import uvicorn
+    import asgi
+    uvicorn.run(asgi.application, port=port, log_level='warning')
+
+
+def cpu_seconds(pid):
+  # utime + stime of a process, in clock ticks, from /proc (Linux only)
+  try:
+    with open('/proc/{}/stat'.format(pid)) as source:
+      fields = source.read().rsplit(')', 1)[1].split()
+  except OSError:
+    return None
+  return (int(fields[11]) + int(fields[12])) / float(os.sysconf('SC_CLK_TCK'))
+
+
+def free_port():
+  with socket.socket() as probe:
+    probe.bind(('127.0.0.1', 0))
+    return probe.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+  deadline = time.time() + timeout
+  while time.time() < deadline:
+    try:
+      socket.create_connection(('127.0.0.1', port), 0.2).close()
+      return
+    except OSError:
+      time.sleep(0.1)
+  raise RuntimeError('server on port {} did not start'.format(port))
+
+
+async def fetch(port, path):
+  reader, writer = await asyncio.open_connection('127.0.0.1', port)
+  writer.write('GET {} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.format(path).encode())
+  await writer.drain()
+  response = await reader.read()
+  writer.close()
+  return int(response.split(b' ', 2)[1])
+
+
+async def load(port, paths, concurrency, seconds):
+  """
+    keep concurrency requests in flight for seconds
+    Returns:
+        latencies, errors (Tuple) : milliseconds of the answered requests, and failed requests
+  """
+  latencies = []
+  errors = [0]
+  deadline = time.perf_counter() + seconds
+
+  async def client(number):
+    rnd = random.Random(number)
+    while time.perf_counter() < deadline:
+      started = time.perf_counter()
+      try:
+        status = await fetch(port, rnd.choice(paths))
+      except OSError:
+        status = None
+      if status == 200:
+        latencies.append((time.perf_counter() - started) * 1000)
+      else:
+        errors[0] += 1
+
+  await asyncio.gather(*[client(number) for number in range(concurrency)])
+  return latencies, errors[0]
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='compare the WSGI and ASGI servers of the app')
+  parser.add_argument('--target', choices=('sqlite', 'postgres'), default='sqlite')
+  parser.add_argument('--path', action='append',
+                      help="path to request, {venue} and {artist} take generated ids "
+                           "(default: /venues/{venue} and /artists/{artist})")
+  parser.add_argument('--concurrency', type=int, default=32)
+  parser.add_argument('--seconds', type=float, default=10)
+  parser.add_argument('--venues', type=int, default=200)
+  parser.add_argument('--artists', type=int, default=400)
+  parser.add_argument('--shows', type=int, default=5000)
+  parser.add_argument('--serve', choices=SERVERS, help=argparse.SUPPRESS)
+  parser.add_argument('--database', help=argparse.SUPPRESS)
+  parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+  options = parser.parse_args(argv)
+
+  if options.serve:
+    serve(options.serve, options.database, options.port)
+    return 0
+
+  workdir = tempfile.mkdtemp(prefix='fyyur-bench-')
+  database_url = postgres_url(workdir) if options.target == 'postgres' else \
+    'sqlite:///' + os.path.join(workdir, 'bench.db')
+  if database_url is None:
+    print('postgres: set BENCH_POSTGRES_URL or pip install pgserver')
+    return 1
+  cwd = os.getcwd()
+  os.chdir(workdir)
+  fyyur = load_app(database_url, cache_enabled=False)
+  from benchmarks.data import create_schema, generate
+  with fyyur.app.app_context():
+    create_schema(fyyur.db)
+    generate(fyyur, options.venues, options.artists, options.shows)
+  os.chdir(cwd)
+
+  templates = options.path or ['/venues/{venue}', '/artists/{artist}']
+  paths = [template.format(venue=number % options.venues + 1, artist=number % options.artists + 1)
+           for template in templates for number in range(max(options.venues, options.artists))]
+
+  results = {}
+  for kind in SERVERS:
+    port = free_port()
+    server = subprocess.Popen([sys.executable, '-m', 'benchmarks.serving', '--serve', kind,
+                               '--database', database_url, '--port', str(port)],
+                              cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+      wait_for(port)
+      asyncio.run(load(port, paths[:20], 4, 1))
+      cpu_before = cpu_seconds(server.pid)
+      started = time.perf_counter()
+      latencies, errors = asyncio.run(load(port, paths, options.concurrency, options.seconds))
+      elapsed = time.perf_counter() - started
+      cpu_after = cpu_seconds(server.pid)
+    finally:
+      server.terminate()
+      server.wait()
+    cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    results[kind] = {
+      "requests": len(latencies),
+      "errors": errors,
+      "rps": len(latencies) / elapsed,
+      "p50": percentile(latencies, 50) if latencies else 0,
+      "p99": percentile(latencies, 99) if latencies else 0,
+      "cpu": cpu,
+      "per_core": len(latencies) / cpu if cpu else None,
+    }
+
+  print('\n{} ({} venues, {} artists, {} shows), {} clients for {:.0f}s on {}'.format(
+    options.target, options.venues, options.artists, options.shows, options.concurrency,
+    options.seconds, ', '.join(templates)))
+  print('{:<6} {:>9} {:>7} {:>9} {:>9} {:>9} {:>10} {:>14}'.format(
+    'server', 'requests', 'errors', 'req/s', 'p50 ms', 'p99 ms', 'CPU s', 'req/s per core'))
+  for kind, row in results.items():
+    print('{:<6} {:>9} {:>7} {:>9.1f} {:>9.2f} {:>9.2f} {:>10} {:>14}'.format(
+      kind, row['requests'], row['errors'], row['rps'], row['p50'], row['p99'],
+      '' if row['cpu'] is None else '{:.2f}'.format(row['cpu']),
+      '' if row['per_core'] is None else '{:.1f}'.format(row['per_core'])))
+  if results['wsgi']['per_core'] and results['asgi']['per_core']:
+    print('asgi / wsgi requests per core: {:.2f}x'.format(results['asgi']['per_core'] / results['wsgi']['per_core']))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,336 @@
+#----------------------------------------------------------------------------#
+# Bulk loading and export of venues, artists and shows.
+#
+# Imports stream CSV / JSONL files record by record, validate them with the
+# same WTForms forms as the web pages and write them in batches: COPY on
+# PostgreSQL, one executemany INSERT elsewhere.
+# Exports stream rows from a server-side cursor in chunks into CSV, JSONL or
+# Parquet (with the optional pyarrow package), one chunk in memory at a time.
+#----------------------------------------------------------------------------#
+
+import csv
+import io
+import json
+import resource
+import time
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from werkzeug.datastructures import MultiDict
+from wtforms import BooleanField
+
+# columns holding several values, written as 'Jazz;Blues' in CSV files
+LIST_FIELDS = ('genres',)
+TRUE_VALUES = ('y', 'yes', 'true', 't', '1')
+# the format DateTimeField accepts, so that exports can be imported again
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def read_records(path):
+  """
+    stream the records of a .csv or .jsonl file
+    Parameters:
+        path (String) : file path, the format is taken from the extension
+    Returns:
+        records (Generator) : (line number, dict) tuples
+  """
+  with open(path, newline='', encoding='utf-8') as source:
+    if path.endswith('.jsonl') or path.endswith('.ndjson'):
+      for number, line in enumerate(source, 1):
+        if line.strip():
+          yield number, json.loads(line)
+    elif path.endswith('.csv'):
+      # line 1 is the header
+      for number, record in enumerate(csv.DictReader(source), 2):
+        for field in LIST_FIELDS:
+          if record.get(field):
+            record[field] = [value.strip() for value in record[field].split(';') if value.strip()]
+        yield number, record
+    else:
+      raise ValueError('unsupported file type, expected .csv or .jsonl: ' + path)
+
+
+def batches(records, size):
+  """
+    group an iterable into lists of at most size items
+  """
+  records = iter(records)
+  while True:
+    batch = list(islice(records, size))
+    if not batch:
+      return
+    yield batch
+
+
+class FormValidator(object):
+  """
+    validate plain records with a form class, without a request or CSRF token
+    Parameters:
+        form_class (Object) : e.g. VenueForm
+  """
+
+  def __init__(self, form_class):
+    # one form is reused for every record, building a form is the costly part
+    self.form = form_class(formdata=None, meta={'csrf': False})
+
+  def validate(self, record):
+    """
+      Returns:
+          data, errors (Tuple) : the form data, and a dict of errors or None when valid
+    """
+    formdata = MultiDict()
+    for key, value in record.items():
+      if value is None or key not in self.form:
+        continue
+      if isinstance(self.form[key], BooleanField):
+        # a checkbox is only submitted when checked
+        if value is True or str(value).strip().lower() in TRUE_VALUES:
+          formdata.add(key, 'y')
+        continue
+      for item in (value if isinstance(value, list) else [value]):
+        formdata.add(key, str(item))
+    self.form.process(formdata)
+    if self.form.validate():
+      return self.form.data, None
+    return self.form.data, dict(self.form.errors)
+
+
+def insert_rows(session, table, rows):
+  """
+    insert a batch of rows into a table in one round trip
+    Parameters:
+        session (Object) : session whose connection is used
+        table (Object) : SQLAlchemy Table
+        rows (List) : dicts of column values, all with the same keys
+  """
+  if not rows:
+    return
+  connection = session.connection()
+  if connection.dialect.name == 'postgresql':
+    columns = list(rows[0].keys())
+    buffer = io.StringIO()
+    for row in rows:
+      buffer.write(','.join(copy_field(row[column]) for column in columns) + '\n')
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+      cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+        connection.dialect.identifier_preparer.format_table(table),
+        ', '.join(connection.dialect.identifier_preparer.quote(column) for column in columns)), buffer)
+    finally:
+      cursor.close()
+  else:
+    session.execute(table.insert(), rows)
+
+
+def copy_field(value):
+  """
+    a value as a COPY csv field: quoted, so that an empty string stays one,
+    and None as the unquoted empty field COPY reads as NULL
+  """
+  if value is None:
+    return ''
+  return '"' + str(value).replace('"', '""') + '"'
+
+
+def upsert_rows(session, table, rows, keys):
+  """
+    insert a batch of rows into a table, or update those already there, in one round trip
+    Parameters:
+        session (Object) : session whose connection is used
+        table (Object) : SQLAlchemy Table
+        rows (List) : dicts of column values, all with the same keys
+        keys (List) : names of the columns of the primary key or of a unique index
+  """
+  if not rows:
+    return
+  dialect = session.connection().dialect.name
+  insert = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}[dialect](table)
+  session.execute(insert.on_conflict_do_update(
+    index_elements=keys,
+    set_={column: insert.excluded[column] for column in rows[0] if column not in keys}), rows)
+
+
+def reserve_ids(session, table, count):
+  """
+    ids for rows about to be inserted in bulk, so that rows referencing them
+    can be written in the same batch
+    Parameters:
+        session (Object) : session whose connection is used
+        table (Object) : SQLAlchemy Table with an integer id primary key
+        count (Integer) : number of ids
+    Returns:
+        ids (List) : unused ids, in increasing order
+  """
+  connection = session.connection()
+  if connection.dialect.name == 'postgresql':
+    return [id for id, in connection.execute(
+      text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+      {'table': table.name, 'count': count})]
+  # SQLite lets one writer at a time in, the ids after the largest are free
+  last = connection.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar()
+  return list(range(last + 1, last + count + 1))
+
+
+class ImportReport(object):
+  """
+    counts and timing of an import
+    Parameters:
+        max_errors (Integer) : number of rejected records whose errors are kept
+  """
+
+  def __init__(self, max_errors=20):
+    self.max_errors = max_errors
+    self.read = 0
+    self.inserted = 0
+    self.rejected = 0
+    self.errors = []
+    self.started = time.perf_counter()
+
+  def reject(self, number, errors):
+    self.rejected += 1
+    if len(self.errors) < self.max_errors:
+      self.errors.append((number, errors))
+
+  @property
+  def elapsed(self):
+    return time.perf_counter() - self.started
+
+  def summary(self):
+    lines = ['{} records read, {} inserted, {} rejected in {:.2f}s ({:.0f} rows/s)'.format(
+      self.read, self.inserted, self.rejected, self.elapsed,
+      self.inserted / self.elapsed if self.elapsed else 0)]
+    for number, errors in self.errors:
+      lines.append('  line {}: {}'.format(number, errors))
+    if self.rejected > len(self.errors):
+      lines.append('  ... {} more rejected records'.format(self.rejected - len(self.errors)))
+    return '\n'.join(lines)
+
+
+def text_value(value):
+  if isinstance(value, datetime):
+    return value.strftime(DATETIME_FORMAT)
+  return value
+
+
+class CSVWriter(object):
+  """
+    write rows as CSV with a header line
+  """
+  binary = False
+
+  def __init__(self, stream, columns, types=None):
+    self.writer = csv.writer(stream)
+    self.writer.writerow(columns)
+
+  def write(self, rows):
+    self.writer.writerows([text_value(value) for value in row] for row in rows)
+
+  def close(self):
+    pass
+
+
+class JSONLWriter(object):
+  """
+    write rows as one JSON object per line
+  """
+  binary = False
+
+  def __init__(self, stream, columns, types=None):
+    self.stream = stream
+    self.columns = columns
+
+  def write(self, rows):
+    self.stream.write(''.join(
+      json.dumps(dict(zip(self.columns, row)), default=text_value) + '\n' for row in rows))
+
+  def close(self):
+    pass
+
+
+class ParquetWriter(object):
+  """
+    write rows as a Parquet file, one row group per chunk, needs pyarrow
+    Parameters:
+        types (List) : SQLAlchemy types of the columns, so that the schema does
+                       not depend on the values of the first chunk
+  """
+  binary = True
+
+  def __init__(self, stream, columns, types=None):
+    try:
+      import pyarrow
+      import pyarrow.parquet
+    except ImportError:
+      raise RuntimeError('the parquet format needs the pyarrow package, pip install pyarrow')
+    arrow_types = {int: pyarrow.int64(), str: pyarrow.string(), bool: pyarrow.bool_(),
+                   float: pyarrow.float64(), datetime: pyarrow.timestamp('us')}
+    self.pyarrow = pyarrow
+    self.schema = None
+    if types:
+      # text for the types without a mapping, e.g. an untyped SQL expression
+      self.schema = pyarrow.schema([(column, arrow_types.get(self._python_type(type_), pyarrow.string()))
+                                    for column, type_ in zip(columns, types)])
+    self.stream = stream
+    self.columns = columns
+    self.writer = None
+
+  @staticmethod
+  def _python_type(type_):
+    try:
+      return type_.python_type
+    except NotImplementedError:
+      return None
+
+  def write(self, rows):
+    if self.schema is not None:
+      table = self.pyarrow.Table.from_pylist([dict(zip(self.columns, row)) for row in rows], schema=self.schema)
+    else:
+      table = self.pyarrow.Table.from_arrays(
+        [self.pyarrow.array(values) for values in zip(*rows)], names=self.columns)
+    if self.writer is None:
+      self.writer = self.pyarrow.parquet.ParquetWriter(self.stream, table.schema)
+    self.writer.write_table(table)
+
+  def close(self):
+    if self.writer is not None:
+      self.writer.close()
+
+
+WRITERS = {
+  'csv': CSVWriter,
+  'jsonl': JSONLWriter,
+  'parquet': ParquetWriter,
+}
+
+
+def stream_rows(query, chunk_size):
+  """
+    run a query on a server-side cursor and yield its rows in chunks
+    Parameters:
+        query (Object) : SQLAlchemy Query selecting plain columns
+        chunk_size (Integer) : rows fetched per round trip
+    Returns:
+        chunks (Generator) : lists of row tuples
+  """
+  rows = query.execution_options(stream_results=True).yield_per(chunk_size)
+  for chunk in batches((tuple(row) for row in rows), chunk_size):
+    yield chunk
+
+
+class ExportReport(object):
+  """
+    rows, throughput and peak memory of an export
+  """
+
+  def __init__(self):
+    self.rows = 0
+    self.started = time.perf_counter()
+
+  def summary(self):
+    elapsed = time.perf_counter() - self.started
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return '{} rows exported in {:.2f}s ({:.0f} rows/s), peak RSS {:.1f} MB'.format(
+      self.rows, elapsed, self.rows / elapsed if elapsed else 0, peak)
@@ -0,0 +1,197 @@
+#----------------------------------------------------------------------------#
+# Response cache for read pages, and HTTP conditional request handling.
+#
+# Cached pages are filed under namespaces such as 'venues' or 'venue:3'.
+# Every namespace has a version counter that is part of the cache key, so
+# invalidating a namespace is a single INCR and stale pages simply stop
+# being addressed and age out. Backends only need the get / setex / incr /
+# delete subset of the Redis API, so a redis.Redis client (or a fake of
+# one) can be used as is in place of the in-process MemoryBackend.
+#----------------------------------------------------------------------------#
+
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, session, make_response, Response
+
+
+class MemoryBackend(object):
+  """
+    in-process LRU with per entry expiry
+    Parameters:
+        max_entries (Integer) : number of entries kept before evicting the least recently used
+  """
+
+  def __init__(self, max_entries=1024):
+    self.max_entries = max_entries
+    self._entries = OrderedDict()
+    # version counters are kept apart so that eviction never resets them
+    self._counters = {}
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      if key in self._counters:
+        return str(self._counters[key]).encode()
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      expires_at, value = entry
+      if expires_at < time.time():
+        del self._entries[key]
+        return None
+      self._entries.move_to_end(key)
+      return value
+
+  def setex(self, key, ttl, value):
+    with self._lock:
+      self._entries[key] = (time.time() + ttl, value)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+    return True
+
+  def incr(self, key, amount=1):
+    with self._lock:
+      self._counters[key] = self._counters.get(key, 0) + amount
+      return self._counters[key]
+
+  def delete(self, *keys):
+    with self._lock:
+      deleted = 0
+      for key in keys:
+        deleted += self._entries.pop(key, None) is not None
+        deleted += self._counters.pop(key, None) is not None
+      return deleted
+
+
+class ResponseCache(object):
+  """
+    caches GET responses of views by url, under the namespaces they depend on
+  """
+
+  def __init__(self, app=None, backend=None):
+    self.backend = backend
+    self.hits = 0
+    self.misses = 0
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.enabled = app.config.get('CACHE_ENABLED', True)
+    self.ttl = app.config.get('CACHE_DEFAULT_TTL', 60)
+    self.prefix = app.config.get('CACHE_KEY_PREFIX', 'fyyur:')
+    if self.backend is None:
+      if app.config.get('CACHE_BACKEND', 'memory') == 'redis':
+        import redis
+        self.backend = redis.Redis.from_url(app.config['CACHE_REDIS_URL'])
+      else:
+        self.backend = MemoryBackend(app.config.get('CACHE_MAX_ENTRIES', 1024))
+
+  def _key(self, namespaces):
+    versions = [self.backend.get(self.prefix + 'version:' + namespace) for namespace in namespaces]
+    return '{}page:{}:{}'.format(self.prefix, request.full_path,
+                                 '.'.join(version.decode() if version else '0' for version in versions))
+
+  def lookup(self, namespaces):
+    """
+      look a page up by the url of the current request
+      Parameters:
+          namespaces (List) : namespaces the page depends on
+      Returns:
+          key, hit (Tuple) : the cache key, and (body, status, headers) or None
+    """
+    key = self._key(namespaces)
+    hit = self.backend.get(key)
+    if hit is None:
+      self.misses += 1
+      return key, None
+    self.hits += 1
+    return key, pickle.loads(hit)
+
+  def store(self, key, response, ttl=None):
+    """
+      keep a response under a key from lookup, when it is not personal to the client
+    """
+    if response.status_code == 200 and not response.is_streamed \
+        and not session.modified and 'Set-Cookie' not in response.headers:
+      self.backend.setex(key, ttl or self.ttl,
+                         pickle.dumps((response.get_data(), response.status_code,
+                                       list(response.headers.items()))))
+
+  def cached(self, *namespaces, **options):
+    """
+      cache a view's response
+      Parameters:
+          namespaces (String) : namespaces the page depends on, formatted with the view arguments,
+                                e.g. 'venue:{venue_id}'
+          ttl (Integer) : optional, seconds to keep the page instead of CACHE_DEFAULT_TTL
+    """
+    ttl = options.get('ttl')
+
+    def decorator(view):
+      @wraps(view)
+      def wrapper(*args, **kwargs):
+        # pages with pending flash messages are personal, leave them alone
+        if not self.enabled or request.method != 'GET' or '_flashes' in session:
+          return view(*args, **kwargs)
+
+        key, hit = self.lookup([namespace.format(**kwargs) for namespace in namespaces])
+        if hit is not None:
+          return hit
+
+        response = make_response(view(*args, **kwargs))
+        self.store(key, response, ttl)
+        return response
+      return wrapper
+    return decorator
+
+  def invalidate(self, *namespaces):
+    """
+      drop every cached page filed under the given namespaces
+    """
+    for namespace in set(namespaces):
+      self.backend.incr(self.prefix + 'version:' + namespace)
+
+
+def conditional(validators):
+  """
+    answer If-None-Match / If-Modified-Since with 304 before running a view
+    Parameters:
+        validators (Function) : called with the view arguments, returns
+                                (etag, last_modified) for the page, last_modified
+                                an aware UTC datetime, or None to run the view as is
+  """
+  def decorator(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      found = validators(**kwargs) if request.method in ('GET', 'HEAD') else None
+      if found is None:
+        return view(*args, **kwargs)
+
+      etag, last_modified = found
+      response = Response(status=304) if not_modified(etag, last_modified) else make_response(view(*args, **kwargs))
+      return set_validators(response, etag, last_modified)
+    return wrapper
+  return decorator
+
+
+def not_modified(etag, last_modified):
+  """
+    whether the current request already holds the page of these validators
+  """
+  if request.if_none_match:
+    return request.if_none_match.contains(etag)
+  if request.if_modified_since:
+    return last_modified.replace(microsecond=0) <= request.if_modified_since
+  return False
+
+
+def set_validators(response, etag, last_modified):
+  response.set_etag(etag)
+  response.last_modified = last_modified.replace(microsecond=0)
+  # let browsers and proxies keep the page but check back every time
+  response.cache_control.no_cache = True
+  return response
@@ -1,14 +1,145 @@
 import os
-SECRET_KEY = os.urandom(32)
+
+
+def env_int(name, default):
+  value = os.environ.get(name)
+  if value is None or value == '':
+    return default
+  try:
+    return int(value)
+  except ValueError:
+    raise ValueError('{} must be an integer, got {!r}'.format(name, value))
+
+
+def env_bool(name, default):
+  value = os.environ.get(name)
+  if value is None or value == '':
+    return default
+  return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# Set SECRET_KEY in the environment when running several workers, so that they
+# all accept the same sessions and CSRF tokens
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
+# Enable debug mode, turn it off in production with FYYUR_DEBUG=0
+DEBUG = env_bool('FYYUR_DEBUG', True)
 
 # Connect to the database
-# LOCALHOST DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgresql://postgres@localhost:5432/fyyurapp'
+# DATABASE_URL, defaults to the LOCALHOST DATABASE URL
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://postgres@localhost:5432/fyyurapp')
+# Heroku still hands out postgres:// urls, which SQLAlchemy no longer accepts
+if SQLALCHEMY_DATABASE_URI.startswith('postgres://'):
+  SQLALCHEMY_DATABASE_URI = 'postgresql://' + SQLALCHEMY_DATABASE_URI[len('postgres://'):]
 
 # Set SQLAlchemy Track as False 
-SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Connection pool of each worker process: kept connections, extra connections
+# under load, seconds to wait for a free one, seconds before a connection is
+# replaced and whether it is tested before use. Every worker may open
+# DB_POOL_SIZE + DB_MAX_OVERFLOW connections, WEB_CONCURRENCY workers (as for
+# gunicorn) must stay under the server's max_connections
+DB_POOL_SIZE = env_int('DB_POOL_SIZE', 5)
+DB_MAX_OVERFLOW = env_int('DB_MAX_OVERFLOW', 10)
+DB_POOL_TIMEOUT = env_int('DB_POOL_TIMEOUT', 30)
+DB_POOL_RECYCLE = env_int('DB_POOL_RECYCLE', 1800)
+DB_POOL_PRE_PING = env_bool('DB_POOL_PRE_PING', True)
+# Milliseconds a statement may run before PostgreSQL cancels it, 0 for no limit
+DB_STATEMENT_TIMEOUT = env_int('DB_STATEMENT_TIMEOUT', 0)
+# Connect through PgBouncer in transaction pooling mode: no pool in the app and
+# no session state left on server connections
+DB_PGBOUNCER = env_bool('DB_PGBOUNCER', False)
+# Connect once at startup, and warn when the workers may open more connections
+# than the server accepts
+DB_CHECK_ON_STARTUP = env_bool('DB_CHECK_ON_STARTUP', False)
+WEB_CONCURRENCY = env_int('WEB_CONCURRENCY', 1)
+
+# Read replicas, comma separated urls in DATABASE_REPLICA_URLS. GET requests
+# and searches read from them in turn, a replica failing a check is left out
+# for REPLICA_HEALTH_INTERVAL seconds, and a client that wrote reads from the
+# primary for REPLICA_STICKY_SECONDS
+SQLALCHEMY_REPLICA_URIS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+REPLICA_HEALTH_INTERVAL = env_int('REPLICA_HEALTH_INTERVAL', 10)
+REPLICA_STICKY_SECONDS = env_int('REPLICA_STICKY_SECONDS', 5)
+
+# Number of shows per page on /shows, and the most a client may ask for
+SHOWS_PAGE_SIZE = 30
+SHOWS_MAX_PAGE_SIZE = 100
+
+# Shows listed without an end time last SHOW_DEFAULT_MINUTES. None may last
+# longer than SHOW_MAX_MINUTES, which bounds the index range read when checking
+# a new show for overlaps with the others of its venue and artist
+SHOW_DEFAULT_MINUTES = 120
+SHOW_MAX_MINUTES = 24 * 60
+
+# Calendar feeds (/venues/<id>/calendar.ics, /artists/<id>/calendar.ics): days
+# of past shows kept when no range is asked for, and minutes subscribers are
+# told to wait before fetching again
+ICAL_PAST_DAYS = 30
+ICAL_REFRESH_MINUTES = 60
+
+# The /venues directory lists, for every city, its venue and upcoming show
+# counts and the VENUE_AREA_TOP venues with the most upcoming shows, read
+# from the venue_area_summary table
+VENUE_AREA_TOP = 5
+
+# Stream the /venues, /artists and /shows pages to the client while rows are
+# still being read, fetching STREAM_CHUNK_SIZE rows per database round trip
+STREAM_LIST_PAGES = False
+STREAM_CHUNK_SIZE = 500
+
+# Most results returned by /venues/search and /artists/search
+SEARCH_RESULT_LIMIT = 50
+
+# /venues/nearby and /shows/nearby: search radius in km when none is given and
+# the largest allowed, results per page, and geohash cells (index range scans)
+# per query
+GEO_DEFAULT_RADIUS_KM = 25
+GEO_MAX_RADIUS_KM = 500
+GEO_NEARBY_LIMIT = 50
+GEO_MAX_CELLS = 16
+
+# Search-as-you-type: suggestions per kind, recent prefixes kept in memory and
+# seconds before the in-process index is rebuilt to pick up other workers' writes
+SUGGEST_LIMIT = 10
+SUGGEST_CACHE_SIZE = 1024
+SUGGEST_MAX_AGE = 300
+
+# Page cache for the read pages: 'memory' keeps an LRU in each process,
+# 'redis' shares it through CACHE_REDIS_URL
+CACHE_ENABLED = True
+CACHE_BACKEND = 'memory'
+CACHE_REDIS_URL = 'redis://localhost:6379/0'
+CACHE_DEFAULT_TTL = 60
+CACHE_MAX_ENTRIES = 1024
+
+# Rows fetched per round trip by "flask export" and /api/export/shows.jsonl
+EXPORT_CHUNK_SIZE = 5000
+
+# Items per page of the /api/v1 lists, and the most a client may ask for
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+# Most ids a client may ask for in one :batchGet call
+API_BATCH_MAX_IDS = 500
+
+# Count and time the SQL statements of every request (Server-Timing header),
+# warn when one statement shape runs more than INSTRUMENT_N_PLUS_ONE_THRESHOLD
+# times in a request, and show the queries at the bottom of HTML pages
+INSTRUMENT_ENABLED = True
+INSTRUMENT_N_PLUS_ONE_THRESHOLD = 10
+INSTRUMENT_DEBUG_PANEL = DEBUG
+
+# Prometheus metrics at METRICS_PATH. With several worker processes set
+# METRICS_DIR to a directory they share (emptied on deploy) so that every
+# worker reports the totals of all of them
+METRICS_ENABLED = True
+METRICS_PATH = '/metrics'
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 5
+
+# Threads of each ASGI worker (asgi.py) running the requests that have no
+# async view, as a threaded WSGI server would
+ASGI_WSGI_THREADS = env_int('ASGI_WSGI_THREADS', 16)
@@ -0,0 +1,282 @@
+#----------------------------------------------------------------------------#
+# Engine and connection pool settings, built from the DB_* config values.
+#
+# Every deployment tunes its pool through environment variables (see
+# config.py). Behind PgBouncer in transaction pooling mode the app keeps no
+# pool of its own and sets no session state on the server: the statement
+# timeout is then applied with SET LOCAL in every transaction instead of as
+# a connection option.
+#
+# With read replicas configured, RoutingSession sends the reads of GET
+# requests (and of views marked @read_only) to the replicas in turn, and
+# everything else to the primary: writes, reads in a request that already
+# wrote, commands, and the requests of a client that wrote within the last
+# REPLICA_STICKY_SECONDS, so that it reads its own writes.
+#----------------------------------------------------------------------------#
+
+import itertools
+import threading
+import time
+from flask import has_request_context, request, session as client_session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, exc, orm, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+
+def engine_options(config):
+  """
+    SQLALCHEMY_ENGINE_OPTIONS for the configured database
+    Parameters:
+        config (Dict) : app config holding SQLALCHEMY_DATABASE_URI and the DB_* values
+    Returns:
+        options (Dict) : keyword arguments for create_engine
+  """
+  url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+  if url.get_backend_name() == 'sqlite':
+    # SQLite has no server to protect, the dialect picks its own pool
+    return {}
+
+  options = {"pool_pre_ping": config['DB_POOL_PRE_PING']}
+  if config['DB_PGBOUNCER']:
+    # PgBouncer does the pooling, a second pool would only hold server slots
+    options['poolclass'] = NullPool
+  else:
+    options.update(pool_size=config['DB_POOL_SIZE'],
+                   max_overflow=config['DB_MAX_OVERFLOW'],
+                   pool_timeout=config['DB_POOL_TIMEOUT'],
+                   pool_recycle=config['DB_POOL_RECYCLE'])
+    if config['DB_STATEMENT_TIMEOUT'] and url.get_backend_name() == 'postgresql':
+      options['connect_args'] = {"options": '-c statement_timeout={:d}'.format(config['DB_STATEMENT_TIMEOUT'])}
+  return options
+
+
+def async_engine_options(config):
+  """
+    url and options of the asyncio engine of the configured database, same pool
+    settings as engine_options with the asyncpg / aiosqlite drivers
+    Returns:
+        url, options (Tuple) : arguments for create_async_engine
+  """
+  url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+  backend = url.get_backend_name()
+  if backend not in ASYNC_DRIVERS:
+    raise ValueError('no asyncio driver for ' + backend)
+  options = engine_options(config)
+  if backend == 'postgresql':
+    connect_args = {}
+    if config['DB_PGBOUNCER']:
+      # asyncpg prepares every statement on the server, which PgBouncer cannot route
+      connect_args.update(statement_cache_size=0, prepared_statement_cache_size=0)
+    elif config['DB_STATEMENT_TIMEOUT']:
+      connect_args['server_settings'] = {"statement_timeout": str(config['DB_STATEMENT_TIMEOUT'])}
+    options['connect_args'] = connect_args
+  return url.set(drivername=ASYNC_DRIVERS[backend]), options
+
+
+def validate(config):
+  """
+    check the database settings before anything connects
+    Raises:
+        ValueError : listing every invalid setting
+  """
+  problems = []
+  try:
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+  except Exception as error:
+    raise ValueError('SQLALCHEMY_DATABASE_URI is not a database url: {}'.format(error))
+
+  for name, minimum in (('DB_POOL_SIZE', 1), ('DB_MAX_OVERFLOW', -1), ('DB_POOL_TIMEOUT', 1),
+                        ('DB_POOL_RECYCLE', -1), ('DB_STATEMENT_TIMEOUT', 0)):
+    value = config[name]
+    if not isinstance(value, int) or isinstance(value, bool) or value < minimum:
+      problems.append('{} must be an integer of at least {}, got {!r}'.format(name, minimum, value))
+  if config['DB_PGBOUNCER'] and url.get_backend_name() != 'postgresql':
+    problems.append('DB_PGBOUNCER needs a postgresql:// database url')
+  for replica in config['SQLALCHEMY_REPLICA_URIS']:
+    try:
+      if make_url(replica).get_backend_name() != url.get_backend_name():
+        problems.append('replica {} does not use the backend of the primary'.format(replica))
+    except Exception as error:
+      problems.append('replica {!r} is not a database url: {}'.format(replica, error))
+  if problems:
+    raise ValueError('invalid database settings:\n  ' + '\n  '.join(problems))
+
+
+def configure_database(app):
+  """
+    validate the DB_* settings and turn them into SQLALCHEMY_ENGINE_OPTIONS,
+    to be called before the SQLAlchemy extension is created
+  """
+  validate(app.config)
+  options = engine_options(app.config)
+  # explicit engine options in the config win over the DB_* values
+  options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+  app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+  # replicas are binds of their own, engines are then created and pooled as the primary's
+  binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+  for number, replica in enumerate(app.config['SQLALCHEMY_REPLICA_URIS'], 1):
+    binds[replica_bind(number)] = replica
+  app.config['SQLALCHEMY_BINDS'] = binds or None
+
+
+def replica_bind(number):
+  return 'replica_{}'.format(number)
+
+
+def connection_budget(app, engine):
+  """
+    compare the connections all workers may open with what the server accepts
+    Returns:
+        budget (Tuple) : (connections the workers may open, max_connections of the server)
+  """
+  options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+  per_worker = 0 if options.get('poolclass') is NullPool else \
+    options.get('pool_size', 5) + max(options.get('max_overflow', 10), 0)
+  with engine.connect() as connection:
+    maximum = int(connection.execute(text('SHOW max_connections')).scalar())
+  return app.config['WEB_CONCURRENCY'] * per_worker, maximum
+
+
+def read_only(view):
+  """
+    mark a view that only reads, e.g. a search answering a POST, so that its
+    queries may go to a replica
+  """
+  view.read_only = True
+  return view
+
+
+class ReplicaSet(object):
+  """
+    round-robin over the healthy replicas of an app
+    Parameters:
+        engines (List) : replica engines
+        health_interval (Integer) : seconds between two checks of a replica, and
+                                    seconds a failed replica is left out
+  """
+
+  def __init__(self, engines, health_interval=10):
+    self.engines = engines
+    self.health_interval = health_interval
+    self._turns = itertools.count()
+    self._checked_at = {}
+    self._down_until = {}
+    self._lock = threading.Lock()
+    for engine in engines:
+      event.listen(engine, 'handle_error', self._handle_error)
+
+  def _handle_error(self, context):
+    if context.is_disconnect or isinstance(context.original_exception, exc.OperationalError):
+      self.mark_down(context.engine)
+
+  def mark_down(self, engine):
+    self._down_until[engine] = time.time() + self.health_interval
+
+  def healthy(self, engine):
+    now = time.time()
+    if self._down_until.get(engine, 0) > now:
+      return False
+    if now - self._checked_at.get(engine, 0) < self.health_interval:
+      return True
+    with self._lock:
+      self._checked_at[engine] = now
+    try:
+      with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+    except exc.DBAPIError:
+      self.mark_down(engine)
+      return False
+    return True
+
+  def pick(self):
+    """
+      Returns:
+          engine (Object) : the next healthy replica, or None when none is
+    """
+    for _ in range(len(self.engines)):
+      engine = self.engines[next(self._turns) % len(self.engines)]
+      if self.healthy(engine):
+        return engine
+    return None
+
+
+class RoutingSession(SignallingSession):
+  """
+    session sending the reads of read-only requests to a replica
+  """
+
+  def __init__(self, db, **options):
+    self._db = db
+    SignallingSession.__init__(self, db, **options)
+
+  def get_bind(self, mapper=None, clause=None, **kwargs):
+    if self._flushing:
+      self.info['wrote'] = True
+    elif self._db.replicas is not None and self._reads_from_replica():
+      # one replica per session, so that a request reads one consistent state
+      if 'replica' not in self.info:
+        self.info['replica'] = self._db.replicas.pick()
+      if self.info['replica'] is not None:
+        return self.info['replica']
+    return SignallingSession.get_bind(self, mapper, clause)
+
+  def _reads_from_replica(self):
+    if not has_request_context() or self.info.get('wrote'):
+      return False
+    view = self.app.view_functions.get(request.endpoint)
+    if request.method not in READ_METHODS and not getattr(view, 'read_only', False):
+      return False
+    # the client wrote a moment ago, replicas may not have its write yet
+    return client_session.get('_primary_until', 0) < time.time()
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+  """
+    SQLAlchemy extension whose sessions route reads to SQLALCHEMY_REPLICA_URIS
+  """
+  replicas = None
+
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def init_database(app, db):
+  """
+    hook the engines of the app: per transaction statement timeout behind
+    PgBouncer, replica routing, and with DB_CHECK_ON_STARTUP a connection
+    check at startup
+  """
+  with app.app_context():
+    engine = db.engine
+    replicas = [db.get_engine(app, replica_bind(number))
+                for number in range(1, len(app.config['SQLALCHEMY_REPLICA_URIS']) + 1)]
+
+  timeout = app.config['DB_STATEMENT_TIMEOUT']
+  if app.config['DB_PGBOUNCER'] and timeout:
+    for pooled in [engine] + replicas:
+      event.listen(pooled, 'begin', lambda connection: connection.exec_driver_sql(
+        'SET LOCAL statement_timeout = {:d}'.format(timeout)))
+
+  if replicas:
+    db.replicas = ReplicaSet(replicas, app.config['REPLICA_HEALTH_INTERVAL'])
+    sticky = app.config['REPLICA_STICKY_SECONDS']
+
+    @event.listens_for(db.session, 'after_commit')
+    def read_own_writes(session):
+      if session.info.get('wrote') and has_request_context():
+        client_session['_primary_until'] = time.time() + sticky
+
+  if not app.config['DB_CHECK_ON_STARTUP']:
+    return
+  with engine.connect() as connection:
+    connection.execute(text('SELECT 1'))
+  if engine.dialect.name == 'postgresql':
+    needed, maximum = connection_budget(app, engine)
+    if needed > maximum:
+      app.logger.warning('%d workers may open %d connections but the server accepts %d, '
+                         'lower DB_POOL_SIZE / DB_MAX_OVERFLOW or use DB_PGBOUNCER',
+                         app.config['WEB_CONCURRENCY'], needed, maximum)
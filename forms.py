@@ -1,8 +1,33 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, FloatField
 from wtforms.fields.core import BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms.validators import DataRequired, InputRequired, AnyOf, URL, NumberRange, Optional
+
+# date and time formats read from forms and import files, the first one is
+# the one written back
+DATETIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M')
+
+class DateTimesField(DateTimeField):
+    """
+      DateTimeField reading any of DATETIME_FORMATS, e.g. 2030-01-01 20:00,
+      and naming the expected format when none fits
+    """
+    def __init__(self, label=None, validators=None, formats=DATETIME_FORMATS, **kwargs):
+        super(DateTimesField, self).__init__(label, validators, format=formats[0], **kwargs)
+        self.formats = formats
+
+    def process_formdata(self, valuelist):
+        if valuelist:
+            value = ' '.join(valuelist).strip()
+            for format in self.formats:
+                try:
+                    self.data = datetime.strptime(value, format)
+                    return
+                except ValueError:
+                    pass
+            self.data = None
+            raise ValueError(self.gettext('Not a valid date and time, expected YYYY-MM-DD HH:MM:SS'))
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -11,11 +36,16 @@ class ShowForm(Form):
     venue_id = StringField(
         'venue_id', validators=[DataRequired()]
     )
-    start_time = DateTimeField(
+    # InputRequired, so that a value in another format reports the format
+    # rather than a missing field
+    start_time = DateTimesField(
         'start_time',
-        validators=[DataRequired()],
+        validators=[InputRequired()],
         default= datetime.today()
     )
+    end_time = DateTimesField(
+        'end_time', validators=[Optional()]
+    )
 
 class VenueForm(Form):
     name = StringField(
@@ -124,6 +154,11 @@ class VenueForm(Form):
 
     seeking_description = StringField('seeking_description')
 
+    # position, the centroid of the city when left out
+    latitude = FloatField('latitude', validators=[Optional(), NumberRange(-90, 90)])
+
+    longitude = FloatField('longitude', validators=[Optional(), NumberRange(-180, 180)])
+
 class ArtistForm(Form):
     name = StringField(
         'name', validators=[DataRequired()]
@@ -0,0 +1,181 @@
+#----------------------------------------------------------------------------#
+# Offline geocoding and geohash helpers for the "nearby" pages.
+#
+# Venues get the centroid of their city from the bundled table in
+# data/city_centroids.csv, no network involved. Their position is stored as a
+# geohash too: nearby points share a prefix, so a radius query becomes a few
+# range scans of one ordinary B-tree index, on PostgreSQL and SQLite alike,
+# and only the venues of those ranges are measured.
+#----------------------------------------------------------------------------#
+
+import csv
+import math
+import os
+import threading
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# radius of the first search around a point
+FIRST_RADIUS_KM = 1.5
+CENTROIDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'city_centroids.csv')
+
+
+def encode(latitude, longitude, precision=PRECISION):
+  """
+    geohash of a point
+    Parameters:
+        latitude, longitude (Float) : position in degrees
+        precision (Integer) : characters, 9 is a cell of about 5 x 5 metres
+    Returns:
+        geohash (String) : base32 geohash
+  """
+  south, north, west, east = -90.0, 90.0, -180.0, 180.0
+  chars = []
+  bits = 0
+  value = 0
+  even = True
+  while len(chars) < precision:
+    # bits alternate between longitude and latitude, longitude first
+    if even:
+      middle = (west + east) / 2
+      if longitude >= middle:
+        value = value * 2 + 1
+        west = middle
+      else:
+        value = value * 2
+        east = middle
+    else:
+      middle = (south + north) / 2
+      if latitude >= middle:
+        value = value * 2 + 1
+        south = middle
+      else:
+        value = value * 2
+        north = middle
+    even = not even
+    bits += 1
+    if bits == 5:
+      chars.append(BASE32[value])
+      bits = 0
+      value = 0
+  return ''.join(chars)
+
+def cell_size(precision):
+  """
+    Returns:
+        rows, columns, height, width (Tuple) : cells in a column and in a row of the
+                                               world grid, and one cell in degrees
+  """
+  lat_bits = 5 * precision // 2
+  lng_bits = 5 * precision - lat_bits
+  return 2 ** lat_bits, 2 ** lng_bits, 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+def covering_cells(latitude, longitude, radius_km, max_cells=16):
+  """
+    geohash cells covering the box around a circle, as fine as max_cells allows
+    Parameters:
+        latitude, longitude (Float) : centre in degrees
+        radius_km (Float) : radius of the circle
+        max_cells (Integer) : most cells returned, i.e. range scans of the index
+    Returns:
+        cells (List) : geohash prefixes, sorted; every point of the circle starts with one
+  """
+  lat_radius = radius_km / KM_PER_DEGREE
+  south, north = max(latitude - lat_radius, -90.0), min(latitude + lat_radius, 90.0)
+  # a degree of longitude shrinks towards the poles, size the box at its edge nearest one
+  widest = max(abs(south), abs(north))
+  if widest >= 89.9:
+    lng_radius = 180.0
+  else:
+    lng_radius = min(radius_km / (KM_PER_DEGREE * math.cos(math.radians(widest))), 180.0)
+
+  for precision in range(PRECISION, 0, -1):
+    rows, columns, height, width = cell_size(precision)
+    row_range = range(min(int((south + 90) // height), rows - 1), min(int((north + 90) // height), rows - 1) + 1)
+    column_range = range(int((longitude - lng_radius + 180) // width),
+                         int((longitude + lng_radius + 180) // width) + 1)
+    if len(row_range) * min(len(column_range), columns) <= max_cells or precision == 1:
+      break
+  # columns past the antimeridian wrap around
+  return sorted(set(encode(-90 + (row + 0.5) * height, -180 + (column % columns + 0.5) * width, precision)
+                    for row in row_range for column in column_range))
+
+def prefix_ranges(cells):
+  """
+    merge sorted geohash cells of one precision into ranges of the geohashes
+    starting with them
+    Returns:
+        ranges (List) : (low, high) tuples, low <= geohash < high, high None for no bound
+  """
+  ranges = []
+  for cell in cells:
+    if ranges and ranges[-1][1] == cell:
+      ranges[-1] = (ranges[-1][0], following(cell))
+    else:
+      ranges.append((cell, following(cell)))
+  return ranges
+
+def following(cell):
+  # the first geohash of the cell after this one, None after the last cell
+  stripped = cell.rstrip(BASE32[-1])
+  if not stripped:
+    return None
+  return stripped[:-1] + BASE32[BASE32.index(stripped[-1]) + 1]
+
+def wider_radius(radius_km, found, wanted, most=4):
+  """
+    radius of the next, wider search after found of the wanted points were
+    within radius_km: where the density seen so far would hold them all, with
+    a margin, and from 1.5 to most times as wide
+  """
+  expected = 1.2 * radius_km * math.sqrt(wanted / found) if found else most * radius_km
+  return min(max(expected, 1.5 * radius_km), most * radius_km)
+
+def distance_km(latitude, longitude, other_latitude, other_longitude):
+  """
+    great-circle distance between two points (haversine)
+  """
+  phi1, phi2 = math.radians(latitude), math.radians(other_latitude)
+  d_phi = phi2 - phi1
+  d_lambda = math.radians(other_longitude - longitude)
+  a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+  return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class CityCentroids(object):
+  """
+    city -> centroid table, read from a CSV of city, state, latitude, longitude
+    on first use
+    Parameters:
+        path (String) : CSV file, data/city_centroids.csv by default
+  """
+
+  def __init__(self, path=CENTROIDS_PATH):
+    self.path = path
+    self._centroids = None
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def _key(city, state):
+    return ' '.join((city or '').lower().replace('.', '').split()), (state or '').strip().upper()
+
+  def _load(self):
+    with self._lock:
+      if self._centroids is None:
+        with open(self.path, newline='', encoding='utf-8') as source:
+          self._centroids = {self._key(row['city'], row['state']): (float(row['latitude']), float(row['longitude']))
+                             for row in csv.DictReader(source)}
+    return self._centroids
+
+  def locate(self, city, state):
+    """
+      centroid of a city
+      Returns:
+          latitude, longitude (Tuple) : in degrees, None for a city not in the table
+    """
+    return (self._centroids or self._load()).get(self._key(city, state))
+
+
+centroids = CityCentroids()
@@ -0,0 +1,86 @@
+#----------------------------------------------------------------------------#
+# iCalendar (RFC 5545) feeds of shows.
+#
+# Show times are stored as naive local times, so events are written with
+# "floating" times, which calendar apps show as they are whatever the time
+# zone of the reader. DTSTAMP is the last change of the show, in UTC.
+#----------------------------------------------------------------------------#
+
+PRODID = '-//Fyyur//Shows//EN'
+# octets of a content line before it is folded
+LINE_LENGTH = 75
+
+
+def escape(value):
+  """
+    escape a TEXT value: backslashes, semicolons, commas and newlines
+  """
+  return (value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')\
+                      .replace('\r\n', '\\n').replace('\n', '\\n')
+
+def fold(line):
+  """
+    fold a content line into lines of at most 75 octets, without splitting a
+    UTF-8 character, continuation lines starting with a space
+  """
+  encoded = line.encode('utf-8')
+  if len(encoded) <= LINE_LENGTH:
+    return line
+  parts = []
+  start = 0
+  limit = LINE_LENGTH
+  while start < len(encoded):
+    end = min(start + limit, len(encoded))
+    # back off to the first byte of a character
+    while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+      end -= 1
+    parts.append(encoded[start:end].decode('utf-8'))
+    start = end
+    # the leading space of a continuation line counts too
+    limit = LINE_LENGTH - 1
+  return '\r\n '.join(parts)
+
+def local_time(moment):
+  # floating date and time
+  return moment.strftime('%Y%m%dT%H%M%S')
+
+def utc_time(moment):
+  # moment is naive UTC
+  return moment.strftime('%Y%m%dT%H%M%SZ')
+
+def calendar(name, events, refresh_minutes=60):
+  """
+    an iCalendar document
+    Parameters:
+        name (String) : name of the calendar shown by calendar apps
+        events (Iterable) : dicts of uid, start and end (naive local), updated (naive UTC),
+                            summary, location and url
+        refresh_minutes (Integer) : how often subscribers should fetch the feed again
+    Returns:
+        text (String) : the document, CRLF line endings
+  """
+  lines = [
+    'BEGIN:VCALENDAR',
+    'VERSION:2.0',
+    'PRODID:' + PRODID,
+    'CALSCALE:GREGORIAN',
+    'METHOD:PUBLISH',
+    'NAME:' + escape(name),
+    'X-WR-CALNAME:' + escape(name),
+    'REFRESH-INTERVAL;VALUE=DURATION:PT{}M'.format(refresh_minutes),
+    'X-PUBLISHED-TTL:PT{}M'.format(refresh_minutes),
+  ]
+  for event in events:
+    lines.extend((
+      'BEGIN:VEVENT',
+      'UID:' + event['uid'],
+      'DTSTAMP:' + utc_time(event['updated']),
+      'DTSTART:' + local_time(event['start']),
+      'DTEND:' + local_time(event['end']),
+      'SUMMARY:' + escape(event['summary']),
+      'LOCATION:' + escape(event['location']),
+      'URL:' + event['url'],
+      'END:VEVENT',
+    ))
+  lines.append('END:VCALENDAR')
+  return ''.join(fold(line) + '\r\n' for line in lines)
@@ -0,0 +1,143 @@
+#----------------------------------------------------------------------------#
+# Per request SQL instrumentation.
+#
+# Every statement run while a request is handled is counted and timed from
+# the engine's before/after_cursor_execute events. The totals are sent back
+# in a Server-Timing header (and an optional debug panel on HTML pages), and
+# a statement shape, i.e. the statement with its literals and IN lists
+# folded, that runs more than N times in one request is logged as a likely
+# N+1 query.
+#----------------------------------------------------------------------------#
+
+import re
+import time
+from collections import Counter
+from flask import g, has_request_context, request
+from markupsafe import escape
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SHAPE_PATTERNS = (
+  (re.compile(r"'(?:[^']|'')*'"), '?'),
+  (re.compile(r'%\(\w+\)s|%s|\?|:\w+|\$\d+'), '?'),
+  (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+  (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+  (re.compile(r'\s+'), ' '),
+)
+
+
+def statement_shape(statement):
+  """
+    fold the literals and placeholders of a statement, so that the same query
+    run with other parameters has the same shape
+  """
+  for pattern, replacement in SHAPE_PATTERNS:
+    statement = pattern.sub(replacement, statement)
+  return statement.strip()
+
+
+class RequestStats(object):
+  """
+    queries run while handling one request
+  """
+
+  def __init__(self):
+    self.started = time.perf_counter()
+    self.queries = 0
+    self.db_time = 0.0
+    self.shapes = Counter()
+
+  def record(self, statement, duration):
+    self.queries += 1
+    self.db_time += duration
+    self.shapes[statement_shape(statement)] += 1
+
+  def repeated(self, threshold):
+    """
+      Returns:
+          shapes (List) : (shape, count) of the statements run more than threshold times
+    """
+    return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+
+class QueryInstrument(object):
+  """
+    hooks the engine events and the request cycle of an app
+  """
+
+  def __init__(self, app=None):
+    self.listeners = []
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.app = app
+    self.enabled = app.config.get('INSTRUMENT_ENABLED', True)
+    self.threshold = app.config.get('INSTRUMENT_N_PLUS_ONE_THRESHOLD', 10)
+    self.debug_panel = app.config.get('INSTRUMENT_DEBUG_PANEL', False)
+    if not self.enabled:
+      return
+    # listening on the Engine class covers every engine the app creates
+    if not event.contains(Engine, 'before_cursor_execute', self._before_cursor_execute):
+      event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+      event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+    app.before_request(self._before_request)
+    app.after_request(self._after_request)
+    app.teardown_request(self._teardown_request)
+
+  @staticmethod
+  def current():
+    """
+      Returns:
+          stats (Object) : RequestStats of the request being handled, or None outside of one
+    """
+    if has_request_context():
+      return g.get('_request_stats')
+    return None
+
+  def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+  def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    stats = self.current()
+    if stats is not None:
+      duration = time.perf_counter() - started
+      stats.record(statement, duration)
+      for listener in self.listeners:
+        listener(statement, duration)
+
+  def _before_request(self):
+    g._request_stats = RequestStats()
+
+  def _after_request(self, response):
+    stats = self.current()
+    if stats is None:
+      return response
+    elapsed = (time.perf_counter() - stats.started) * 1000
+    response.headers.add('Server-Timing', 'db;dur={:.1f};desc="{} queries"'.format(stats.db_time * 1000, stats.queries))
+    response.headers.add('Server-Timing', 'app;dur={:.1f}'.format(elapsed))
+    if self.debug_panel and response.mimetype == 'text/html' and not response.is_streamed \
+        and not response.direct_passthrough:
+      self._add_panel(response, stats, elapsed)
+    return response
+
+  def _teardown_request(self, error=None):
+    # teardown also runs after a streamed body is sent, so its queries are counted too
+    stats = self.current()
+    if stats is None:
+      return
+    for shape, count in stats.repeated(self.threshold):
+      self.app.logger.warning('possible N+1 query on %s %s: %d x %s', request.method, request.path, count, shape)
+
+  def _add_panel(self, response, stats, elapsed):
+    body = response.get_data(as_text=True)
+    if '</body>' not in body:
+      return
+    rows = ''.join('<tr><td>{}</td><td><code>{}</code></td></tr>'.format(count, escape(shape))
+                   for shape, count in stats.shapes.most_common(10))
+    panel = ('<div id="sql-debug" style="font-size:12px;background:#fff;border-top:1px solid #ccc;padding:8px">'
+             '<strong>{} queries, {:.1f} ms in the database, {:.1f} ms in total</strong>'
+             '<table class="table table-condensed">{}</table></div>').format(
+               stats.queries, stats.db_time * 1000, elapsed, rows)
+    response.set_data(body.replace('</body>', panel + '</body>', 1))
@@ -0,0 +1,277 @@
+#----------------------------------------------------------------------------#
+# Prometheus metrics: request latency, template render time, SQL queries,
+# connection pool health and page cache hits, served at /metrics.
+#
+# Each worker process keeps its counters and histograms in plain dicts,
+# updated under a lock as requests run on several threads. When METRICS_DIR is set every worker writes a
+# snapshot of its values to `<METRICS_DIR>/metrics-<pid>.json` at most every
+# METRICS_FLUSH_INTERVAL seconds, and /metrics adds up the snapshots of all
+# workers, so any worker can answer a scrape. Empty the directory when the
+# app is deployed, as with prometheus_client's multiprocess mode.
+#----------------------------------------------------------------------------#
+
+import glob
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from flask import g, has_request_context, request, Response, template_rendered, before_render_template
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+  'fyyur_request_duration_seconds': ('histogram', 'Time spent handling a request'),
+  'fyyur_template_render_seconds': ('histogram', 'Time spent rendering a template'),
+  'fyyur_db_query_duration_seconds': ('histogram', 'Time spent running an SQL statement'),
+  'fyyur_db_pool_checkout_seconds': ('histogram', 'Time spent waiting for a pooled connection'),
+  'fyyur_db_pool_size': ('gauge', 'Connections kept by the pool'),
+  'fyyur_db_pool_checked_out': ('gauge', 'Connections in use'),
+  'fyyur_db_pool_overflow': ('gauge', 'Connections open beyond the pool size'),
+  'fyyur_cache_hits_total': ('counter', 'Pages served from the page cache'),
+  'fyyur_cache_misses_total': ('counter', 'Pages rendered because they were not cached'),
+}
+
+
+def label_key(labels):
+  # label values as text, so that series can be merged and sorted whatever their origin
+  return tuple((name, str(value)) for name, value in labels)
+
+
+def format_labels(labels):
+  if not labels:
+    return ''
+  return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                        for name, value in labels) + '}'
+
+
+class Metrics(object):
+  """
+    per process metrics registry
+    Parameters:
+        app (Object) : optional, Flask app to instrument
+  """
+
+  def __init__(self, app=None, buckets=DEFAULT_BUCKETS):
+    self.buckets = buckets
+    self._counters = defaultdict(float)
+    # key -> [count per bucket, sum, count]
+    self._histograms = {}
+    self._lock = threading.Lock()
+    # functions returning (name, labels, value) tuples, called when a snapshot is taken
+    self.collectors = []
+    self._flushed_at = 0
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.enabled = app.config.get('METRICS_ENABLED', True)
+    self.directory = app.config.get('METRICS_DIR')
+    self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', 5)
+    if not self.enabled:
+      return
+    app.before_request(self._before_request)
+    app.after_request(self._after_request)
+    app.teardown_request(self._teardown_request)
+    before_render_template.connect(self._before_render, app, weak=False)
+    template_rendered.connect(self._rendered, app, weak=False)
+    app.add_url_rule(app.config.get('METRICS_PATH', '/metrics'), 'metrics', self.view)
+
+  # recording
+  # --------------------------------------------------------------------------
+
+  def inc(self, name, labels=(), amount=1):
+    with self._lock:
+      self._counters[(name, tuple(labels))] += amount
+
+  def observe(self, name, value, labels=()):
+    key = (name, tuple(labels))
+    position = next((position for position, bound in enumerate(self.buckets) if value <= bound), None)
+    with self._lock:
+      histogram = self._histograms.get(key)
+      if histogram is None:
+        histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+      if position is not None:
+        histogram[0][position] += 1
+      histogram[1] += value
+      histogram[2] += 1
+
+  def observe_query(self, statement, duration):
+    """
+      QueryInstrument listener, times the statements run by requests
+    """
+    self.observe('fyyur_db_query_duration_seconds', duration, (('endpoint', request.endpoint),))
+
+  def watch_database(self, db, app):
+    """
+      time pool checkouts and report the pool size of every engine of the app
+    """
+    binds = [None] + list(app.config.get('SQLALCHEMY_BINDS') or {})
+    watched = set()
+
+    def engines():
+      return [(bind or 'default', db.get_engine(app, bind)) for bind in binds]
+
+    def watch():
+      for bind, engine in engines():
+        if id(engine) in watched:
+          continue
+        watched.add(id(engine))
+        raw_connection = engine.raw_connection
+
+        def timed_raw_connection(*args, _raw_connection=raw_connection, _bind=bind, **kwargs):
+          started = time.perf_counter()
+          try:
+            return _raw_connection(*args, **kwargs)
+          finally:
+            self.observe('fyyur_db_pool_checkout_seconds', time.perf_counter() - started, (('bind', _bind),))
+        engine.raw_connection = timed_raw_connection
+
+    def pool_status():
+      for bind, engine in engines():
+        pool = engine.pool
+        labels = (('bind', bind),)
+        for name, method in (('fyyur_db_pool_size', 'size'), ('fyyur_db_pool_checked_out', 'checkedout'),
+                             ('fyyur_db_pool_overflow', 'overflow')):
+          if hasattr(pool, method):
+            # QueuePool.overflow() is negative until the pool is full
+            yield name, labels, max(getattr(pool, method)(), 0)
+
+    app.before_request(watch)
+    self.collectors.append(pool_status)
+
+  def watch_cache(self, cache):
+    def cache_status():
+      yield 'fyyur_cache_hits_total', (), cache.hits
+      yield 'fyyur_cache_misses_total', (), cache.misses
+    self.collectors.append(cache_status)
+
+  def _before_request(self):
+    g._metrics_started = time.perf_counter()
+
+  def _after_request(self, response):
+    started = g.pop('_metrics_started', None)
+    if started is not None:
+      self.observe('fyyur_request_duration_seconds', time.perf_counter() - started,
+                   (('endpoint', request.endpoint), ('method', request.method), ('status', response.status_code)))
+    return response
+
+  def _teardown_request(self, error=None):
+    if self.directory and time.time() - self._flushed_at > self.flush_interval:
+      self.flush()
+
+  def _before_render(self, app, template, context):
+    if has_request_context():
+      g.setdefault('_metrics_renders', []).append(time.perf_counter())
+
+  def _rendered(self, app, template, context):
+    if has_request_context() and g.get('_metrics_renders'):
+      self.observe('fyyur_template_render_seconds', time.perf_counter() - g._metrics_renders.pop(),
+                   (('template', template.name),))
+
+  # reporting
+  # --------------------------------------------------------------------------
+
+  def snapshot(self):
+    """
+      Returns:
+          snapshot (Dict) : {"counters": [[name, labels, value]], "histograms": [[name, labels, buckets, sum, count]],
+                             "gauges": [[name, labels, value]]} of this process
+    """
+    with self._lock:
+      counters = dict(self._counters)
+      histograms = [[name, list(labels), list(buckets), total, count]
+                    for (name, labels), (buckets, total, count) in self._histograms.items()]
+    gauges = []
+    for collector in self.collectors:
+      for name, labels, value in collector():
+        if METRICS[name][0] == 'counter':
+          counters[(name, tuple(labels))] = counters.get((name, tuple(labels)), 0) + value
+        else:
+          gauges.append([name, list(labels), value])
+    return {
+      "pid": os.getpid(),
+      "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+      "histograms": histograms,
+      "gauges": gauges,
+    }
+
+  def flush(self):
+    """
+      write this process' snapshot to METRICS_DIR, replacing the previous one atomically
+    """
+    self._flushed_at = time.time()
+    path = os.path.join(self.directory, 'metrics-{}.json'.format(os.getpid()))
+    with open(path + '.tmp', 'w') as target:
+      json.dump(self.snapshot(), target)
+    os.replace(path + '.tmp', path)
+
+  def _snapshots(self):
+    own = self.snapshot()
+    yield own
+    if not self.directory:
+      return
+    for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+      try:
+        with open(path) as source:
+          snapshot = json.load(source)
+      except (OSError, ValueError):
+        continue
+      if snapshot['pid'] == own['pid']:
+        continue
+      if not self._alive(snapshot['pid']):
+        # counts of stopped workers still add up, their gauges no longer do
+        snapshot['gauges'] = []
+      yield snapshot
+
+  @staticmethod
+  def _alive(pid):
+    try:
+      os.kill(pid, 0)
+    except ProcessLookupError:
+      return False
+    except PermissionError:
+      pass
+    return True
+
+  def render(self):
+    """
+      Returns:
+          text (String) : metrics of every worker in the Prometheus text format
+    """
+    counters = defaultdict(float)
+    gauges = defaultdict(float)
+    histograms = {}
+    for snapshot in self._snapshots():
+      for name, labels, value in snapshot['counters']:
+        counters[(name, label_key(labels))] += value
+      for name, labels, value in snapshot['gauges']:
+        gauges[(name, label_key(labels))] += value
+      for name, labels, buckets, total, count in snapshot['histograms']:
+        merged = histograms.setdefault((name, label_key(labels)), [[0] * len(self.buckets), 0.0, 0])
+        merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+        merged[1] += total
+        merged[2] += count
+
+    series = defaultdict(list)
+    for (name, labels), value in sorted(counters.items()) + sorted(gauges.items()):
+      series[name].append('{}{} {}'.format(name, format_labels(labels), value))
+    for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+      cumulative = 0
+      for bound, bucket in zip(self.buckets, buckets):
+        cumulative += bucket
+        series[name].append('{}_bucket{} {}'.format(name, format_labels(labels + (('le', bound),)), cumulative))
+      series[name].append('{}_bucket{} {}'.format(name, format_labels(labels + (('le', '+Inf'),)), count))
+      series[name].append('{}_sum{} {}'.format(name, format_labels(labels), total))
+      series[name].append('{}_count{} {}'.format(name, format_labels(labels), count))
+
+    lines = []
+    for name in sorted(series):
+      kind, description = METRICS[name]
+      lines.append('# HELP {} {}'.format(name, description))
+      lines.append('# TYPE {} {}'.format(name, kind))
+      lines.extend(series[name])
+    return '\n'.join(lines) + '\n'
+
+  def view(self):
+    return Response(self.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,37 @@
+"""add upcoming and past show counters to venue and artist
+
+Revision ID: 090750438541
+Revises: f1345d9c76d1
+Create Date: 2026-10-18 10:48:55.902113
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '090750438541'
+down_revision = 'f1345d9c76d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.execute(sa.text(
+            'UPDATE {0} SET '
+            'upcoming_shows_count = (SELECT count(show.id) FROM show '
+            'WHERE show.{0}_id = {0}.id AND show.start_time > :now), '
+            'past_shows_count = (SELECT count(show.id) FROM show '
+            'WHERE show.{0}_id = {0}.id AND show.start_time <= :now)'.format(table))
+            .bindparams(now=datetime.now().isoformat(' ')))
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('past_shows_count')
+            batch_op.drop_column('upcoming_shows_count')
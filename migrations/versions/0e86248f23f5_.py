@@ -0,0 +1,92 @@
+"""move venue and artist genres to a genre table
+
+Revision ID: 0e86248f23f5
+Revises: ac7c6539a883
+Create Date: 2026-10-18 16:20:41.207315
+
+"""
+import re
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0e86248f23f5'
+down_revision = 'ac7c6539a883'
+branch_labels = None
+depends_on = None
+
+GENRES = "(SELECT {1}(genre.name, '{2}') FROM {0}_genre JOIN genre ON genre.id = {0}_genre.genre_id " \
+         "WHERE {0}_genre.{0}_id = {0}.id)"
+DOCUMENT = "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || " \
+           "setweight(to_tsvector('simple', coalesce(city, '') || ' ' || coalesce(state, '')), 'B') || " \
+           "setweight(to_tsvector('simple', coalesce({}, '')), 'C')"
+
+
+def split_genres(value):
+    # the text column held 'Jazz;Blues', '{Jazz,Blues}' (a list bound by
+    # psycopg2) or "['Jazz', 'Blues']" (a list turned into a string)
+    names = [name.strip(' "\'') for name in re.split(r'[;,]', (value or '').strip('{}[]'))]
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def aggregate(dialect):
+    return 'string_agg' if dialect == 'postgresql' else 'group_concat'
+
+
+def upgrade():
+    connection = op.get_bind()
+    dialect = connection.dialect.name
+    op.create_table('genre',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=120), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name'))
+    for table in ('venue', 'artist'):
+        op.create_table('{}_genre'.format(table),
+            sa.Column('{}_id'.format(table), sa.Integer(), nullable=False),
+            sa.Column('genre_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['{}_id'.format(table)], ['{}.id'.format(table)], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['genre_id'], ['genre.id']),
+            sa.PrimaryKeyConstraint('{}_id'.format(table), 'genre_id'))
+        op.create_index('ix_{0}_genre_genre_id_{0}_id'.format(table), '{}_genre'.format(table),
+                        ['genre_id', '{}_id'.format(table)], unique=False)
+
+    # convert the stored text into rows
+    genres = {table: [(id, split_genres(value)) for id, value in
+                      connection.execute(sa.text('SELECT id, genres FROM {}'.format(table)))]
+              for table in ('venue', 'artist')}
+    names = sorted(set(name for rows in genres.values() for id, found in rows for name in found))
+    if names:
+        op.bulk_insert(sa.table('genre', sa.column('name')), [{'name': name} for name in names])
+    ids = dict(connection.execute(sa.text('SELECT name, id FROM genre')).fetchall())
+    for table, rows in genres.items():
+        links = [{'{}_id'.format(table): id, 'genre_id': ids[name]} for id, found in rows for name in found]
+        if links:
+            op.bulk_insert(sa.table('{}_genre'.format(table), sa.column('{}_id'.format(table)),
+                                    sa.column('genre_id')), links)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('genres')
+
+        # search documents now read the genre names from the new tables
+        if dialect == 'postgresql':
+            op.execute('UPDATE {} SET search_vector = {}'.format(
+                table, DOCUMENT.format(GENRES.format(table, aggregate(dialect), ' '))))
+        elif dialect == 'sqlite':
+            op.execute('DELETE FROM {}_fts'.format(table))
+            op.execute('INSERT INTO {0}_fts (rowid, name, city, state, genres) '
+                       'SELECT id, name, city, state, {1} FROM {0}'
+                       .format(table, GENRES.format(table, aggregate(dialect), ' ')))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in ('artist', 'venue'):
+        op.add_column(table, sa.Column('genres', sa.String(length=120), nullable=True))
+        op.execute("UPDATE {0} SET genres = coalesce({1}, '')".format(
+            table, GENRES.format(table, aggregate(dialect), ';')))
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('genres', existing_type=sa.String(length=120), nullable=False)
+        op.drop_index('ix_{0}_genre_genre_id_{0}_id'.format(table), table_name='{}_genre'.format(table))
+        op.drop_table('{}_genre'.format(table))
+    op.drop_table('genre')
@@ -0,0 +1,48 @@
+"""venue latitude, longitude and geohash for the nearby pages
+
+Revision ID: 5b7e2c9d41a3
+Revises: 0e86248f23f5
+Create Date: 2026-10-18 18:02:13.540871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import geo
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e2c9d41a3'
+down_revision = '0e86248f23f5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    # geohash prefixes are compared bytewise, whatever the database collation
+    geohash = sa.String(length=12, collation='C') if connection.dialect.name == 'postgresql' else sa.String(length=12)
+    with op.batch_alter_table('venue') as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('geohash', geohash, nullable=True))
+    op.create_index(op.f('ix_venue_geohash'), 'venue', ['geohash'], unique=False)
+
+    # place the existing venues at their city centroid, one update per city
+    positions = []
+    for city, state in connection.execute(sa.text('SELECT DISTINCT city, state FROM venue')):
+        centroid = geo.centroids.locate(city, state)
+        if centroid:
+            positions.append({'city': city, 'state': state, 'latitude': centroid[0],
+                              'longitude': centroid[1], 'geohash': geo.encode(*centroid)})
+    if positions:
+        connection.execute(sa.text('UPDATE venue SET latitude = :latitude, longitude = :longitude, '
+                                   'geohash = :geohash WHERE city = :city AND state = :state'), positions)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_venue_geohash'), table_name='venue')
+    with op.batch_alter_table('venue') as batch_op:
+        batch_op.drop_column('geohash')
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
@@ -0,0 +1,63 @@
+"""show end time, and no overlapping shows per venue or artist
+
+Revision ID: 8d3f6a2b7c1e
+Revises: 5b7e2c9d41a3
+Create Date: 2026-10-18 19:12:40.318552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d3f6a2b7c1e'
+down_revision = '5b7e2c9d41a3'
+branch_labels = None
+depends_on = None
+
+# SHOW_DEFAULT_MINUTES when this revision was written
+DEFAULT_MINUTES = 120
+NEXT_START = "(SELECT min(other.start_time) FROM show AS other " \
+             "WHERE other.{0}_id = show.{0}_id AND other.start_time > show.start_time)"
+SAME_START = "SELECT show.id FROM show JOIN show AS other ON other.{0}_id = show.{0}_id " \
+             "AND other.start_time = show.start_time AND other.id < show.id"
+
+
+def upgrade():
+    connection = op.get_bind()
+    dialect = connection.dialect.name
+    # shows starting together at one venue or with one artist cannot be given
+    # an end time that keeps them apart
+    same = [id for key in ('venue', 'artist')
+            for id, in connection.execute(sa.text(SAME_START.format(key) + ' LIMIT 10'))]
+    if same:
+        raise RuntimeError('move or delete the shows starting at the same time as another show of their '
+                           'venue or artist before upgrading, e.g. show {}'.format(', '.join(map(str, sorted(set(same))))))
+
+    op.add_column('show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    # the default length, cut short where the venue or the artist has a next show
+    if dialect == 'postgresql':
+        op.execute("UPDATE show SET end_time = LEAST(start_time + interval '{} minutes', {}, {})".format(
+            DEFAULT_MINUTES, NEXT_START.format('venue'), NEXT_START.format('artist')))
+    else:
+        # SQLite keeps DateTime as text, keep the microseconds of start_time
+        default = "datetime(start_time, '+{} minutes') || substr(start_time, 20)".format(DEFAULT_MINUTES)
+        op.execute('UPDATE show SET end_time = min({0}, coalesce({1}, {0}), coalesce({2}, {0}))'.format(
+            default, NEXT_START.format('venue'), NEXT_START.format('artist')))
+    with op.batch_alter_table('show') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_check_constraint('ck_show_end_time', 'end_time > start_time')
+
+    if dialect == 'postgresql':
+        for key in ('venue', 'artist'):
+            op.execute("ALTER TABLE show ADD CONSTRAINT ex_show_{0}_overlap EXCLUDE USING gist "
+                       "(int4range({0}_id, {0}_id, '[]') WITH &&, tsrange(start_time, end_time) WITH &&)".format(key))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for key in ('artist', 'venue'):
+            op.drop_constraint('ex_show_{}_overlap'.format(key), 'show')
+    with op.batch_alter_table('show') as batch_op:
+        batch_op.drop_constraint('ck_show_end_time', type_='check')
+        batch_op.drop_column('end_time')
@@ -0,0 +1,35 @@
+"""add updated_at to venue, artist and show
+
+Revision ID: ac7c6539a883
+Revises: 090750438541
+Create Date: 2026-10-18 11:35:02.664810
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ac7c6539a883'
+down_revision = '090750438541'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venue', 'artist', 'show'):
+        # SQLite cannot add a column with a non-constant default, so add it
+        # nullable, backfill it and then set the default and NOT NULL
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute('UPDATE {} SET updated_at = CURRENT_TIMESTAMP'.format(table))
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False,
+                                  server_default=sa.text('CURRENT_TIMESTAMP'))
+        op.create_index(op.f('ix_{}_updated_at'.format(table)), table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('show', 'artist', 'venue'):
+        op.drop_index(op.f('ix_{}_updated_at'.format(table)), table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
@@ -0,0 +1,58 @@
+"""venue_area_summary, the /venues directory
+
+Revision ID: c4e1a7f3d925
+Revises: 8d3f6a2b7c1e
+Create Date: 2026-10-18 21:40:05.127384
+
+"""
+from datetime import datetime
+from itertools import groupby
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e1a7f3d925'
+down_revision = '8d3f6a2b7c1e'
+branch_labels = None
+depends_on = None
+
+# VENUE_AREA_TOP when this revision was written, "flask refresh-rollups" applies the current one
+TOP = 5
+
+
+def upgrade():
+    summary = op.create_table('venue_area_summary',
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('venue_count', sa.Integer(), nullable=False),
+    sa.Column('upcoming_shows_count', sa.Integer(), nullable=False),
+    sa.Column('top_venues', sa.JSON(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    sa.PrimaryKeyConstraint('state', 'city')
+    )
+
+    venue = sa.table('venue', sa.column('id'), sa.column('name'), sa.column('city'),
+                     sa.column('state'), sa.column('upcoming_shows_count'))
+    rows = op.get_bind().execute(
+        sa.select(venue).order_by(venue.c.state, venue.c.city, venue.c.upcoming_shows_count.desc(),
+                                  venue.c.name, venue.c.id))
+    now = datetime.utcnow()
+    summaries = []
+    for (state, city), venues in groupby(rows, key=lambda row: (row.state, row.city)):
+        venues = list(venues)
+        summaries.append({
+            'state': state,
+            'city': city,
+            'venue_count': len(venues),
+            'upcoming_shows_count': sum(row.upcoming_shows_count for row in venues),
+            'top_venues': [{'id': row.id, 'name': row.name, 'num_upcoming_shows': row.upcoming_shows_count}
+                           for row in venues[:TOP]],
+            'updated_at': now,
+        })
+    if summaries:
+        op.bulk_insert(summary, summaries)
+
+
+def downgrade():
+    op.drop_table('venue_area_summary')
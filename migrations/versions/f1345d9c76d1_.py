@@ -0,0 +1,43 @@
+"""add full-text search documents to venue and artist
+
+Revision ID: f1345d9c76d1
+Revises: ad6861f66f0b
+Create Date: 2026-10-18 10:02:17.530196
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1345d9c76d1'
+down_revision = 'ad6861f66f0b'
+branch_labels = None
+depends_on = None
+
+DOCUMENT = "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || " \
+           "setweight(to_tsvector('simple', coalesce(city, '') || ' ' || coalesce(state, '')), 'B') || " \
+           "setweight(to_tsvector('simple', coalesce(genres, '')), 'C')"
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('search_vector', sa.Text().with_variant(postgresql.TSVECTOR(), 'postgresql'), nullable=True))
+        op.create_index('ix_{}_search_vector'.format(table), table, ['search_vector'], unique=False, postgresql_using='gin')
+        if dialect == 'postgresql':
+            op.execute('UPDATE {} SET search_vector = {}'.format(table, DOCUMENT))
+        elif dialect == 'sqlite':
+            op.execute('CREATE VIRTUAL TABLE {}_fts USING fts5(name, city, state, genres)'.format(table))
+            op.execute('INSERT INTO {0}_fts (rowid, name, city, state, genres) '
+                       'SELECT id, name, city, state, genres FROM {0}'.format(table))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in ('artist', 'venue'):
+        if dialect == 'sqlite':
+            op.execute('DROP TABLE {}_fts'.format(table))
+        op.drop_index('ix_{}_search_vector'.format(table), table_name=table)
+        op.drop_column(table, 'search_vector')
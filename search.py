@@ -0,0 +1,186 @@
+#----------------------------------------------------------------------------#
+# Full-text search for venues and artists.
+#
+# PostgreSQL keeps a weighted tsvector per row in a GIN indexed
+# `search_vector` column (name > city/state > genres, the genre names coming
+# from the `<table>_genre` association table) and falls back on pg_trgm
+# similarity of the name for misspelled terms.
+# SQLite keeps one FTS5 table per searchable table (`venue_fts`,
+# `artist_fts`) ranked with bm25, for local development and tests.
+#
+# Documents are (re)indexed by the application in the same transaction as
+# the rows they describe, see `Search.index` and `Search.remove`.
+#----------------------------------------------------------------------------#
+
+import re
+from sqlalchemy import text, bindparam
+
+# genre names of each row of {0}, space separated; {1} is the aggregate function
+GENRES = '(SELECT {1}(genre.name, \' \') FROM {0}_genre JOIN genre ON genre.id = {0}_genre.genre_id ' \
+         'WHERE {0}_genre.{0}_id = {0}.id)'
+
+
+def tokenize(term):
+  """
+    split a search term into lower case word tokens
+    Parameters:
+        term (String) : raw search term
+    Returns:
+        tokens (List) : word tokens, empty when the term has no words
+  """
+  return re.findall(r'\w+', (term or '').lower())
+
+
+class PostgresSearchBackend(object):
+  """
+    tsvector search, the document is computed from the row's columns and genres
+  """
+  document = "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || " \
+             "setweight(to_tsvector('simple', coalesce(city, '') || ' ' || coalesce(state, '')), 'B') || " \
+             "setweight(to_tsvector('simple', coalesce(" + GENRES + ", '')), 'C')"
+
+  def index(self, session, table, ids):
+    session.execute(
+      text('UPDATE {0} SET search_vector = {1} WHERE id IN :ids'.format(table, self.document.format(table, 'string_agg')))
+        .bindparams(bindparam('ids', expanding=True)),
+      {'ids': list(ids)})
+
+  def remove(self, session, table, ids):
+    # the document lives on the row itself and goes away with it
+    pass
+
+  def reindex(self, session, table):
+    session.execute(text('UPDATE {0} SET search_vector = {1}'.format(table, self.document.format(table, 'string_agg'))))
+
+  def search(self, session, table, tokens, term, limit):
+    query = ' & '.join(token + ':*' for token in tokens)
+    rows = session.execute(text(
+      "SELECT id FROM {0}, to_tsquery('simple', :query) AS query "
+      "WHERE search_vector @@ query OR name % :term "
+      "ORDER BY ts_rank(search_vector, query) + similarity(name, :term) DESC, id "
+      "LIMIT :limit".format(table)),
+      {'query': query, 'term': term, 'limit': limit})
+    return [row[0] for row in rows]
+
+
+class SQLiteSearchBackend(object):
+  """
+    FTS5 search, one `<table>_fts` table per searchable table keyed by rowid
+  """
+  columns = ('name', 'city', 'state', 'genres')
+  # bm25 column weights, in the order of `columns`
+  weights = (10.0, 4.0, 4.0, 2.0)
+
+  def _sources(self, table):
+    # what fills `columns`, the genres come from the association table
+    return 'name, city, state, ' + GENRES.format(table, 'group_concat')
+
+  def __init__(self):
+    self._installed = set()
+
+  def _install(self, session, table):
+    # returns True when the table was just created and filled
+    key = (str(session.connection().engine.url), table)
+    if key in self._installed:
+      return False
+    exists = session.execute(text(
+      "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+      {'name': table + '_fts'}).first()
+    if not exists:
+      session.execute(text('CREATE VIRTUAL TABLE {0}_fts USING fts5({1})'
+                           .format(table, ', '.join(self.columns))))
+      self._fill(session, table)
+    self._installed.add(key)
+    return not exists
+
+  def index(self, session, table, ids):
+    self._install(session, table)
+    session.execute(
+      text('INSERT OR REPLACE INTO {0}_fts (rowid, {1}) SELECT id, {2} FROM {0} WHERE id IN :ids'
+           .format(table, ', '.join(self.columns), self._sources(table)))
+        .bindparams(bindparam('ids', expanding=True)),
+      {'ids': list(ids)})
+
+  def remove(self, session, table, ids):
+    self._install(session, table)
+    session.execute(
+      text('DELETE FROM {0}_fts WHERE rowid IN :ids'.format(table))
+        .bindparams(bindparam('ids', expanding=True)),
+      {'ids': list(ids)})
+
+  def reindex(self, session, table):
+    if not self._install(session, table):
+      self._fill(session, table)
+
+  def _fill(self, session, table):
+    session.execute(text('DELETE FROM {0}_fts'.format(table)))
+    session.execute(text('INSERT INTO {0}_fts (rowid, {1}) SELECT id, {2} FROM {0}'
+                         .format(table, ', '.join(self.columns), self._sources(table))))
+
+  def search(self, session, table, tokens, term, limit):
+    self._install(session, table)
+    query = ' '.join('"{}"*'.format(token) for token in tokens)
+    rows = session.execute(text(
+      'SELECT rowid FROM {0}_fts WHERE {0}_fts MATCH :query '
+      'ORDER BY bm25({0}_fts, {1}), rowid LIMIT :limit'
+        .format(table, ', '.join(str(weight) for weight in self.weights))),
+      {'query': query, 'limit': limit})
+    return [row[0] for row in rows]
+
+
+class Search(object):
+  """
+    search entry point, picks the backend from the dialect of the session bind
+  """
+  backends = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+  }
+
+  def __init__(self, db):
+    self.db = db
+    self._backends = {}
+
+  def backend(self, session):
+    dialect = session.connection().dialect.name
+    if dialect not in self._backends:
+      if dialect not in self.backends:
+        raise NotImplementedError('full-text search is not available on ' + dialect)
+      self._backends[dialect] = self.backends[dialect]()
+    return self._backends[dialect]
+
+  def search(self, table, term, limit):
+    """
+      search a table for a term
+      Parameters:
+          table (String) : 'venue' or 'artist'
+          term (String) : search term
+          limit (Integer) : maximum number of ids to return
+      Returns:
+          ids (List) : matching row ids, best match first
+    """
+    tokens = tokenize(term)
+    if not tokens:
+      return []
+    session = self.db.session
+    return self.backend(session).search(session, table, tokens, term.strip(), limit)
+
+  def index(self, session, table, ids):
+    """
+      (re)build the search documents of rows that were inserted or updated
+    """
+    if ids:
+      self.backend(session).index(session, table, ids)
+
+  def remove(self, session, table, ids):
+    """
+      drop the search documents of deleted rows
+    """
+    if ids:
+      self.backend(session).remove(session, table, ids)
+
+  def reindex(self, session, table):
+    """
+      rebuild every search document of a table, e.g. after a bulk load
+    """
+    self.backend(session).reindex(session, table)
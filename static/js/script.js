@@ -2,3 +2,41 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Search-as-you-type: fill the search box datalist from /api/search/suggest
+document.querySelectorAll('input[data-suggest]').forEach(function (input) {
+  var list = document.getElementById(input.getAttribute('list'));
+  var kind = input.getAttribute('data-suggest');
+  var pending = null;
+  input.addEventListener('input', function () {
+    var q = input.value.trim();
+    if (pending) { pending.abort(); }
+    if (!q) { list.innerHTML = ''; return; }
+    pending = new AbortController();
+    fetch('/api/search/suggest?q=' + encodeURIComponent(q), { signal: pending.signal })
+      .then(function (response) { return response.json(); })
+      .then(function (data) {
+        list.innerHTML = '';
+        data[kind].forEach(function (item) {
+          var option = document.createElement('option');
+          option.value = item.name;
+          list.appendChild(option);
+        });
+      })
+      .catch(function () {});
+  });
+});
+
+// "Near me" links: add the visitor's position to the nearby pages
+document.querySelectorAll('a[data-near-me]').forEach(function (link) {
+  link.addEventListener('click', function (event) {
+    if (!navigator.geolocation) { return; }
+    event.preventDefault();
+    navigator.geolocation.getCurrentPosition(function (position) {
+      window.location = link.getAttribute('href') + '?lat=' + position.coords.latitude.toFixed(5) +
+        '&lng=' + position.coords.longitude.toFixed(5);
+    }, function () {
+      link.textContent = 'Your location is not available';
+    });
+  });
+});
@@ -0,0 +1,162 @@
+#----------------------------------------------------------------------------#
+# In-process prefix index for search-as-you-type suggestions.
+#
+# Every word start of every name is kept in a sorted array per kind, so a
+# prefix lookup is a binary search per kind followed by a scan of at most
+# limit names. Recent lookups are kept in an LRU that is evicted precisely
+# when a matching name changes.
+#----------------------------------------------------------------------------#
+
+import bisect
+import threading
+import time
+from collections import OrderedDict
+
+
+class PrefixIndex(object):
+  """
+    sorted arrays of (key, id, name) tuples, one per word start of a name, by kind
+    Parameters:
+        cache_size (Integer) : number of recent prefixes kept in the LRU
+        max_age (Integer) : seconds after which the index asks to be rebuilt,
+                            which picks up writes made by other processes
+  """
+
+  def __init__(self, cache_size=1024, max_age=300):
+    self.cache_size = cache_size
+    self.max_age = max_age
+    self._entries = {}
+    self._names = {}
+    self._cache = OrderedDict()
+    self._built_at = None
+    self._built = False
+    self._lock = threading.Lock()
+    # held by the one caller rebuilding a stale index
+    self._rebuild_lock = threading.Lock()
+
+  @staticmethod
+  def _keys(name):
+    words = (name or '').lower().split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+  @property
+  def stale(self):
+    return self._built_at is None or time.time() - self._built_at > self.max_age
+
+  def build(self, rows):
+    """
+      replace the whole index
+      Parameters:
+          rows (Iterable) : (kind, id, name) tuples
+    """
+    entries = {}
+    names = {}
+    for kind, id, name in rows:
+      names[(kind, id)] = name
+      entries.setdefault(kind, []).extend((key, id, name) for key in self._keys(name))
+    for kind_entries in entries.values():
+      kind_entries.sort()
+    with self._lock:
+      self._entries = entries
+      self._names = names
+      self._cache.clear()
+      self._built_at = time.time()
+      self._built = True
+
+  def refresh(self, load):
+    """
+      rebuild a stale index from load(); while one caller rebuilds, the others
+      keep answering from the current index, or wait for the first one
+      Parameters:
+          load (Callable) : returns the (kind, id, name) rows
+    """
+    if not self.stale:
+      return
+    if not self._rebuild_lock.acquire(blocking=not self._built):
+      return
+    try:
+      # another caller may have rebuilt it while this one waited
+      if self.stale:
+        self.build(load())
+    finally:
+      self._rebuild_lock.release()
+
+  def _evict(self, name):
+    # a cached prefix can only hold this name if it is a prefix of one of its keys
+    prefixes = set(key[:end] for key in self._keys(name) for end in range(len(key) + 1))
+    for cached in [cached for cached in self._cache if cached[0] in prefixes]:
+      del self._cache[cached]
+
+  def _remove(self, kind, id):
+    name = self._names.pop((kind, id), None)
+    if name is None:
+      return
+    entries = self._entries.get(kind, [])
+    for key in self._keys(name):
+      position = bisect.bisect_left(entries, (key, id))
+      if position < len(entries) and entries[position][:2] == (key, id):
+        del entries[position]
+    self._evict(name)
+
+  def expire(self):
+    """
+      ask for a rebuild on next use, e.g. after rows were written in bulk
+    """
+    self._built_at = None
+
+  def update(self, kind, id, name):
+    """
+      add a row to the index or replace its name
+    """
+    with self._lock:
+      self._remove(kind, id)
+      self._names[(kind, id)] = name
+      entries = self._entries.setdefault(kind, [])
+      for key in self._keys(name):
+        bisect.insort(entries, (key, id, name))
+      self._evict(name)
+
+  def remove(self, kind, id):
+    """
+      drop a row from the index
+    """
+    with self._lock:
+      self._remove(kind, id)
+
+  def lookup(self, prefix, limit):
+    """
+      find the names starting with a prefix
+      Parameters:
+          prefix (String) : typed text, matched against the start of any word
+          limit (Integer) : maximum number of suggestions per kind
+      Returns:
+          suggestions (Dict) : kind -> list of {"id", "name"}, in the alphabetical
+                               order of the names from their matching word on
+    """
+    prefix = ' '.join(prefix.lower().split())
+    with self._lock:
+      cached = self._cache.get((prefix, limit))
+      if cached is not None:
+        self._cache.move_to_end((prefix, limit))
+        return cached
+
+      suggestions = {}
+      for kind, entries in self._entries.items():
+        # each kind stops at its limit, whatever the others hold
+        matches, seen = [], set()
+        position = bisect.bisect_left(entries, (prefix,))
+        while position < len(entries) and len(matches) < limit:
+          key, id, name = entries[position]
+          if not key.startswith(prefix):
+            break
+          if id not in seen:
+            seen.add(id)
+            matches.append({"id": id, "name": name})
+          position += 1
+        if matches:
+          suggestions[kind] = matches
+
+      self._cache[(prefix, limit)] = suggestions
+      if len(self._cache) > self.cache_size:
+        self._cache.popitem(last=False)
+      return suggestions